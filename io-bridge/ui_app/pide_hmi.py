@@ -1,3 +1,4 @@
+import os
 import sys
 import time
 import threading
@@ -16,7 +17,8 @@ import pyqtgraph as pg
 
 # ================== CONFIG ==================
 
-PORT = "COM8"
+# Override with e.g. the pty printed by `python -m usb_emulator`
+PORT = os.environ.get("PIDE_HMI_PORT", "COM8")
 BAUD = 500000
 
 MAGIC = 0xDEADBEEF
@@ -110,8 +112,12 @@ class UsbWorker(threading.Thread):
                            timeout=0.05,
                            dsrdtr=False,
                            rtscts=False) as ser:
-            ser.setDTR(False)
-            ser.setRTS(False)
+            try:
+                ser.setDTR(False)
+                ser.setRTS(False)
+            except OSError:
+                # pty (usb_emulator) has no modem lines
+                pass
             ser.reset_input_buffer()
             ser.reset_output_buffer()
 
@@ -180,7 +186,8 @@ class UsbWorker(threading.Thread):
                         if self.in_flight and seq == self.in_flight["seq"]:
                             self.in_flight = None
 
-                    if cmd == TC_CMD["READ_STATUS"] and len(payload) == TC_STATUS_SIZE:
+                    # READ_STATUS and (current firmware) every SET reply
+                    if len(payload) == TC_STATUS_SIZE:
                         self.tc_status = struct.unpack(TC_STATUS_FMT, payload)
 
                 time.sleep(0.01)
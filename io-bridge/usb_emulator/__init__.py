@@ -0,0 +1,15 @@
+# usb_emulator/__init__.py
+"""
+Pure-Python stand-in for the usb_rgb_assembly ESP32 firmware.
+
+    from usb_emulator import EmulatedDevice, PtyLink
+
+    with PtyLink(EmulatedDevice(), latency_s=0.002) as link:
+        usb = UsbComm(link.port, 500000)
+        ...
+"""
+
+from usb_emulator.device import EmulatedDevice
+from usb_emulator.pty_link import PtyLink
+
+__all__ = ["EmulatedDevice", "PtyLink"]
@@ -0,0 +1,63 @@
+# usb_emulator/__main__.py
+"""
+Run an emulated I/O node on a pty until Ctrl-C.
+
+    cd io-bridge
+    python -m usb_emulator --objects 2 --latency-ms 2 --loss 0.001
+"""
+
+import argparse
+import logging
+import time
+
+from usb_emulator import EmulatedDevice, PtyLink
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Emulated RaspiPLC USB I/O node")
+    ap.add_argument("--objects", type=int, default=1, help="number of TempCtrl objects")
+    ap.add_argument("--first-id", type=int, default=1, help="object id of the first TempCtrl")
+    ap.add_argument("--time-scale", type=float, default=1.0, help="process/PID clock speed-up")
+    ap.add_argument("--status-pad", type=int, default=0, help="extra bytes on READ_STATUS replies")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--loss", type=float, default=0.0, help="per-byte drop probability")
+    ap.add_argument("--corrupt", type=float, default=0.0, help="per-byte bit-flip probability")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--legacy", action="store_true", help="behave like firmware without CRC framing")
+    args = ap.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+
+    device = EmulatedDevice(
+        args.objects,
+        args.first_id,
+        args.time_scale,
+        args.status_pad,
+        crc_support=not args.legacy,
+    )
+    link = PtyLink(
+        device,
+        latency_s=args.latency_ms / 1000.0,
+        jitter_s=args.jitter_ms / 1000.0,
+        loss=args.loss,
+        corrupt=args.corrupt,
+        seed=args.seed,
+    )
+
+    with link:
+        print(f"Emulated device on {link.port}", flush=True)
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+
+    print(device.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# usb_emulator/device.py
+"""
+Emulated ESP32 I/O node: UsbComm dispatch + control loop, as in
+usb_rgb_assembly.ino, with TempCtrl instances on a thermal process.
+"""
+
+import time
+
+from usb_emulator.protocol import (
+    OBJ_SYS,
+    SYS_CMD_HELLO,
+    SYS_CMD_READ_STATS,
+    FrameReader,
+    Stats,
+    build_frame,
+)
+from usb_emulator.objects import (
+    TempCtrl,
+    ThermalProcess,
+    TC_CMD_READ_STATUS,
+    TC_PGM_AUTO,
+)
+
+UPDATE_TM_MS = 50  # control loop period (same as the sketch)
+
+
+class EmulatedDevice:
+    """
+    Handler table of num_objects TempCtrl objects at consecutive
+    object ids starting at first_object_id (tic1 is object 1).
+
+    time_scale > 1 runs the thermal process and PID clock faster than
+    wall time, so warm-up behaviour can be exercised in seconds.
+
+    status_pad appends that many zero bytes to every READ_STATUS reply
+    (capped by the TX buffer, as on the firmware), to benchmark larger
+    payloads.
+
+    crc_support=False behaves like firmware from before CRC framing:
+    no link HELLO, flags echoed verbatim, trailers treated as payload.
+    """
+
+    def __init__(
+        self,
+        num_objects=1,
+        first_object_id=1,
+        time_scale=1.0,
+        status_pad=0,
+        crc_support=True,
+    ):
+        self.stats = Stats()
+        self.crc_support = crc_support
+        self.reader = FrameReader(self.stats, crc_support)
+        self.time_scale = time_scale
+        self.status_pad = bytes(status_pad)
+
+        self.objects: dict[int, TempCtrl] = {}
+        self.processes: dict[int, ThermalProcess] = {}
+
+        for obj_id in range(first_object_id, first_object_id + num_objects):
+            tic = TempCtrl()
+            # setup() in the sketch
+            tic.Mode = TC_PGM_AUTO
+            tic.Sp = 200.0
+            self.objects[obj_id] = tic
+            self.processes[obj_id] = ThermalProcess()
+
+        self._task_counter = 0
+        self._last_tick = time.monotonic()
+
+    # ------------------------------------------------------------
+    # USB side
+    # ------------------------------------------------------------
+
+    def receive(self, data: bytes) -> list[bytes]:
+        """
+        Feed raw bytes from the host; return response frames to send back.
+        """
+        self.reader.feed(data)
+        responses = []
+
+        while True:
+            cmd = self.reader.next_frame()
+            if cmd is None:
+                break
+
+            handler = self.objects.get(cmd.object_id)
+            out = b""
+            if self.crc_support and cmd.object_id == OBJ_SYS and cmd.cmd_id == SYS_CMD_HELLO:
+                # Handled by usb_comm itself; the reply flags carry the ACK
+                pass
+            elif self.crc_support and cmd.object_id == OBJ_SYS and cmd.cmd_id == SYS_CMD_READ_STATS:
+                out = self.stats.pack(self.millis())
+            elif handler is None:
+                self.stats.frames_no_handler += 1
+            else:
+                result = handler.handle_cmd(cmd.cmd_id, cmd.payload)
+                if result is None:
+                    self.stats.frames_handler_false += 1
+                else:
+                    out = result
+                    if cmd.cmd_id == TC_CMD_READ_STATUS:
+                        out += self.status_pad
+
+            responses.append(
+                build_frame(cmd.seq, cmd.object_id, cmd.cmd_id, cmd.flags, out, self.crc_support)
+            )
+            self.stats.frames_ok += 1
+
+        return responses
+
+    # ------------------------------------------------------------
+    # Control loop
+    # ------------------------------------------------------------
+
+    def millis(self) -> int:
+        return int(time.monotonic() * 1000.0 * self.time_scale) & 0xFFFFFFFF or 1
+
+    def tick(self):
+        """
+        Run every control-loop period that has elapsed since the last call.
+        """
+        now = time.monotonic()
+        period = UPDATE_TM_MS / 1000.0
+        while now - self._last_tick >= period:
+            self._last_tick += period
+            self._control_step(period * self.time_scale)
+
+    def _control_step(self, dt_s: float):
+        for obj_id, tic in self.objects.items():
+            proc = self.processes[obj_id]
+            proc.step(tic.pid.Cv, dt_s)
+            # Thermocouple read + TempCtrl update every 10th tick
+            if self._task_counter == 0:
+                tic.update(proc.read_f(), self.millis())
+
+        self._task_counter = (self._task_counter + 1) % 10
@@ -0,0 +1,286 @@
+# usb_emulator/objects.py
+"""
+Python ports of the firmware objects in usb_rgb_assembly/:
+PIDE (pide.cpp), TempCtrl (temp_ctrl.cpp), plus a simple thermal
+process standing in for the heater + MAX6675 thermocouple.
+
+Command ids, status layouts and control behaviour follow the C++ code;
+keep them in step when the firmware changes.
+"""
+
+import struct
+
+# ---------------- PIDE ----------------
+
+PID_OFF = 0
+PID_MAN = 1
+PID_AUTO = 2
+
+PID_CMD_READ_STATUS = 0x01
+PID_CMD_SET_SP = 0x10
+PID_CMD_SET_CV = 0x11
+PID_CMD_SET_KP = 0x12
+PID_CMD_SET_KI = 0x13
+PID_CMD_SET_KD = 0x14
+PID_CMD_SET_PVMIN = 0x15
+PID_CMD_SET_PVMAX = 0x16
+PID_CMD_SET_MODE = 0x17
+
+# pide_stat_t: 9 floats, u8 Mode, 3 pad
+PIDE_STAT = struct.Struct("<9f B 3x")
+
+# ---------------- TempCtrl ----------------
+
+TC_OFF = 0
+TC_OPER_MANUAL = 1
+TC_OPER_AUTO = 2
+TC_PGM_AUTO = 3
+
+TC_CTRL_OFF = 0
+TC_CTRL_BOOST = 1
+TC_CTRL_FEEDFWD = 2
+TC_CTRL_CLOSED_LOOP = 3
+
+TC_CMD_READ_STATUS = 0x01
+TC_CMD_SET_MODE = 0x20
+TC_CMD_SET_SP = 0x21
+TC_CMD_SET_CTRL = 0x22
+
+# tempctrl_stat_t: u8 Mode, u8 CtrlMode, 2 pad, float Sp, pide_stat_t
+TEMPCTRL_HEAD = struct.Struct("<B B 2x f")
+
+_F32 = struct.Struct("<f")
+
+_PID_FLOAT_CMDS = {
+    PID_CMD_SET_SP: "Sp",
+    PID_CMD_SET_CV: "Cv",
+    PID_CMD_SET_KP: "Kp",
+    PID_CMD_SET_KI: "Ki",
+    PID_CMD_SET_KD: "Kd",
+    PID_CMD_SET_PVMIN: "PvMin",
+    PID_CMD_SET_PVMAX: "PvMax",
+}
+
+
+def _f32(v: float) -> float:
+    """Round-trip through float32 like the firmware's storage."""
+    return _F32.unpack(_F32.pack(v))[0]
+
+
+def _clamp(v, lo, hi):
+    if v < lo:
+        return lo
+    if v > hi:
+        return hi
+    return v
+
+
+class PIDE:
+    def __init__(self):
+        self.Sp = 0.0
+        self.Pv = 0.0
+        self.Cv = 0.0
+        self.Kp = 10.0
+        self.Ki = 0.05
+        self.Kd = 0.0
+        self.PvMin = 0.0
+        self.PvMax = 500.0
+        self.Err = 0.0
+        self.Mode = PID_OFF
+
+        self._err_1 = 0.0
+        self._err_2 = 0.0
+        self._last_ms = 0
+
+    def status(self) -> bytes:
+        return PIDE_STAT.pack(
+            self.Sp, self.Pv, self.Cv, self.Kp, self.Ki, self.Kd,
+            self.PvMin, self.PvMax, self.Err, self.Mode & 0xFF,
+        )
+
+    def handle_cmd(self, cmd_id: int, payload: bytes) -> bytes | None:
+        """Return the response payload, or None for PID_CMD_ERROR."""
+        if cmd_id == PID_CMD_READ_STATUS:
+            return self.status()
+
+        attr = _PID_FLOAT_CMDS.get(cmd_id)
+        if attr is not None:
+            if len(payload) != 4:
+                return None
+            setattr(self, attr, _F32.unpack(payload)[0])
+            return b""
+
+        if cmd_id == PID_CMD_SET_MODE:
+            if len(payload) != 1:
+                return None
+            self.Mode = payload[0]
+            return b""
+
+        return None
+
+    def update(self, pv: float, now_ms: int) -> float:
+        self.Pv = pv
+
+        if self.Mode == PID_OFF:
+            self.Cv = 0.0
+            self.Sp = self.Pv
+            return self.Cv
+
+        if self.Mode == PID_MAN:
+            self.Sp = self.Pv
+            return self.Cv
+
+        if self._last_ms == 0:
+            self._last_ms = now_ms
+            return self.Cv
+
+        dt = (now_ms - self._last_ms) * 0.001
+        self._last_ms = now_ms
+        if dt <= 0.0:
+            return self.Cv
+
+        pv_s = self._scale_pv(self.Pv)
+        sp_s = self._scale_pv(self.Sp)
+
+        self.Err = sp_s - pv_s
+
+        d_cv = (
+            self.Kp * (self.Err - self._err_1)
+            + self.Ki * dt * self.Err
+            + self.Kd / dt * (self.Err - 2.0 * self._err_1 + self._err_2)
+        )
+
+        self.Cv = _f32(_clamp(self.Cv + d_cv, 0.0, 100.0))
+
+        self._err_2 = self._err_1
+        self._err_1 = self.Err
+
+        return self.Cv
+
+    def _scale_pv(self, pv: float) -> float:
+        if self.PvMax <= self.PvMin:
+            return pv
+        s = (pv - self.PvMin) * 100.0 / (self.PvMax - self.PvMin)
+        return _clamp(s, 0.0, 100.0)
+
+
+class TempCtrl:
+    def __init__(self):
+        self.pid = PIDE()
+        self.Sp = 350.0
+        self.Mode = TC_OFF
+        self.CtrlMode = TC_CTRL_OFF
+
+        self.Deadband = 150.0
+        self.BoostErrThresh = 160.0
+        self.BoostCv = 100.0
+        self.FeedFwdCv = 10.0
+
+    def status(self) -> bytes:
+        return TEMPCTRL_HEAD.pack(self.Mode, self.CtrlMode, self.Sp) + self.pid.status()
+
+    def handle_cmd(self, cmd_id: int, payload: bytes) -> bytes | None:
+        """
+        SET commands (including forwarded PIDE ones) reply with the
+        full status after the write, as temp_ctrl.cpp does.
+        """
+        if cmd_id == TC_CMD_READ_STATUS:
+            return self.status()
+
+        if cmd_id == TC_CMD_SET_MODE:
+            if len(payload) != 1:
+                return None
+            self.Mode = payload[0]
+            return self.status()
+
+        if cmd_id == TC_CMD_SET_SP:
+            if len(payload) != 4:
+                return None
+            self.Sp = _F32.unpack(payload)[0]
+            return self.status()
+
+        if cmd_id == TC_CMD_SET_CTRL:
+            if len(payload) != 1:
+                return None
+            self.CtrlMode = payload[0]
+            return self.status()
+
+        if self.pid.handle_cmd(cmd_id, payload) is None:
+            return None
+        return self.status()
+
+    def update(self, pv: float, now_ms: int) -> float:
+        pid = self.pid
+        err = self.Sp - pv
+
+        if self.Mode == TC_OFF:
+            self.CtrlMode = TC_CTRL_OFF
+            pid.Mode = PID_OFF
+            pid.Cv = 0.0
+            pid.Sp = pv
+        elif self.Mode == TC_OPER_MANUAL:
+            self.CtrlMode = TC_CTRL_OFF
+            pid.Mode = PID_MAN
+            pid.Sp = pv
+        elif self.Mode == TC_OPER_AUTO:
+            self.CtrlMode = TC_CTRL_CLOSED_LOOP
+            pid.Mode = PID_AUTO
+            pid.Sp = self.Sp
+        elif self.Mode == TC_PGM_AUTO:
+            self._update_ctrl_mode(err)
+            if self.CtrlMode == TC_CTRL_OFF:
+                pid.Mode = PID_OFF
+                pid.Cv = 0.0
+                pid.Sp = pv
+            elif self.CtrlMode == TC_CTRL_BOOST:
+                pid.Mode = PID_MAN
+                pid.Cv = self.BoostCv
+                pid.Sp = pv
+            elif self.CtrlMode == TC_CTRL_FEEDFWD:
+                pid.Mode = PID_MAN
+                pid.Cv = self.FeedFwdCv
+                pid.Sp = pv
+            elif self.CtrlMode == TC_CTRL_CLOSED_LOOP:
+                pid.Mode = PID_AUTO
+                pid.Sp = self.Sp
+        else:
+            return pid.Cv
+
+        return pid.update(pv, now_ms)
+
+    def _update_ctrl_mode(self, err: float):
+        if err <= -self.Deadband:
+            self.CtrlMode = TC_CTRL_OFF
+        elif err >= self.BoostErrThresh:
+            self.CtrlMode = TC_CTRL_BOOST
+        elif abs(err) <= self.Deadband:
+            self.CtrlMode = TC_CTRL_CLOSED_LOOP
+        else:
+            self.CtrlMode = TC_CTRL_FEEDFWD
+
+
+# ---------------- Thermal process ----------------
+
+class ThermalProcess:
+    """
+    First-order smoker model driven by heater CV (0..100 %).
+
+    The chamber settles towards ambient + CV% of heater_rise_f with time
+    constant tau_s. read_f() quantises like the MAX6675 (0.25 degC steps)
+    and returns degF, as tc1.readF() does in the sketch.
+    """
+
+    def __init__(self, ambient_f=70.0, heater_rise_f=450.0, tau_s=600.0):
+        self.ambient_f = ambient_f
+        self.heater_rise_f = heater_rise_f
+        self.tau_s = tau_s
+        self.temp_f = ambient_f
+
+    def step(self, cv: float, dt_s: float):
+        target = self.ambient_f + self.heater_rise_f * _clamp(cv, 0.0, 100.0) / 100.0
+        self.temp_f += (target - self.temp_f) * min(1.0, dt_s / self.tau_s)
+
+    def read_f(self) -> float:
+        temp_c = (self.temp_f - 32.0) * 5.0 / 9.0
+        temp_c = round(temp_c * 4.0) / 4.0
+        return temp_c * 9.0 / 5.0 + 32.0
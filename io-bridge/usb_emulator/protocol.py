@@ -0,0 +1,175 @@
+# usb_emulator/protocol.py
+"""
+Device-side view of the usb_comm framing (see usb_rgb_assembly/usb_comm.h).
+
+Wire format (little-endian):
+  uint32  magic
+  uint16  len        total frame length including header
+  uint8   seq
+  uint8   object_id
+  uint8   cmd_id
+  uint8   flags
+  uint8   payload[]
+  [uint16 crc16 | uint32 crc32]   if flags & FLAG_CRC_MASK
+
+Replies to CRC-flagged requests carry FLAG_CRC_ACK and a trailer of the
+same type. Legacy firmware (crc_support=False) echoes the flags and
+treats any trailer as payload.
+"""
+
+import binascii
+import struct
+import zlib
+from dataclasses import dataclass, fields
+
+MAGIC = 0xDEADBEEF
+MAGIC_BYTES = struct.pack("<I", MAGIC)
+
+HEADER_FMT = "<I H B B B B"
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+
+# Same limits as the firmware
+RX_BUFFER_SIZE = 2048
+TX_BUFFER_SIZE = 512
+
+FLAG_CRC16 = 0x01
+FLAG_CRC32 = 0x02
+FLAG_CRC_MASK = FLAG_CRC16 | FLAG_CRC32
+FLAG_CRC_ACK = 0x80
+
+# Link-level object handled by usb_comm itself
+OBJ_SYS = 0
+SYS_CMD_HELLO = 0x00
+SYS_CMD_READ_STATS = 0x01
+
+
+def trailer_size(flags: int) -> int:
+    if flags & FLAG_CRC32:
+        return 4
+    if flags & FLAG_CRC16:
+        return 2
+    return 0
+
+
+def crc_bytes(flags: int, data) -> bytes:
+    if flags & FLAG_CRC32:
+        return struct.pack("<I", zlib.crc32(data) & 0xFFFFFFFF)
+    if flags & FLAG_CRC16:
+        return struct.pack("<H", binascii.crc_hqx(data, 0xFFFF))
+    return b""
+
+
+@dataclass
+class CmdView:
+    seq: int
+    object_id: int
+    cmd_id: int
+    flags: int
+    payload: bytes
+
+
+@dataclass
+class Stats:
+    """Mirror of UsbComm::Stats in the firmware."""
+    rx_bytes: int = 0
+    frames_ok: int = 0
+    frames_bad_magic: int = 0
+    frames_bad_len: int = 0
+    frames_no_handler: int = 0
+    frames_handler_false: int = 0
+    rx_overflow: int = 0
+    rx_resync_drops: int = 0
+    frames_bad_crc: int = 0
+
+    def pack(self, uptime_ms: int) -> bytes:
+        """SYS_CMD_READ_STATS payload: uptime_ms, then every counter."""
+        values = [uptime_ms] + [getattr(self, f.name) for f in fields(self)]
+        return struct.pack(f"<{len(values)}I", *(v & 0xFFFFFFFF for v in values))
+
+
+class FrameReader:
+    """
+    Stream reassembly with the same resync rules as
+    UsbComm::rx_try_get_one_frame_().
+    """
+
+    def __init__(self, stats: Stats, crc_support: bool = True):
+        self.rx = bytearray()
+        self.stats = stats
+        self.crc_support = crc_support
+
+    def feed(self, data: bytes):
+        self.stats.rx_bytes += len(data)
+        self.rx += data
+        if len(self.rx) > RX_BUFFER_SIZE:
+            # Overflow: firmware drops everything to resync
+            self.stats.rx_overflow += 1
+            self.rx.clear()
+
+    def next_frame(self) -> CmdView | None:
+        while len(self.rx) >= HEADER_SIZE:
+            i = self.rx.find(MAGIC_BYTES)
+            if i < 0:
+                # Keep a possible partial magic at the tail
+                drop = len(self.rx) - 3
+                self.stats.rx_resync_drops += drop
+                del self.rx[:drop]
+                return None
+            if i > 0:
+                self.stats.rx_resync_drops += i
+                del self.rx[:i]
+                continue
+
+            _, length, seq, obj, cmd, flags = struct.unpack_from(HEADER_FMT, self.rx)
+            trailer = trailer_size(flags) if self.crc_support else 0
+
+            if length < HEADER_SIZE + trailer or length > RX_BUFFER_SIZE:
+                self.stats.frames_bad_len += 1
+                del self.rx[0]
+                continue
+
+            if len(self.rx) < length:
+                return None
+
+            if trailer:
+                body = bytes(self.rx[: length - trailer])
+                if crc_bytes(flags, body) != self.rx[length - trailer : length]:
+                    self.stats.frames_bad_crc += 1
+                    del self.rx[0]
+                    continue
+
+            payload = bytes(self.rx[HEADER_SIZE : length - trailer])
+            del self.rx[:length]
+            return CmdView(seq, obj, cmd, flags, payload)
+
+        return None
+
+
+def build_frame(
+    seq: int,
+    object_id: int,
+    cmd_id: int,
+    flags: int,
+    payload: bytes,
+    crc_support: bool = True,
+) -> bytes:
+    """
+    Build a reply. If the request asked for a CRC (and crc_support is on),
+    the reply is ACKed and protected with the same CRC type.
+    """
+    trailer = 0
+    if crc_support and flags & FLAG_CRC_MASK:
+        flags |= FLAG_CRC_ACK
+        trailer = trailer_size(flags)
+
+    payload = payload[: TX_BUFFER_SIZE - HEADER_SIZE - trailer]
+    body = struct.pack(
+        HEADER_FMT,
+        MAGIC,
+        HEADER_SIZE + len(payload) + trailer,
+        seq,
+        object_id,
+        cmd_id,
+        flags,
+    ) + payload
+    return body + (crc_bytes(flags, body) if trailer else b"")
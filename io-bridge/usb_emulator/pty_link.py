@@ -0,0 +1,128 @@
+# usb_emulator/pty_link.py
+"""
+Attach an EmulatedDevice to a pseudo-terminal pair.
+
+The host side opens link.port (e.g. /dev/pts/5) exactly like
+/dev/ttyUSB0. Line impairments are applied to bytes in both directions.
+"""
+
+import heapq
+import os
+import random
+import select
+import threading
+import time
+import tty
+import logging
+log = logging.getLogger(__name__)
+
+from usb_emulator.device import EmulatedDevice
+
+
+class PtyLink:
+    """
+    latency_s  delay before each response frame is written back
+    jitter_s   extra uniform random delay on top of latency_s
+    loss       per-byte probability of dropping a byte
+    corrupt    per-byte probability of flipping one bit
+    """
+
+    def __init__(
+        self,
+        device: EmulatedDevice,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        loss: float = 0.0,
+        corrupt: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.device = device
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.loss = loss
+        self.corrupt = corrupt
+        self._rng = random.Random(seed)
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.bytes_dropped = 0
+        self.bytes_corrupted = 0
+
+        self._pending = []  # heap of (due, n, frame)
+        self._n = 0
+        self._running = False
+        self._thread = None
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            name="UsbEmulator",
+            daemon=True,
+        )
+        self._thread.start()
+        log.info(f"[emulator] device attached at {self.port}")
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------------------------------------
+
+    def _impair(self, data: bytes) -> bytes:
+        if not self.loss and not self.corrupt:
+            return data
+
+        out = bytearray()
+        rng = self._rng
+        for b in data:
+            if self.loss and rng.random() < self.loss:
+                self.bytes_dropped += 1
+                continue
+            if self.corrupt and rng.random() < self.corrupt:
+                b ^= 1 << rng.randrange(8)
+                self.bytes_corrupted += 1
+            out.append(b)
+        return bytes(out)
+
+    def _run(self):
+        while self._running:
+            now = time.monotonic()
+            timeout = 0.005
+            if self._pending:
+                timeout = max(0.0, min(timeout, self._pending[0][0] - now))
+
+            readable, _, _ = select.select([self.master_fd], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self.master_fd, 4096)
+                except OSError:
+                    break
+                for frame in self.device.receive(self._impair(data)):
+                    delay = self.latency_s
+                    if self.jitter_s:
+                        delay += self._rng.uniform(0.0, self.jitter_s)
+                    self._n += 1
+                    heapq.heappush(self._pending, (time.monotonic() + delay, self._n, frame))
+
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                _, _, frame = heapq.heappop(self._pending)
+                os.write(self.master_fd, self._impair(frame))
+
+            self.device.tick()
@@ -23,46 +23,60 @@ pid_cmd_result_t TempCtrl::handle_cmd(
     switch (cmd.cmd_id) {
 
     // ---------- READ FULL STATUS ----------
-    case TC_CMD_READ_STATUS: {
-        if (out_max < sizeof(tempctrl_stat_t))
-            return PID_CMD_ERROR;
-
-        tempctrl_stat_t st;
-        st.Mode     = (uint8_t)Mode;
-        st.CtrlMode = (uint8_t)CtrlMode;
-        st._pad1    = 0;
-        st._pad2    = 0;
-        st.Sp = Sp;
-        memcpy(&st.pid, &pid.stat, sizeof(pide_stat_t));
-
-        memcpy(out_buf, &st, sizeof(st));
-        *out_len = sizeof(st);
-        return PID_CMD_OK;
-    }
+    case TC_CMD_READ_STATUS:
+        return write_status(out_buf, out_max, out_len);
 
     // ---------- TEMP CTRL COMMANDS ----------
+    // SET replies carry the full status, so the host sees the applied
+    // state (and refreshes its tags) without a separate read
     case TC_CMD_SET_MODE:
         if (cmd.payload_len != sizeof(uint8_t))
             return PID_CMD_ERROR;
         Mode = (tempctrl_mode_t)cmd.payload[0];
-        return PID_CMD_OK;
+        return write_status(out_buf, out_max, out_len);
 
     case TC_CMD_SET_SP:
         if (cmd.payload_len != sizeof(float))
             return PID_CMD_ERROR;
         Sp = *(float*)cmd.payload;
-        return PID_CMD_OK;
+        return write_status(out_buf, out_max, out_len);
 
     case TC_CMD_SET_CTRL:
         if (cmd.payload_len != sizeof(uint8_t))
             return PID_CMD_ERROR;
         CtrlMode = (tempctrl_ctrlmode_t)cmd.payload[0];
-        return PID_CMD_OK;
+        return write_status(out_buf, out_max, out_len);
 
     // ---------- FALL THROUGH TO PIDE ----------
-    default:
-        return pid.handle_cmd(cmd, out_buf, out_max, out_len);
+    default: {
+        pid_cmd_result_t r = pid.handle_cmd(cmd, out_buf, out_max, out_len);
+        if (r != PID_CMD_OK)
+            return r;
+        return write_status(out_buf, out_max, out_len);
     }
+    }
+}
+
+// ---------------- STATUS ----------------
+pid_cmd_result_t TempCtrl::write_status(
+    uint8_t* out_buf,
+    uint16_t out_max,
+    uint16_t* out_len
+){
+    if (out_max < sizeof(tempctrl_stat_t))
+        return PID_CMD_ERROR;
+
+    tempctrl_stat_t st;
+    st.Mode     = (uint8_t)Mode;
+    st.CtrlMode = (uint8_t)CtrlMode;
+    st._pad1    = 0;
+    st._pad2    = 0;
+    st.Sp = Sp;
+    memcpy(&st.pid, &pid.stat, sizeof(pide_stat_t));
+
+    memcpy(out_buf, &st, sizeof(st));
+    *out_len = sizeof(st);
+    return PID_CMD_OK;
 }
 
 // ---------------- UPDATE ----------------
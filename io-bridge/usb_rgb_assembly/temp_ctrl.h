@@ -32,7 +32,8 @@ typedef enum {
 } tempctrl_cmd_id_t;
 
 // ---------------- STATUS STRUCT ----------------
-// Returned by READ_STATUS
+// Returned by READ_STATUS, and by every SET command (TempCtrl and the
+// PIDE commands it forwards) as the state after the write was applied
 typedef struct __attribute__((packed)) {
     uint8_t Mode;
     uint8_t CtrlMode;
@@ -78,4 +79,10 @@ public:
 
 private:
     void updateCtrlMode(float err);
+
+    pid_cmd_result_t write_status(
+        uint8_t* out_buf,
+        uint16_t out_max,
+        uint16_t* out_len
+    );
 };
@@ -33,7 +33,20 @@ bool UsbComm::poll()
     uint16_t out_max = (TX_BUFFER_SIZE >= HEADER_SIZE) ? (uint16_t)(TX_BUFFER_SIZE - HEADER_SIZE) : 0;
 
     bool handled = false;
-    if (cmd.object_id < handlers_n_ && handlers_[cmd.object_id]) {
+    if (cmd.object_id == SYS_OBJECT_ID && cmd.cmd_id == SYS_CMD_HELLO) {
+        // Link negotiation: empty reply; the CRC ACK is added by tx
+        handled = true;
+        out_len = 0;
+    } else if (cmd.object_id == SYS_OBJECT_ID && cmd.cmd_id == SYS_CMD_READ_STATS) {
+        // uptime_ms + Stats (counted up to, not including, this frame)
+        uint32_t uptime = millis();
+        if (out_max >= sizeof(uptime) + sizeof(Stats)) {
+            memcpy(out_payload, &uptime, sizeof(uptime));
+            memcpy(out_payload + sizeof(uptime), &stats_, sizeof(Stats));
+            out_len = sizeof(uptime) + sizeof(Stats);
+        }
+        handled = true;
+    } else if (cmd.object_id < handlers_n_ && handlers_[cmd.object_id]) {
         handled = handlers_[cmd.object_id](cmd, out_payload, out_max, &out_len);
         if (!handled) stats_.frames_handler_false++;
     } else {
@@ -72,67 +85,88 @@ void UsbComm::rx_fill_()
 
 bool UsbComm::rx_try_get_one_frame_(CmdView& cmd_view, uint16_t& frame_len)
 {
-    // We need at least a header to do anything.
-    if (rx_head_ < HEADER_SIZE) return false;
-
-    // Scan for MAGIC. If not at index 0, drop bytes until it is (resync).
-    // Note: this is O(n), but RX_BUFFER_SIZE is small and poll is frequent.
-    size_t i = 0;
-    while (i + 4 <= rx_head_) {
-        if (le_u32_(rx_ + i) == USB_COMM_MAGIC) break;
-        i++;
-    }
+    for (;;) {
+        // We need at least a header to do anything.
+        if (rx_head_ < HEADER_SIZE) return false;
 
-    if (i > 0) {
-        // Drop bytes before magic (or all if magic not found)
-        rx_drop_(i);
-        stats_.rx_resync_drops += (uint32_t)i;
-    }
+        // Scan for MAGIC. Jump between candidate first bytes with memchr
+        // instead of testing every offset (resync).
+        const uint8_t magic0 = (uint8_t)(USB_COMM_MAGIC & 0xFF);
+        size_t i = 0;
+        while (i + 4 <= rx_head_) {
+            const uint8_t* p = (const uint8_t*)memchr(rx_ + i, magic0, rx_head_ + 1 - 4 - i);
+            if (!p) {
+                i = rx_head_ - 3; // keep a possible partial magic at the tail
+                break;
+            }
+            i = (size_t)(p - rx_);
+            if (le_u32_(rx_ + i) == USB_COMM_MAGIC) break;
+            i++;
+        }
 
-    if (rx_head_ < HEADER_SIZE) return false;
-    if (le_u32_(rx_) != USB_COMM_MAGIC) {
-        // Magic not found even after drop; drop one byte and try later
-        rx_drop_(1);
-        stats_.frames_bad_magic++;
-        return false;
-    }
+        if (i > 0) {
+            // Drop bytes before magic (or all but the tail if magic not found)
+            rx_drop_(i);
+            stats_.rx_resync_drops += (uint32_t)i;
+        }
 
-    uint16_t len = le_u16_(rx_ + 4);
-    if (len < HEADER_SIZE) {
-        // Invalid length; drop magic byte and resync
-        rx_drop_(1);
-        stats_.frames_bad_len++;
-        return false;
-    }
+        if (rx_head_ < HEADER_SIZE) return false;
+        if (le_u32_(rx_) != USB_COMM_MAGIC) {
+            // Magic not found even after drop; drop one byte and try later
+            rx_drop_(1);
+            stats_.frames_bad_magic++;
+            return false;
+        }
 
-    if (len > RX_BUFFER_SIZE) {
-        // Unreasonably large frame; drop magic byte and resync
-        rx_drop_(1);
-        stats_.frames_bad_len++;
-        return false;
-    }
+        const uint8_t flags = rx_[9];
+        const size_t trailer = trailer_size_(flags);
 
-    if (rx_head_ < len) {
-        // Not enough bytes yet for full frame
-        return false;
-    }
+        uint16_t len = le_u16_(rx_ + 4);
+        if (len < HEADER_SIZE + trailer || len > RX_BUFFER_SIZE) {
+            // Invalid length; drop magic byte and resync
+            rx_drop_(1);
+            stats_.frames_bad_len++;
+            continue;
+        }
 
-    // Parse header fields
-    cmd_view.seq       = rx_[6];
-    cmd_view.object_id = rx_[7];
-    cmd_view.cmd_id    = rx_[8];
-    cmd_view.flags     = rx_[9];
+        if (rx_head_ < len) {
+            // Not enough bytes yet for full frame
+            return false;
+        }
 
-    cmd_view.payload = rx_ + HEADER_SIZE;
-    cmd_view.payload_len = (uint16_t)(len - HEADER_SIZE);
+        if (trailer) {
+            const size_t body = len - trailer;
+            bool ok;
+            if (flags & FLAG_CRC32) {
+                ok = crc32_(rx_, body) == le_u32_(rx_ + body);
+            } else {
+                ok = crc16_(rx_, body) == le_u16_(rx_ + body);
+            }
+            if (!ok) {
+                // Corrupt frame (or corrupt length): drop magic byte and resync
+                rx_drop_(1);
+                stats_.frames_bad_crc++;
+                continue;
+            }
+        }
 
-    frame_len = len;
+        // Parse header fields
+        cmd_view.seq       = rx_[6];
+        cmd_view.object_id = rx_[7];
+        cmd_view.cmd_id    = rx_[8];
+        cmd_view.flags     = rx_[9];
 
-    // Now that we have a full frame, we can drop it from rx_ AFTER caller uses payload.
-    // However caller handles immediately and then we can drop now.
-    rx_drop_(len);
+        cmd_view.payload = rx_ + HEADER_SIZE;
+        cmd_view.payload_len = (uint16_t)(len - HEADER_SIZE - trailer);
 
-    return true;
+        frame_len = len;
+
+        // Now that we have a full frame, we can drop it from rx_ AFTER caller uses payload.
+        // However caller handles immediately and then we can drop now.
+        rx_drop_(len);
+
+        return true;
+    }
 }
 
 void UsbComm::tx_send_response_(uint8_t seq,
@@ -142,25 +176,37 @@ void UsbComm::tx_send_response_(uint8_t seq,
                                const uint8_t* payload,
                                uint16_t payload_len)
 {
+    // Requests that carried a CRC get a CRC-protected, ACKed reply.
+    if (flags & FLAG_CRC_MASK) flags |= FLAG_CRC_ACK;
+    const size_t trailer = trailer_size_(flags);
+
     // Cap payload to TX buffer capacity.
-    uint16_t max_payload = (TX_BUFFER_SIZE > HEADER_SIZE) ? (uint16_t)(TX_BUFFER_SIZE - HEADER_SIZE) : 0;
+    uint16_t max_payload = (TX_BUFFER_SIZE > HEADER_SIZE + trailer) ? (uint16_t)(TX_BUFFER_SIZE - HEADER_SIZE - trailer) : 0;
     if (payload_len > max_payload) payload_len = max_payload;
 
     // Build header
     put_le_u32_(tx_, USB_COMM_MAGIC);
-    put_le_u16_(tx_ + 4, (uint16_t)(HEADER_SIZE + payload_len));
+    put_le_u16_(tx_ + 4, (uint16_t)(HEADER_SIZE + payload_len + trailer));
     tx_[6] = seq;
     tx_[7] = object_id;
     tx_[8] = cmd_id;
     tx_[9] = flags;
 
-    // Copy payload
+    // Copy payload (memmove: handlers write straight into tx_)
     if (payload_len > 0 && payload) {
-        memcpy(tx_ + HEADER_SIZE, payload, payload_len);
+        memmove(tx_ + HEADER_SIZE, payload, payload_len);
+    }
+
+    // Append CRC trailer over header + payload
+    const size_t body = (size_t)(HEADER_SIZE + payload_len);
+    if (flags & FLAG_CRC32) {
+        put_le_u32_(tx_ + body, crc32_(tx_, body));
+    } else if (flags & FLAG_CRC16) {
+        put_le_u16_(tx_ + body, crc16_(tx_, body));
     }
 
     // Write exactly len bytes
-    const size_t total = (size_t)(HEADER_SIZE + payload_len);
+    const size_t total = body + trailer;
     io_.write(tx_, total);
     io_.flush(); // CDC: flush pushes to USB stack/host buffers
 }
@@ -192,6 +238,37 @@ void UsbComm::put_le_u16_(uint8_t* p, uint16_t v)
     p[1] = (uint8_t)((v >> 8) & 0xFF);
 }
 
+size_t UsbComm::trailer_size_(uint8_t flags)
+{
+    if (flags & FLAG_CRC32) return 4;
+    if (flags & FLAG_CRC16) return 2;
+    return 0;
+}
+
+uint16_t UsbComm::crc16_(const uint8_t* p, size_t n)
+{
+    uint16_t crc = 0xFFFF;
+    while (n--) {
+        crc ^= (uint16_t)(*p++) << 8;
+        for (uint8_t b = 0; b < 8; b++) {
+            crc = (crc & 0x8000) ? (uint16_t)((crc << 1) ^ 0x1021) : (uint16_t)(crc << 1);
+        }
+    }
+    return crc;
+}
+
+uint32_t UsbComm::crc32_(const uint8_t* p, size_t n)
+{
+    uint32_t crc = 0xFFFFFFFF;
+    while (n--) {
+        crc ^= *p++;
+        for (uint8_t b = 0; b < 8; b++) {
+            crc = (crc & 1) ? (crc >> 1) ^ 0xEDB88320 : (crc >> 1);
+        }
+    }
+    return ~crc;
+}
+
 void UsbComm::rx_drop_(size_t n)
 {
     if (n == 0) return;
@@ -11,11 +11,28 @@ Wire format (little-endian):
   uint8   seq          = host-chosen sequence number
   uint8   object_id    = which object/service
   uint8   cmd_id       = which command within object
-  uint8   flags        = reserved for future (0 for now)
-  uint8   payload[]    = (len - header_size) bytes
+  uint8   flags        = FLAG_* bits below (0 = plain frame)
+  uint8   payload[]    = (len - header_size - trailer) bytes
+  [uint16 crc16 | uint32 crc32]   trailer, only if a FLAG_CRC* bit is set
 
 Response uses the same envelope, with payload defined by the object handler.
 usb_comm itself does not interpret payload contents.
+
+CRC framing (optional, host-negotiated):
+  - FLAG_CRC16 / FLAG_CRC32 on a request means it carries that trailer
+    (CRC-16/CCITT-FALSE or CRC-32/IEEE over header + payload). Frames with
+    a bad CRC are dropped without a reply; the host retries.
+  - The reply is protected with the same CRC and has FLAG_CRC_ACK set.
+    Older firmware echoes the flags without ACK, which tells the host to
+    stay on plain frames.
+  - Object 0 is the link object, handled here: SYS_CMD_HELLO replies with
+    an empty payload and is what the host uses to negotiate.
+
+Diagnostics:
+  - SYS_CMD_READ_STATS on object 0 replies with uint32 uptime_ms followed
+    by the Stats counters below, in declaration order (all uint32). New
+    counters are only ever appended. Older firmware replies with an
+    empty payload.
 */
 
 class UsbComm {
@@ -29,6 +46,17 @@ public:
     // Header size on the wire
     static constexpr size_t HEADER_SIZE = 4 + 2 + 1 + 1 + 1 + 1; // magic + len + seq + obj + cmd + flags
 
+    // Flags
+    static constexpr uint8_t FLAG_CRC16    = 0x01;
+    static constexpr uint8_t FLAG_CRC32    = 0x02;
+    static constexpr uint8_t FLAG_CRC_MASK = FLAG_CRC16 | FLAG_CRC32;
+    static constexpr uint8_t FLAG_CRC_ACK  = 0x80;
+
+    // Link object (handled by UsbComm, not the handler table)
+    static constexpr uint8_t SYS_OBJECT_ID = 0;
+    static constexpr uint8_t SYS_CMD_HELLO = 0x00;
+    static constexpr uint8_t SYS_CMD_READ_STATS = 0x01;
+
     // Parsed request view (points into rx buffer)
     struct CmdView {
         uint8_t  seq = 0;
@@ -64,6 +92,7 @@ public:
         uint32_t frames_handler_false = 0;
         uint32_t rx_overflow = 0;
         uint32_t rx_resync_drops = 0;
+        uint32_t frames_bad_crc = 0;
     };
 
     const Stats& stats() const { return stats_; }
@@ -101,6 +130,11 @@ private:
     static void     put_le_u32_(uint8_t* p, uint32_t v);
     static void     put_le_u16_(uint8_t* p, uint16_t v);
 
+    // CRC trailer helpers
+    static size_t   trailer_size_(uint8_t flags);
+    static uint16_t crc16_(const uint8_t* p, size_t n);   // CRC-16/CCITT-FALSE
+    static uint32_t crc32_(const uint8_t* p, size_t n);   // CRC-32/IEEE
+
     // Compact buffer: drop first n bytes, shift remainder to front
     void rx_drop_(size_t n);
 };
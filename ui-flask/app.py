@@ -3,11 +3,9 @@ from flask_socketio import SocketIO
 from threading import Thread
 import time
 
-from tags.poller import Poller
-import platform
-from tags.usb_comm import UsbComm
+from tags.poller_manager import PollerManager
 from web.routes import register_routes
-from tags.runtime import register_tag_namespace, emit_tag_updates
+from tags.runtime import register_tag_namespace, run_tag_emitter
 import logging
 
 logging.basicConfig(
@@ -24,29 +22,19 @@ app.jinja_env.auto_reload = True
 app.config["SECRET_KEY"] = "dev"
 
 socketio = SocketIO(app, async_mode="threading")
-# ---------------- Hardware poller ----------------
+# ---------------- Hardware pollers ----------------
+# One worker per device in tags.registry.DEVICES
 
-if platform.system() == "Windows":
-    port = "COM8"
-else:
-    port = "/dev/ttyUSB0"
-
-usb = UsbComm(port, 500000)
-poller = Poller(usb)
+poller = PollerManager()
 from tags.runtime import set_poller
 set_poller(poller)
 
 def start_tag_update_loop():
     """
-    Background thread that periodically emits tag updates
-    using shm-service as the data source.
+    Background thread that pushes tag updates as soon as the pollers
+    publish them (see tags.runtime.run_tag_emitter).
     """
-    def run():
-        while True:
-            emit_tag_updates(socketio)
-            time.sleep(0.05)  # 50 ms tick; per-client rate_ms still applies
-
-    socketio.start_background_task(run)
+    socketio.start_background_task(run_tag_emitter, socketio)
 
 # ---------------------------------------------------------------------------
 # App setup
@@ -54,7 +42,7 @@ def start_tag_update_loop():
 
 register_routes(app)
 register_tag_namespace(socketio)
-socketio.start_background_task(poller.run)
+poller.start()
 start_tag_update_loop()
 
 if __name__ == "__main__":
@@ -0,0 +1,244 @@
+# bench/poll_bench.py
+"""
+Throughput / latency benchmark for the serial poll path
+(Poller + UsbComm) against the io-bridge usb_emulator.
+
+    cd ui-flask
+    python -m bench.poll_bench                     # one-factor sweep
+    python -m bench.poll_bench --full --duration 5 # full cartesian sweep
+    python -m bench.poll_bench --out bench.jsonl   # append results
+
+Each case prints one JSON object per line on stdout (and to --out),
+so runs can be diffed or loaded into a dataframe to track regressions.
+A readable summary goes to stderr.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from tags import registry, state
+from tags.poller import Poller
+from tags.usb_comm import UsbComm
+
+IO_BRIDGE_DIR = Path(__file__).resolve().parents[2] / "io-bridge"
+
+BASELINE = {
+    "objects": 1,
+    "status_pad": 0,
+    "latency_ms": 0.0,
+    "loss": 0.0,
+    "corrupt": 0.0,
+    "crc": "crc16",
+}
+
+SWEEP = {
+    "objects": [1, 4, 16],
+    "status_pad": [0, 200, 450],
+    "latency_ms": [0.0, 1.0, 5.0],
+    "loss": [0.0, 0.001, 0.01],
+    "corrupt": [0.0, 0.001, 0.01],
+    "crc": ["none", "crc16", "crc32"],
+}
+
+
+# ---------------------------------------------------------------------------
+# Setup helpers
+# ---------------------------------------------------------------------------
+
+def _register_objects(n: int) -> list[str]:
+    """
+    Register tic2..ticN on objects 2..n (same type as tic1) and return
+    every tag name for objects 1..n.
+    """
+    missing = [i for i in range(2, n + 1) if f"tic{i}" not in registry.PREFIXES]
+    for i in missing:
+        registry.add_instances(f"tic{i}", "tempctrl", i)
+    names = []
+    for i in range(1, n + 1):
+        names += registry.tags_with_prefix(f"tic{i}")
+    return names
+
+
+def _start_emulator(case: dict, seed: int) -> tuple[subprocess.Popen, str]:
+    cmd = [
+        sys.executable, "-m", "usb_emulator",
+        "--objects", str(case["objects"]),
+        "--status-pad", str(case["status_pad"]),
+        "--latency-ms", str(case["latency_ms"]),
+        "--loss", str(case["loss"]),
+        "--corrupt", str(case["corrupt"]),
+        "--seed", str(seed),
+    ]
+    proc = subprocess.Popen(
+        cmd,
+        cwd=IO_BRIDGE_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    line = proc.stdout.readline().strip()
+    if not line.startswith("Emulated device on "):
+        proc.kill()
+        raise RuntimeError(f"emulator failed to start: {line!r}")
+    return proc, line.rsplit(" ", 1)[1]
+
+
+def _percentile(sorted_vals, q: float) -> float | None:
+    if not sorted_vals:
+        return None
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+# ---------------------------------------------------------------------------
+# One case
+# ---------------------------------------------------------------------------
+
+def run_case(case: dict, duration: float, warmup: float, seed: int) -> dict:
+    proc, port = _start_emulator(case, seed)
+    try:
+        usb = UsbComm(port, 500000)
+        crc = None if case["crc"] == "none" else case["crc"]
+        poller = Poller(usb, poll_interval=0.0, crc=crc)
+
+        names = _register_objects(case["objects"])
+        state.unsubscribe_tags(state.get_subscriptions())
+        state.subscribe_tags(names)
+
+        t = threading.Thread(target=poller.run, daemon=True)
+        t.start()
+        time.sleep(warmup)
+
+        # Measurement window: fresh counters, unbounded latency record
+        poller.reset_stats(latency_samples=None)
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        time.sleep(duration)
+        stats = poller.stats
+        elapsed = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+
+        poller.stop()
+        t.join(timeout=2.0)
+        usb.close()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=2.0)
+
+    lat = sorted(stats.latencies)
+    ms = lambda v: None if v is None else round(v * 1000.0, 3)
+
+    return {
+        **case,
+        "tags": len(names),
+        "elapsed_s": round(elapsed, 3),
+        "round_trips": stats.round_trips,
+        "round_trips_per_s": round(stats.round_trips / elapsed, 1),
+        "tag_updates_per_s": round(stats.tag_updates / elapsed, 1),
+        "cycles_per_s": round(stats.cycles / elapsed, 2),
+        "latency_ms": {
+            "p50": ms(_percentile(lat, 0.50)),
+            "p90": ms(_percentile(lat, 0.90)),
+            "p99": ms(_percentile(lat, 0.99)),
+            "max": ms(lat[-1] if lat else None),
+            "mean": ms(statistics.fmean(lat) if lat else None),
+        },
+        "cpu_s": round(cpu, 3),
+        "cpu_us_per_update": round(cpu * 1e6 / stats.tag_updates, 2) if stats.tag_updates else None,
+        "cpu_us_per_round_trip": round(cpu * 1e6 / stats.round_trips, 2) if stats.round_trips else None,
+        "timeouts": stats.timeouts,
+        "retries": stats.retries,
+        "resync_drop_bytes": stats.resync_drops,
+        "bad_len": stats.bad_len,
+        "bad_crc": stats.bad_crc,
+        # Wall time spent in attempts that got no (valid) reply
+        "timeout_s_lost": round(stats.lost_s, 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Sweep
+# ---------------------------------------------------------------------------
+
+def build_cases(full: bool) -> list[dict]:
+    if full:
+        keys = list(SWEEP)
+        return [dict(zip(keys, combo)) for combo in itertools.product(*SWEEP.values())]
+
+    # One factor at a time around the baseline
+    cases = [dict(BASELINE)]
+    for key, values in SWEEP.items():
+        for v in values:
+            if v != BASELINE[key]:
+                cases.append({**BASELINE, key: v})
+    return cases
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the serial poll path")
+    ap.add_argument("--duration", type=float, default=3.0, help="seconds measured per case")
+    ap.add_argument("--warmup", type=float, default=0.5)
+    ap.add_argument("--full", action="store_true", help="cartesian sweep instead of one-factor")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="append JSON lines to this file")
+    args = ap.parse_args()
+
+    meta = {
+        "run_id": uuid.uuid4().hex[:12],
+        "ts": int(time.time()),
+        "git_rev": _git_rev(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+    }
+
+    out = open(args.out, "a") if args.out else None
+    try:
+        for case in build_cases(args.full):
+            result = {**meta, **run_case(case, args.duration, args.warmup, args.seed)}
+            line = json.dumps(result)
+            print(line, flush=True)
+            if out:
+                out.write(line + "\n")
+                out.flush()
+
+            lat = result["latency_ms"]
+            print(
+                f"obj={case['objects']:<3} pad={case['status_pad']:<4} "
+                f"lat={case['latency_ms']:<4} loss={case['loss']:<6} corrupt={case['corrupt']:<6} "
+                f"crc={case['crc']:<5} "
+                f"rt/s={result['round_trips_per_s']:<8} upd/s={result['tag_updates_per_s']:<9} "
+                f"p50={lat['p50']}ms p99={lat['p99']}ms "
+                f"cpu/upd={result['cpu_us_per_update']}us "
+                f"to={result['timeouts']} resync={result['resync_drop_bytes']}B "
+                f"badcrc={result['bad_crc']}",
+                file=sys.stderr,
+            )
+    finally:
+        if out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
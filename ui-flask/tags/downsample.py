@@ -0,0 +1,150 @@
+# tags/downsample.py
+"""
+Server-side downsampling for /api/history?points=N.
+
+A chart can show at most about one point per pixel column, so the
+history API reduces each tag's series to N points that keep its visual
+shape:
+
+  minmax  split the series into N/2 equal-count buckets and keep the
+          lowest and highest sample of each, in time order. Spikes
+          survive, even ones that an interval average hides (rows that
+          carry "min"/"max" from the query are used for the extremes).
+  lttb    Largest-Triangle-Three-Buckets (Steinarsson 2013): one point
+          per bucket, the one forming the largest triangle with the
+          point kept before it and the mean of the next bucket.
+
+Both are NumPy: minmax is fully vectorized, lttb loops once per output
+bucket with vector work inside.
+"""
+
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from tags.historian_rollup import ROLLUP_TIERS
+
+MODES = ("minmax", "lttb")
+
+# Query this many source buckets per output point when the caller gives
+# points but no interval
+OVERSAMPLE = 8
+
+
+def _edges(n: int, buckets: int) -> np.ndarray:
+    """Start index of each of `buckets` near-equal slices of range(n)."""
+    return np.linspace(0, n, buckets + 1).astype(np.intp)[:-1]
+
+
+def minmax(y: np.ndarray, points: int, ymin: np.ndarray | None = None, ymax: np.ndarray | None = None):
+    """
+    Indices of the lowest and of the highest sample per bucket, as two
+    arrays of points // 2. ymin / ymax default to y.
+    """
+    n = len(y)
+    ymin = y if ymin is None else ymin
+    ymax = y if ymax is None else ymax
+
+    edges = _edges(n, max(1, points // 2))
+    counts = np.diff(np.append(edges, n))
+    idx = np.arange(n)
+    big = np.iinfo(np.intp).max
+
+    lo = np.minimum.reduceat(ymin, edges)
+    hi = np.maximum.reduceat(ymax, edges)
+    i_lo = np.minimum.reduceat(np.where(ymin == np.repeat(lo, counts), idx, big), edges)
+    i_hi = np.minimum.reduceat(np.where(ymax == np.repeat(hi, counts), idx, big), edges)
+
+    return i_lo, i_hi
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the samples to keep (at most `points`, sorted)."""
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    points = max(points, 3)
+
+    # First and last points are always kept; the rest is split into
+    # points - 2 buckets over x[1:-1]
+    edges = np.append(_edges(n - 2, points - 2) + 1, n - 1)
+    out = np.empty(points, dtype=np.intp)
+    out[0] = 0
+    out[-1] = n - 1
+
+    a = 0
+    for b in range(points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nlo, nhi = hi, edges[b + 2] if b + 2 < len(edges) else n
+        cx = x[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        out[b + 1] = a
+    return out
+
+
+def source_interval(span_s: float, points: int) -> int:
+    """
+    Query interval (s) giving about OVERSAMPLE buckets per output point,
+    rounded down to a multiple of the largest rollup tier that fits so
+    the query can be answered from rollups.
+    """
+    interval = max(1, int(span_s // (points * OVERSAMPLE)))
+    for tier in reversed(ROLLUP_TIERS):
+        if tier <= interval:
+            return interval - interval % tier
+    return interval
+
+
+def epoch_seconds(timestamps: List) -> np.ndarray:
+    """Row timestamps (ISO strings as returned by the backends, or numbers) as float seconds."""
+    if timestamps and isinstance(timestamps[0], str):
+        return np.array([t.rstrip("Z") for t in timestamps], dtype="datetime64[us]").astype(np.float64) / 1e6
+    return np.asarray(timestamps, dtype=np.float64)
+
+
+def downsample_rows(rows: List[dict], points: int, mode: str = "minmax") -> List[dict]:
+    """
+    Reduce query rows ({"timestamp", "tag", "value", ...}) to at most
+    `points` rows per tag. Output is merged back into time order.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+
+    by_tag: Dict[str, List[dict]] = defaultdict(list)
+    for row in rows:
+        if row.get("value") is not None:
+            by_tag[row["tag"]].append(row)
+
+    out = []
+    for series in by_tag.values():
+        if len(series) <= points:
+            out.extend(series)
+            continue
+        y = np.fromiter((r["value"] for r in series), dtype=np.float64, count=len(series))
+        if mode == "lttb":
+            keep = lttb(epoch_seconds([r["timestamp"] for r in series]), y, points)
+            out.extend(series[i] for i in keep)
+            continue
+
+        if all(r.get("min") is not None and r.get("max") is not None for r in series):
+            ymin = np.fromiter((r["min"] for r in series), dtype=np.float64, count=len(series))
+            ymax = np.fromiter((r["max"] for r in series), dtype=np.float64, count=len(series))
+            i_lo, i_hi = minmax(y, points, ymin, ymax)
+            # A kept row stands for its extreme, not its average
+            picked = {}
+            for i in i_lo.tolist():
+                picked[(i, 0)] = {**series[i], "value": series[i]["min"]}
+            for i in i_hi.tolist():
+                if ymax[i] != ymin[i] or (i, 0) not in picked:
+                    picked[(i, 1)] = {**series[i], "value": series[i]["max"]}
+        else:
+            i_lo, i_hi = minmax(y, points)
+            picked = {(i, 0): series[i] for i in np.union1d(i_lo, i_hi).tolist()}
+        out.extend(picked[k] for k in sorted(picked))
+
+    out.sort(key=lambda r: r["timestamp"])
+    return out
@@ -0,0 +1,155 @@
+# tags/encoding.py
+"""
+Compact "tag_packed" push format, negotiated per client at subscribe
+time (format="packed"). The subscribe ack maps each tag name to a small
+integer id once; every push after that is one binary frame:
+
+    uint32   n            (bit 31 set: META section follows)
+    uint16   ids[n]
+    (pad to a multiple of 4)
+    float32  values[n]
+    --- META, for clients subscribed with meta=true ---
+    (pad to a multiple of 8)
+    float64  ts[n]        acquisition time, epoch seconds
+    uint8    quality[n]   QUALITY_CODES
+
+All little-endian, so the browser reads it without copying:
+
+    const n    = new DataView(buf).getUint32(0, true) & 0x7fffffff;
+    const ids  = new Uint16Array(buf, 4, n);
+    const vals = new Float32Array(buf, 4 + ((2 * n + 3) & ~3), n);
+
+Values are float32 on the wire, which is exact for every field the
+device reports (float32 / uint8). Values that are not packable (see
+packable(): non-numeric, or integers float32 cannot hold exactly, such
+as large counters) go out as a JSON "tag_update" instead.
+"""
+
+import struct
+from typing import Dict, List
+
+FORMAT_JSON = "json"
+FORMAT_PACKED = "packed"
+FORMATS = (FORMAT_JSON, FORMAT_PACKED)
+
+# Most tags one packed client can map (ids are uint16: 0 .. MAX_IDS - 1)
+MAX_IDS = 0xFFFF
+
+META_FLAG = 0x80000000
+
+# OPC-style quality bytes for the META section
+QUALITY_CODES = {
+    "good": 0xC0,
+    "bad": 0x00,
+}
+
+_COUNT = struct.Struct("<I")
+
+# Largest integer magnitude float32 represents exactly
+FLOAT32_EXACT_INT = 1 << 24
+
+
+def _values_offset(n: int) -> int:
+    return 4 + 2 * n + (-2 * n) % 4
+
+
+def _meta_offset(n: int) -> int:
+    end = _values_offset(n) + 4 * n
+    return end + (-end) % 8
+
+
+def packable(value) -> bool:
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, int):
+        return -FLOAT32_EXACT_INT <= value <= FLOAT32_EXACT_INT
+    return isinstance(value, float)
+
+
+def pack_updates(ids: List[int], values: List[float], ts: List[float] | None = None, quality: List[str] | None = None) -> bytes:
+    n = len(ids)
+    parts = [
+        _COUNT.pack(n | META_FLAG if ts is not None else n),
+        struct.pack(f"<{n}H{(-2 * n) % 4}x", *ids),
+        struct.pack(f"<{n}f", *values),
+    ]
+    if ts is not None:
+        pad = _meta_offset(n) - (_values_offset(n) + 4 * n)
+        parts.append(b"\0" * pad)
+        parts.append(struct.pack(f"<{n}d", *ts))
+        parts.append(bytes(QUALITY_CODES.get(q, 0) for q in quality))
+    return b"".join(parts)
+
+
+def unpack_updates(data: bytes) -> List[tuple]:
+    """
+    Inverse of pack_updates (for tools and debugging): [(id, value)] or,
+    with META, [(id, value, ts, quality_code)].
+    """
+    (word,) = _COUNT.unpack_from(data)
+    n = word & ~META_FLAG
+    ids = struct.unpack_from(f"<{n}H", data, 4)
+    values = struct.unpack_from(f"<{n}f", data, _values_offset(n))
+    if not word & META_FLAG:
+        return list(zip(ids, values))
+    off = _meta_offset(n)
+    ts = struct.unpack_from(f"<{n}d", data, off)
+    quality = data[off + 8 * n : off + 9 * n]
+    return list(zip(ids, values, ts, quality))
+
+
+class TagFilter:
+    """
+    Per-client, per-tag push filter.
+
+      precision  round to this many decimals before sending
+      deadband   skip the push unless the (rounded) value moved at
+                 least this much since the last value sent
+
+    A quality change is always sent.
+    """
+    __slots__ = ("deadband", "precision", "last", "last_quality")
+
+    def __init__(self, deadband: float = 0.0, precision: int | None = None):
+        self.deadband = deadband
+        self.precision = precision
+        self.last = None
+        self.last_quality = None
+
+    def apply(self, value, quality, force: bool = False):
+        """
+        Returns the value to send, or None to suppress it.
+        force=True always sends (initial value after subscribe).
+        """
+        if not isinstance(value, (int, float)):
+            return value
+        if self.precision is not None:
+            value = round(value, self.precision)
+        if (
+            not force
+            and quality == self.last_quality
+            and self.last is not None
+            and abs(value - self.last) < self.deadband
+        ):
+            return None
+        self.last = value
+        self.last_quality = quality
+        return value
+
+
+def build_filters(names, deadband=None, precision=None) -> Dict[str, TagFilter]:
+    """
+    deadband / precision are either one number for all names or a
+    {name: number} dict (as sent in the subscribe message).
+    """
+    def pick(opt, name):
+        return opt.get(name) if isinstance(opt, dict) else opt
+
+    filters = {}
+    for name in names:
+        db = pick(deadband, name)
+        prec = pick(precision, name)
+        if db is None and prec is None:
+            continue
+        filters[name] = TagFilter(float(db or 0.0), None if prec is None else int(prec))
+    return filters
@@ -0,0 +1,248 @@
+# tags/export.py
+"""
+Bulk history export for offline analysis.
+
+History is read from the historian in time chunks of CHUNK_POINTS grid
+points, as (ts_ms, tag, value) samples straight from the backend (not
+through the chart cache), pivoted into one column per tag on a fixed
+interval grid (NaN where a tag has no value) and written as a
+compressed columnar file:
+
+  parquet   one row group per chunk, zstd        (needs pyarrow)
+  arrow     Arrow IPC file, one batch per chunk  (needs pyarrow)
+  npz       NumPy .npz: "ts" plus one array per tag; columns are staged
+            in temporary .npy memmaps, then zipped
+
+Only one chunk is in memory at a time. export() yields the file's bytes
+as they are produced, so the same code serves the /api/export download
+and the command line. Query errors propagate: the download is aborted
+rather than completed with empty columns.
+
+    cd ui-flask
+    python -m tags.export --tags tic1.pid.pv,tic1.sp \\
+        --start 2024-05-01T08:00 --end 2024-05-02T08:00 --interval 10 \\
+        --out cook.parquet
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List
+
+import numpy as np
+
+CHUNK_POINTS = 10_000
+COPY_BLOCK = 1 << 20
+
+MIMETYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "npz": "application/octet-stream",
+}
+FORMATS = tuple(MIMETYPES)
+
+# iter_query(tags, start_ms, end_ms, interval_s) -> (ts_ms, tag, value) samples
+QueryFn = Callable[[List[str], int, int, int], Iterable[tuple]]
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_format() -> str:
+    return "parquet" if have_pyarrow() else "npz"
+
+
+# ---------------- Reading ----------------
+
+def iter_frames(query: QueryFn, tags: List[str], start_ms: int, end_ms: int, interval: int,
+                chunk_points: int = CHUNK_POINTS):
+    """
+    Yield (ts, {tag: values}) per chunk: ts are the grid times in epoch
+    seconds, values float64 aligned to ts.
+    """
+    step = interval * 1000
+    t = start_ms - start_ms % step
+    col = {tag: i for i, tag in enumerate(tags)}
+
+    while t <= end_ms:
+        hi = min(end_ms, t + step * chunk_points - 1)
+        grid = np.arange(t, hi + 1, step, dtype=np.int64)
+        cols = np.full((len(tags), len(grid)), np.nan)
+
+        samples = [s for s in query(tags, t, hi, interval) if s[2] is not None and s[1] in col]
+        if samples:
+            n = len(samples)
+            ts_ms = np.fromiter((s[0] for s in samples), dtype=np.int64, count=n)
+            idx = (ts_ms - t) // step
+            which = np.fromiter((col[s[1]] for s in samples), dtype=np.intp, count=n)
+            values = np.fromiter((s[2] for s in samples), dtype=np.float64, count=n)
+            ok = (idx >= 0) & (idx < len(grid))
+            cols[which[ok], idx[ok]] = values[ok]
+
+        yield grid / 1000.0, dict(zip(tags, cols))
+        t = hi + 1
+
+
+class _Sink:
+    """Write-only file object collecting output between yields."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+# ---------------- Writers ----------------
+
+def _export_arrow(frames, tags: List[str], fmt: str) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [pa.field("ts", pa.timestamp("us", tz="UTC"))]
+        + [pa.field(tag, pa.float64()) for tag in tags]
+    )
+    sink = _Sink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    for ts, cols in frames:
+        batch = pa.record_batch(
+            [pa.array((ts * 1e6).astype(np.int64), pa.timestamp("us", tz="UTC"))]
+            + [pa.array(cols[tag]) for tag in tags],
+            schema=schema,
+        )
+        if fmt == "parquet":
+            writer.write_batch(batch)
+        else:
+            writer.write(batch)
+        yield sink.take()
+
+    writer.close()
+    yield sink.take()
+
+
+def _export_npz(frames, tags: List[str], total: int) -> Iterator[bytes]:
+    names = ["ts"] + tags
+    with tempfile.TemporaryDirectory(prefix="raspiplc-export-") as tmp:
+        arrays = [
+            np.lib.format.open_memmap(Path(tmp) / f"{i}.npy", mode="w+", dtype=np.float64, shape=(total,))
+            for i in range(len(names))
+        ]
+        n = 0
+        for ts, cols in frames:
+            end = n + len(ts)
+            arrays[0][n:end] = ts
+            for a, tag in zip(arrays[1:], tags):
+                a[n:end] = cols[tag]
+            n = end
+        for a in arrays:
+            a.flush()
+        del arrays
+
+        sink = _Sink()
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+            for i, name in enumerate(names):
+                with open(Path(tmp) / f"{i}.npy", "rb") as src, zf.open(f"{name}.npy", "w", force_zip64=True) as dst:
+                    while block := src.read(COPY_BLOCK):
+                        dst.write(block)
+                        yield sink.take()
+        yield sink.take()
+
+
+def export(query: QueryFn, tags: List[str], start_ms: int, end_ms: int, interval: int,
+           fmt: str | None = None) -> Iterator[bytes]:
+    """Yield the bytes of the export file."""
+    fmt = fmt or default_format()
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if fmt != "npz" and not have_pyarrow():
+        raise ValueError(f"format '{fmt}' needs pyarrow (pip install pyarrow); use npz")
+    if interval < 1 or end_ms < start_ms:
+        raise ValueError("need interval >= 1 and end >= start")
+
+    frames = iter_frames(query, tags, start_ms, end_ms, interval)
+    if fmt == "npz":
+        step = interval * 1000
+        total = (end_ms - (start_ms - start_ms % step)) // step + 1
+        return _export_npz(frames, tags, total)
+    return _export_arrow(frames, tags, fmt)
+
+
+# ---------------- CLI ----------------
+
+def _parse_time(s: str) -> int:
+    """Epoch ms from an ISO date/time (UTC unless it has an offset) or epoch seconds."""
+    try:
+        return int(float(s) * 1000)
+    except ValueError:
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m tags.export", description="Export tag history to a columnar file.")
+    ap.add_argument("--tags", required=True, help="comma-separated tag names")
+    ap.add_argument("--start", required=True, help="ISO time (UTC) or epoch seconds")
+    ap.add_argument("--end", default=None, help="ISO time (UTC) or epoch seconds (default: now)")
+    ap.add_argument("--interval", type=int, default=10, help="grid step in seconds")
+    ap.add_argument("--format", choices=FORMATS, default=None, help="default: parquet if pyarrow is installed, else npz")
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args(argv)
+
+    from tags.historian import open_reader
+
+    tags = [t.strip() for t in args.tags.split(",") if t.strip()]
+    start = _parse_time(args.start)
+    end = _parse_time(args.end) if args.end else int(time.time() * 1000)
+    reader = open_reader()
+
+    t0 = time.perf_counter()
+    size = 0
+    try:
+        with open(args.out, "wb") as f:
+            for data in export(reader.iter_query, tags, start, end, args.interval, args.format):
+                f.write(data)
+                size += len(data)
+    except ValueError as e:
+        ap.error(str(e))
+    finally:
+        reader.close()
+    print(f"{args.out}: {size} bytes in {time.perf_counter() - t0:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# tags/framing.py
+"""
+Host side of the usb_comm wire protocol (see io-bridge usb_comm.h).
+
+  uint32  magic  = 0xDEADBEEF
+  uint16  len    = total frame bytes incl. header and CRC trailer
+  uint8   seq
+  uint8   object_id
+  uint8   cmd_id
+  uint8   flags
+  uint8   payload[]
+  [uint16 crc16 | uint32 crc32]   only if negotiated (see flags)
+
+Flags:
+  FLAG_CRC16 / FLAG_CRC32   request carries a CRC trailer and asks the
+                            device to protect its reply the same way
+  FLAG_CRC_ACK              set by the device on replies that carry a
+                            trailer; legacy firmware just echoes the
+                            request flags, so no ACK means no trailer
+
+The CRC covers header + payload. CRC-16 is CRC-16/CCITT-FALSE
+(poly 0x1021, init 0xFFFF), CRC-32 is the zlib/IEEE CRC.
+"""
+
+import binascii
+import struct
+import zlib
+from typing import NamedTuple
+
+MAGIC = 0xDEADBEEF
+MAGIC_BYTES = struct.pack("<I", MAGIC)
+
+HEADER_FMT = "<I H B B B B"
+HEADER = struct.Struct(HEADER_FMT)
+HEADER_SIZE = HEADER.size
+
+# Largest frame the firmware can emit (UsbComm::TX_BUFFER_SIZE). Anything
+# longer is a corrupted length field, not a frame worth waiting for.
+MAX_FRAME_LEN = 512
+
+FLAG_CRC16 = 0x01
+FLAG_CRC32 = 0x02
+FLAG_CRC_MASK = FLAG_CRC16 | FLAG_CRC32
+FLAG_CRC_ACK = 0x80
+
+CRC_MODES = {
+    None: 0,
+    "crc16": FLAG_CRC16,
+    "crc32": FLAG_CRC32,
+}
+
+# Link-level object handled by usb_comm itself
+OBJ_SYS = 0
+SYS_CMD_HELLO = 0x00
+SYS_CMD_READ_STATS = 0x01
+
+# SYS_CMD_READ_STATS reply: uint32 each, in this order (UsbComm::Stats,
+# preceded by uptime). Firmware only ever appends fields.
+FW_STATS_FIELDS = (
+    "uptime_ms",
+    "rx_bytes",
+    "frames_ok",
+    "frames_bad_magic",
+    "frames_bad_len",
+    "frames_no_handler",
+    "frames_handler_false",
+    "rx_overflow",
+    "rx_resync_drops",
+    "frames_bad_crc",
+)
+
+_CRC16 = struct.Struct("<H")
+_CRC32 = struct.Struct("<I")
+
+
+def crc16(data) -> int:
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def crc32(data) -> int:
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def trailer_size(flags: int) -> int:
+    if flags & FLAG_CRC32:
+        return 4
+    if flags & FLAG_CRC16:
+        return 2
+    return 0
+
+
+def _crc_bytes(flags: int, data) -> bytes:
+    if flags & FLAG_CRC32:
+        return _CRC32.pack(crc32(data))
+    if flags & FLAG_CRC16:
+        return _CRC16.pack(crc16(data))
+    return b""
+
+
+def build_frame(seq: int, obj_id: int, cmd_id: int, payload: bytes = b"", flags: int = 0) -> bytes:
+    """
+    Build a request frame. If flags carries a CRC bit, the trailer is appended.
+    """
+    length = HEADER_SIZE + len(payload) + trailer_size(flags)
+    body = HEADER.pack(MAGIC, length, seq, obj_id, cmd_id, flags) + payload
+    return body + _crc_bytes(flags, body)
+
+
+class Frame(NamedTuple):
+    seq: int
+    object_id: int
+    cmd_id: int
+    flags: int
+    payload: bytes
+
+
+class FrameParser:
+    """
+    Incremental reply parser.
+
+    Resync uses bytearray.find() to jump straight to the next MAGIC
+    instead of discarding one byte per iteration. A bad length or CRC
+    costs one byte and a rescan, so a corrupted header never makes the
+    parser wait for (or accept) bytes that are not a frame.
+
+    Counters are written to `stats` (any object with resync_drops,
+    bad_len and bad_crc attributes, e.g. PollStats).
+
+    crc_flags is the negotiated CRC mode (0 until negotiated). Once set,
+    every reply must carry FLAG_CRC_ACK and that trailer; a frame without
+    them is rejected like a CRC failure, so a flipped flags bit cannot
+    switch the check off.
+    """
+
+    def __init__(self, stats):
+        self.rx = bytearray()
+        self.stats = stats
+        self.crc_flags = 0
+
+    def feed(self, data: bytes):
+        if data:
+            self.rx += data
+
+    def clear(self):
+        self.rx.clear()
+
+    def _drop(self, n: int):
+        del self.rx[:n]
+        self.stats.resync_drops += n
+
+    def resync(self):
+        """
+        Give up on whatever frame is at the head of the buffer and skip
+        to the next MAGIC (used before a retry).
+        """
+        if not self.rx:
+            return
+        i = self.rx.find(MAGIC_BYTES, 1)
+        self._drop(i if i > 0 else len(self.rx))
+
+    def next_frame(self) -> Frame | None:
+        rx = self.rx
+
+        while len(rx) >= HEADER_SIZE:
+            i = rx.find(MAGIC_BYTES)
+            if i < 0:
+                # Keep a possible partial MAGIC at the tail
+                self._drop(len(rx) - (len(MAGIC_BYTES) - 1))
+                return None
+            if i:
+                self._drop(i)
+                if len(rx) < HEADER_SIZE:
+                    return None
+
+            _, length, seq, obj, cmd, flags = HEADER.unpack_from(rx)
+            if self.crc_flags:
+                if flags & (FLAG_CRC_ACK | FLAG_CRC_MASK) != FLAG_CRC_ACK | self.crc_flags:
+                    self.stats.bad_crc += 1
+                    self._drop(1)
+                    continue
+                trailer = trailer_size(self.crc_flags)
+            else:
+                trailer = trailer_size(flags) if flags & FLAG_CRC_ACK else 0
+
+            if length < HEADER_SIZE + trailer or length > MAX_FRAME_LEN:
+                self.stats.bad_len += 1
+                self._drop(1)
+                continue
+
+            if len(rx) < length:
+                return None
+
+            if trailer:
+                body = memoryview(rx)[: length - trailer]
+                ok = _crc_bytes(flags, body) == rx[length - trailer : length]
+                body.release()
+                if not ok:
+                    self.stats.bad_crc += 1
+                    self._drop(1)
+                    continue
+
+            payload = bytes(rx[HEADER_SIZE : length - trailer])
+            del rx[:length]
+            return Frame(seq, obj, cmd, flags, payload)
+
+        return None
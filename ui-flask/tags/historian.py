@@ -6,20 +6,59 @@ Historian manager.
 - Attaches QuestDB historian when available
 - Detaches if QuestDB goes away
 - Flask/runtime code never cares which backend is active
+
+RASPIPLC_HISTORIAN selects the backend: "questdb" (default, as above),
+"sqlite" (embedded file, tags/historian_sqlite.py) or "null".
+
+Writes are write-behind: record() appends to a bounded in-memory queue
+and returns; a writer thread drains it in batches (FLUSH_ROWS rows or
+FLUSH_INTERVAL_SEC, whichever comes first) through the backend's
+record_batch(). When the queue is full the oldest samples are dropped
+and counted, so callers never block on historian I/O.
+
+While no database is attached (or a batch write fails) the writer puts
+rows into a disk spool (tags/historian_spool.py) instead of dropping
+them, and replays the spool after reattach at up to
+REPLAY_ROWS_PER_SEC, only when the live queue is not backed up.
+Set RASPIPLC_SPOOL=0 to disable. The spool holds compressed rows;
+their rollups were built from the raw samples when they were queued.
+
+Tags with a "historian" entry in the device schema are compressed
+(deadband + swinging door, tags/historian_compress.py) before the
+backend write. Queued rows, uncompressed, feed rollup tiers (tags/historian_rollup.py); query()
+reads the coarsest tier that fits the interval where the rollups are
+known complete (Coverage, saved in ROLLUP_COVERAGE_PATH) and raw
+samples everywhere else: the still-open tail, history from before the
+rollups, and gaps left by a crash or a failed rollup write. Both paths
+aggregate good-quality samples only; for compressed tags the raw path
+only sees the archived points, so its averages can differ from the
+rollups' by up to the compression deviation. Results of sealed time blocks are
+cached (tags/history_cache.py).
 """
 
+import os
 import platform
 import socket
 import threading
 import time
+from collections import deque
+from pathlib import Path
 import logging
 log = logging.getLogger(__name__)
 
+from tags import metrics
+from tags.historian_compress import TagCompressor
 from tags.historian_null import NullHistorian
+from tags.historian_rollup import Coverage, Rollups, pick_tier
+from tags.historian_spool import Spool
+from tags.history_cache import HistoryCache
+from tags import registry
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
+HISTORIAN_BACKEND = os.environ.get("RASPIPLC_HISTORIAN", "questdb").lower()
+
 QUESTDB_HOST = "127.0.0.1"
 if platform.system() == "Windows":
     QUESTDB_HOST = "smoker.lan"
@@ -27,6 +66,25 @@ QUESTDB_PORT = 9009
 RETRY_INTERVAL_SEC = 5.0
 SOCKET_TIMEOUT_SEC = 0.25
 
+# Write-behind queue
+QUEUE_MAX_ROWS = 100_000
+FLUSH_ROWS = 5_000
+FLUSH_INTERVAL_SEC = 0.5
+
+# Store-and-forward spool
+SPOOL_ENABLED = os.environ.get("RASPIPLC_SPOOL", "1") != "0" and HISTORIAN_BACKEND != "null"
+REPLAY_BATCH_ROWS = 2_000
+REPLAY_ROWS_PER_SEC = 20_000
+
+# Time ranges with complete rollups, per tier (see historian_rollup.Coverage)
+ROLLUP_COVERAGE_PATH = Path(os.environ.get(
+    "RASPIPLC_ROLLUP_COVERAGE", f"data/rollup_coverage_{HISTORIAN_BACKEND}.json"
+))
+
+# Tags that live in the store but are not process data: the pollers'
+# diag.<device>.* link counters are exported via /metrics, not archived
+NOT_ARCHIVED_PREFIXES = ("diag.",)
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -58,7 +116,40 @@ class HistorianManager:
         self._backend_name = "null"
         self._stop_evt = threading.Event()
 
+        # Write-behind queue of (tag, value, quality, ts) rows
+        self._queue = deque()
+        self._queue_cv = threading.Condition()
+        self._writing = False
+        self.rows_queued = 0
+        self.rows_written = 0
+        self.rows_dropped = 0       # overflow: oldest rows discarded
+        self.rows_failed = 0        # backend raised on the batch
+        self.batches = 0
+        self._batch_hist = metrics.Histogram()
+
+        # Only the writer thread touches the spool
+        self._spool = None
+        if SPOOL_ENABLED:
+            try:
+                self._spool = Spool()
+            except OSError as e:
+                log.info(f"[Historian] spool disabled: {e}")
+        self._replay_at = 0.0
+
+        # Only the writer thread adds to the rollups
+        self._rollups = Rollups()
+        self._coverage = Coverage(ROLLUP_COVERAGE_PATH if HISTORIAN_BACKEND != "null" else None)
+        self.rollup_rows = 0
+        self.rollup_failed = 0
+
+        self._cache = HistoryCache()
+
+        # Per-tag compression state (None: store every sample)
+        self._compressors: dict[str, TagCompressor | None] = {}
+        self.rows_compressed = 0
+
         log.info("[Historian] Starting in NULL mode")
+        metrics.register_collector(self.collect_metrics)
 
         # Background attach / health thread
         self._thread = threading.Thread(
@@ -68,38 +159,162 @@ class HistorianManager:
         )
         self._thread.start()
 
+        self._writer = threading.Thread(
+            target=self._writer_loop,
+            name="HistorianWriter",
+            daemon=True,
+        )
+        self._writer.start()
+
     # ------------------------
     # Public API (proxy)
     # ------------------------
 
-    def record(self, tag: str, value, quality="good"):
+    def record(self, tag: str, value, quality="good", ts=None):
         """
         Record a tag value (non-blocking).
         Always safe to call.
+
+        ts is the acquisition time (epoch seconds); defaults to now.
         """
-        with self._lock:
-            self._backend.record(tag, value, quality)
-    
+        self.record_batch([(tag, value, quality, time.time() if ts is None else ts)])
+
+    def record_batch(self, rows):
+        """
+        Queue (tag, value, quality, ts) rows for the writer thread.
+        Never blocks; on overflow the oldest queued rows are dropped.
+        """
+        with self._queue_cv:
+            q = self._queue
+            q.extend(rows)
+            self.rows_queued += len(rows)
+            over = len(q) - QUEUE_MAX_ROWS
+            if over > 0:
+                for _ in range(over):
+                    q.popleft()
+                self.rows_dropped += over
+            if len(q) >= FLUSH_ROWS:
+                self._queue_cv.notify()
+
+    def handle_tag_entries(self, entries: dict):
+        """
+        Record tag-store entries with their own acquisition timestamp
+        and quality.
+
+        Expects: { tag_name: (value, ts, quality, ...) }
+        """
+        self.record_batch([
+            (tag, entry[0], entry[2], entry[1])
+            for tag, entry in entries.items()
+            if not tag.startswith(NOT_ARCHIVED_PREFIXES)
+        ])
+
     def handle_tag_updates(self, updates: dict):
         """
         Backwards-compatible handler for legacy callers.
 
         Expects: { tag_name: value }
         """
-        for tag, value in updates.items():
-            try:
-                self.record(tag, value)
-            except Exception:
-                # Never let historian failures break runtime
-                pass
+        now = time.time()
+        self.record_batch([
+            (tag, value, "good", now)
+            for tag, value in updates.items()
+            if not tag.startswith(NOT_ARCHIVED_PREFIXES)
+        ])
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until everything queued so far has been handed to the
+        backend. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._queue_cv:
+            self._queue_cv.notify()
+        while self._queue or self._writing:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @property
+    def backend_name(self) -> str:
+        """"questdb", "sqlite", or "null" while no backend is attached."""
+        return self._backend_name
+
+    def query(self, tags, start_ts, end_ts, interval):
+        """
+        Query historical data: per-interval rows between start_ts and
+        end_ts (epoch ms). Returns [] if the backend fails.
+
+        Served through the result cache; see _query() for the backend side.
+        """
+        if self._backend_name == "null":
+            return []
+        try:
+            return self._cache.query(self._query, tags, start_ts, end_ts, interval)
+        except Exception as e:
+            log.warning(f"[Historian] query failed: {e}")
+            return []
 
-    def query(self, *args, **kwargs):
+    def _query(self, tags, start_ts, end_ts, interval):
         """
-        Query historical data.
+        Rollup buckets come from the coarsest tier that divides interval
+        where that tier's coverage says they are complete; everything
+        else (open buckets, older history, gaps) from raw samples.
         """
+        backend, plan = self._plan(start_ts, end_ts, interval)
+        rows = []
+        for tier, lo, hi in plan:
+            if tier is None:
+                rows += backend.query(tags, lo, hi, interval)
+            else:
+                rows += backend.query_rollup(tier, tags, lo, hi, interval)
+        return rows
+
+    def iter_query(self, tags, start_ts, end_ts, interval):
+        """
+        Same buckets as query(), streamed from the backend as
+        (ts_ms, tag, value) tuples in time order. Bypasses the result
+        cache, and backend errors are raised, not swallowed.
+        """
+        backend, plan = self._plan(start_ts, end_ts, interval)
+        for tier, lo, hi in plan:
+            if tier is None:
+                yield from backend.iter_query(tags, lo, hi, interval)
+            else:
+                yield from backend.iter_query_rollup(tier, tags, lo, hi, interval)
+
+    def _plan(self, start_ts, end_ts, interval):
+        """(backend, [(tier or None for raw, start_ms, end_ms)])"""
         with self._lock:
-            return self._backend.query(*args, **kwargs)
-    
+            backend = self._backend
+
+        tier = pick_tier(interval, self._rollups.tiers)
+        if tier is None:
+            return backend, [(None, start_ts, end_ts)]
+
+        # Covered ranges shrunk to interval boundaries, so no output
+        # bucket mixes sources
+        step = int(interval) * 1000
+        plan = []
+        t = start_ts
+        for lo, hi in self._coverage.ranges(tier):
+            lo_ms = -(-int(lo * 1000) // step) * step
+            hi_ms = int(hi * 1000) // step * step
+            a, b = max(t, lo_ms), min(end_ts, hi_ms - 1)
+            if a > b:
+                continue
+            if t < a:
+                plan.append((None, t, a - 1))
+            plan.append((tier, a, b))
+            t = b + 1
+        if t <= end_ts:
+            plan.append((None, t, end_ts))
+        return backend, plan
+
     def query_history(self, *args, **kwargs):
         """
         Backwards-compatible alias for legacy callers.
@@ -107,6 +322,186 @@ class HistorianManager:
         return self.query(*args, **kwargs)
 
 
+    def collect_metrics(self):
+        yield metrics.gauge(
+            "raspiplc_historian_backend",
+            "Active historian backend (1 = active)",
+            [({"backend": self._backend_name}, 1)],
+        )
+        yield metrics.gauge("raspiplc_historian_queue_depth", "Rows waiting for the writer",
+                            [({}, len(self._queue))])
+        yield metrics.counter("raspiplc_historian_rows_queued_total", "Rows accepted into the queue",
+                              [({}, self.rows_queued)])
+        yield metrics.counter("raspiplc_historian_rows_written_total", "Rows handed to the backend",
+                              [({}, self.rows_written)])
+        yield metrics.counter("raspiplc_historian_rows_dropped_total", "Rows dropped on queue overflow",
+                              [({}, self.rows_dropped)])
+        yield metrics.counter("raspiplc_historian_rows_failed_total", "Rows lost to backend errors",
+                              [({}, self.rows_failed)])
+        yield metrics.counter("raspiplc_historian_rows_compressed_total", "Rows dropped by deadband / swinging-door compression",
+                              [({}, self.rows_compressed)])
+        yield metrics.histogram("raspiplc_historian_batch_seconds", "Backend time per batch",
+                                [({}, self._batch_hist)])
+
+        cache = self._cache
+        yield metrics.counter("raspiplc_historian_cache_hits_total", "History blocks served from the cache",
+                              [({}, cache.hits)])
+        yield metrics.counter("raspiplc_historian_cache_misses_total", "History blocks queried from the backend",
+                              [({}, cache.misses)])
+        yield metrics.counter("raspiplc_historian_cache_evictions_total", "History blocks evicted (LRU)",
+                              [({}, cache.evictions)])
+        yield metrics.gauge("raspiplc_historian_cache_rows", "Rows held by the history cache",
+                            [({}, cache.rows)])
+        yield metrics.counter("raspiplc_historian_rollup_rows_total", "Rollup buckets written",
+                              [({}, self.rollup_rows)])
+        yield metrics.counter("raspiplc_historian_rollup_failed_total", "Rollup buckets lost to backend errors",
+                              [({}, self.rollup_failed)])
+
+        spool = self._spool
+        if spool is not None:
+            yield metrics.gauge("raspiplc_historian_spool_rows", "Rows waiting in the disk spool",
+                                [({}, spool.pending_rows())])
+            yield metrics.counter("raspiplc_historian_spooled_rows_total", "Rows written to the disk spool",
+                                  [({}, spool.rows_spooled)])
+            yield metrics.counter("raspiplc_historian_replayed_rows_total", "Spooled rows replayed to the backend",
+                                  [({}, spool.rows_replayed)])
+            yield metrics.counter("raspiplc_historian_spool_dropped_rows_total", "Spooled rows discarded by the size cap",
+                                  [({}, spool.rows_dropped)])
+
+    # ------------------------
+    # Writer
+    # ------------------------
+
+    def _writer_loop(self):
+        while not self._stop_evt.is_set():
+            timeout = FLUSH_INTERVAL_SEC
+            if self._replay_due():
+                timeout = min(timeout, max(0.0, self._replay_at - time.monotonic()))
+
+            with self._queue_cv:
+                if len(self._queue) < FLUSH_ROWS:
+                    self._queue_cv.wait(timeout)
+                n = min(len(self._queue), FLUSH_ROWS)
+                batch = [self._queue.popleft() for _ in range(n)]
+                self._writing = bool(n)
+                backlog = len(self._queue)
+
+            try:
+                if batch:
+                    self._write(batch)
+                if self._backend_name != "null":
+                    self._close_rollups(time.time())
+                # Live rows first: replay only when the queue is keeping up
+                if backlog < FLUSH_ROWS and self._replay_due() and time.monotonic() >= self._replay_at:
+                    self._replay()
+            except Exception as e:
+                # Never let historian failures kill the writer
+                log.info(f"[Historian] writer error: {e}")
+            finally:
+                self._writing = False
+
+    def _compress(self, batch):
+        out = []
+        comps = self._compressors
+        for row in batch:
+            tag = row[0]
+            comp = comps.get(tag, False)
+            if comp is False:
+                tag_def = registry.TAGS.get(tag)
+                spec = tag_def.historian if tag_def is not None else None
+                comp = comps[tag] = TagCompressor(tag, spec) if spec is not None else None
+            if comp is None:
+                out.append(row)
+            else:
+                comp.feed(row, out)
+        self.rows_compressed += len(batch) - len(out)
+        return out
+
+    def _write(self, batch, live=True):
+        """
+        live: batch comes from the queue; it is compressed, and folded
+        into the rollups here, whatever happens to the archived rows
+        (spooled rows are not folded in again on replay). False for rows
+        the compressors already produced (held points flushed on stop).
+        """
+        if live:
+            rows = self._compress(batch)
+            if HISTORIAN_BACKEND != "null":
+                # Rollups see every sample, not just the archived ones
+                self._write_rollups(self._rollups.add(batch))
+        else:
+            rows = batch
+        n = len(rows)
+        t0 = time.perf_counter()
+        try:
+            with self._lock:
+                if self._backend_name == "null" and self._spool is not None:
+                    self._spool.append(rows)
+                    return
+                self._backend.record_batch(rows)
+            self.rows_written += n
+            self._cache.archived(r[3] for r in rows)
+        except Exception as e:
+            # The monitor detaches a backend that has gone away; keep
+            # the rows until then
+            log.info(f"[Historian] batch of {n} failed: {e}")
+            if self._spool is not None:
+                self._spool.append(rows)
+            else:
+                self.rows_failed += n
+        finally:
+            self.batches += 1
+            self._batch_hist.observe(time.perf_counter() - t0)
+
+    def _close_rollups(self, now: float):
+        self._write_rollups(self._rollups.close_due(now))
+        # Everything before the watermark is written (or its failure
+        # already taken out of the coverage)
+        for tier in self._rollups.tiers:
+            wm = self._rollups.watermark(tier)
+            if wm is not None:
+                self._coverage.extend(tier, wm)
+
+    def _write_rollups(self, closed):
+        for tier, rows in closed.items():
+            try:
+                with self._lock:
+                    if self._backend_name == "null":
+                        # Rollups are not spooled
+                        raise RuntimeError("no backend attached")
+                    self._backend.record_rollups(tier, rows)
+                self.rollup_rows += len(rows)
+            except Exception as e:
+                self.rollup_failed += len(rows)
+                log.info(f"[Historian] {len(rows)} rollup row(s) for {tier}s failed: {e}")
+                # Queries read raw samples for these buckets from now on
+                self._coverage.remove(tier, min(r[1] for r in rows), max(r[1] for r in rows) + tier)
+
+    def _replay_due(self) -> bool:
+        spool = self._spool
+        return spool is not None and self._backend_name != "null" and spool.pending_rows() > 0
+
+    def _replay(self):
+        spool = self._spool
+        rows = spool.read(REPLAY_BATCH_ROWS)
+        if not rows:
+            return
+        with self._lock:
+            if self._backend_name == "null":
+                return
+            try:
+                self._backend.record_batch(rows)
+            except Exception as e:
+                # Rows stay in the spool; retry after the next interval
+                log.info(f"[Historian] replay of {len(rows)} row(s) failed: {e}")
+                self._replay_at = time.monotonic() + RETRY_INTERVAL_SEC
+                return
+        spool.commit()
+        self._cache.invalidate(min(r[3] for r in rows), max(r[3] for r in rows))
+        self._replay_at = time.monotonic() + len(rows) / REPLAY_ROWS_PER_SEC
+        if not spool.pending_rows():
+            log.info(f"[Historian] spool replay complete ({spool.rows_replayed} row(s))")
+
     # ------------------------
     # Backend management
     # ------------------------
@@ -121,6 +516,7 @@ class HistorianManager:
             backend = QuestDBHistorian(QUESTDB_HOST, QUESTDB_PORT)
             self._backend = backend
             self._backend_name = "questdb"
+            self._cache.clear()
 
             log.info("[Historian] QuestDB attached (ILP 9009)")
         except Exception as e:
@@ -128,14 +524,27 @@ class HistorianManager:
             self._backend = NullHistorian()
             self._backend_name = "null"
 
+    def _attach_sqlite(self):
+        try:
+            from tags.historian_sqlite import SQLiteHistorian
+
+            self._backend = SQLiteHistorian()
+            self._backend_name = "sqlite"
+            self._cache.clear()
+        except Exception as e:
+            log.info(f"[Historian] SQLite attach failed: {e}")
+            self._backend = NullHistorian()
+            self._backend_name = "null"
+
     def _detach_backend(self):
-        log.info("[Historian] QuestDB disconnected, falling back to NULL")
+        log.info(f"[Historian] {self._backend_name} disconnected, falling back to NULL")
         try:
             self._backend.close()
         except Exception:
             pass
         self._backend = NullHistorian()
         self._backend_name = "null"
+        self._cache.clear()
 
     # ------------------------
     # Monitor loop
@@ -143,18 +552,28 @@ class HistorianManager:
 
     def _monitor_loop(self):
         """
-        Periodically check QuestDB availability and attach/detach as needed.
+        Periodically check QuestDB availability and attach/detach as needed
+        (or, in sqlite mode, retry opening the database until it works).
         """
+        if HISTORIAN_BACKEND not in ("questdb", "sqlite"):
+            log.info(f"[Historian] backend {HISTORIAN_BACKEND!r}: staying in NULL mode")
+            return
+
         while not self._stop_evt.is_set():
             try:
-                available = _questdb_available()
+                if HISTORIAN_BACKEND == "sqlite":
+                    with self._lock:
+                        if self._backend_name == "null":
+                            self._attach_sqlite()
+                else:
+                    available = _questdb_available()
 
-                with self._lock:
-                    if available and self._backend_name == "null":
-                        self._attach_questdb()
+                    with self._lock:
+                        if available and self._backend_name == "null":
+                            self._attach_questdb()
 
-                    elif not available and self._backend_name == "questdb":
-                        self._detach_backend()
+                        elif not available and self._backend_name == "questdb":
+                            self._detach_backend()
 
             except Exception as e:
                 # Never let historian monitoring kill the app
@@ -167,8 +586,46 @@ class HistorianManager:
     # ------------------------
 
     def stop(self):
+        self.flush()
         self._stop_evt.set()
+        with self._queue_cv:
+            self._queue_cv.notify()
         self._thread.join(timeout=1.0)
+        self._writer.join(timeout=1.0)
+
+        held = []
+        for comp in self._compressors.values():
+            if comp is not None:
+                comp.flush(held)
+        if held:
+            self._write(held, live=False)
+        if self._backend_name != "null":
+            self._write_rollups(self._rollups.flush_all())
+        self._coverage.save()
+        with self._lock:
+            self._backend.close()
+        if self._spool is not None:
+            self._spool.close()
+
+
+# ---------------------------------------------------------------------------
+# Read-only access (tools running outside the app)
+# ---------------------------------------------------------------------------
+
+
+def open_reader():
+    """
+    The configured backend for queries only: no writer, no spool, no
+    monitor. Used by tools (e.g. python -m tags.export) that run next
+    to the app.
+    """
+    if HISTORIAN_BACKEND == "sqlite":
+        from tags.historian_sqlite import SQLiteHistorian
+        return SQLiteHistorian()
+    if HISTORIAN_BACKEND == "questdb":
+        from tags.historian_questdb import QuestDBHistorian
+        return QuestDBHistorian(QUESTDB_HOST, QUESTDB_PORT, ingest=False)
+    return NullHistorian()
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,142 @@
+# tags/historian_compress.py
+"""
+Per-tag historian compression, applied by the writer thread before rows
+reach the backend (rollups still see every sample).
+
+Two stages, as in classic plant historians:
+
+  exception     drop a sample unless it differs from the last one passed
+                by more than `deadband`. When a sample does pass, the
+                last dropped one is passed too, so the slope into the
+                change is kept.
+  compression   swinging door: of the samples that passed exception,
+                archive only those needed to redraw the trend within
+                `compression` by straight lines between archived points.
+
+`deadband` / `compression` are absolute, or percent of the reference
+value's magnitude when given as "<n>%". A quality change always
+archives, and `max_interval` (s) forces a point at least that often.
+
+Configured per field in devices.json:
+
+    "pid.pv": { ..., "historian": { "deadband": 0.05, "compression": 0.2, "max_interval": 600 } }
+
+Tags without a "historian" entry are stored uncompressed.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+# (tag, value, quality, ts), as queued by HistorianManager
+Row = tuple
+
+
+@dataclass(frozen=True)
+class CompressionSpec:
+    deadband: float = 0.0
+    deadband_pct: bool = False
+    compression: float = 0.0
+    compression_pct: bool = False
+    max_interval: Optional[float] = None
+
+    @classmethod
+    def parse(cls, spec: dict) -> "CompressionSpec":
+        def dev(key):
+            v = spec.get(key, 0)
+            if isinstance(v, str) and v.strip().endswith("%"):
+                return float(v.strip()[:-1]) / 100.0, True
+            return float(v), False
+
+        deadband, deadband_pct = dev("deadband")
+        compression, compression_pct = dev("compression")
+        max_interval = spec.get("max_interval")
+        unknown = set(spec) - {"deadband", "compression", "max_interval"}
+        if unknown:
+            raise ValueError(f"unknown historian option(s): {sorted(unknown)}")
+        return cls(
+            deadband, deadband_pct, compression, compression_pct,
+            float(max_interval) if max_interval else None,
+        )
+
+
+class TagCompressor:
+    """Exception + swinging-door state for one tag."""
+    __slots__ = (
+        "spec", "tag",
+        "exc_ref", "exc_skipped",
+        "arch", "held", "lo", "hi",
+    )
+
+    def __init__(self, tag: str, spec: CompressionSpec):
+        self.spec = spec
+        self.tag = tag
+        self.exc_ref = None         # last row passed by exception
+        self.exc_skipped = None     # last row dropped by exception
+        self.arch = None            # last archived row
+        self.held = None            # candidate, not archived yet
+        self.lo = float("-inf")     # door slopes from arch
+        self.hi = float("inf")
+
+    def _dev(self, dev: float, pct: bool, ref: float) -> float:
+        return dev * abs(ref) if pct else dev
+
+    # ------------------------
+
+    def feed(self, row: Row, out: List[Row]):
+        """Append the rows to archive for this sample to out."""
+        _, value, quality, ts = row
+        if not isinstance(value, (int, float)):
+            self._archive(row, out)
+            return
+
+        spec = self.spec
+        ref = self.exc_ref
+        heartbeat = bool(spec.max_interval) and self.arch is not None and ts - self.arch[3] >= spec.max_interval
+        forced = ref is None or quality != ref[2] or ts < ref[3] or heartbeat
+        if not forced and abs(value - ref[1]) <= self._dev(spec.deadband, spec.deadband_pct, ref[1]):
+            self.exc_skipped = row
+            return
+
+        skipped, self.exc_skipped = self.exc_skipped, None
+        if skipped is not None and not heartbeat and skipped[3] <= ts:
+            self._compress(skipped, out, False)
+        self.exc_ref = row
+        self._compress(row, out, forced)
+
+    def _compress(self, row: Row, out: List[Row], forced: bool):
+        if forced or not self.spec.compression or self.arch is None:
+            # Keep the line into a forced point
+            if forced and self.held is not None:
+                self._archive(self.held, out)
+            self._archive(row, out)
+            return
+
+        a = self.arch
+        dt = row[3] - a[3]
+        if dt > 0 and not self.lo <= (row[1] - a[1]) / dt <= self.hi:
+            # Outside the door: the held point is needed, restart from it
+            self._archive(self.held, out)
+            a = self.arch
+            dt = row[3] - a[3]
+        if dt <= 0:
+            self._archive(row, out)
+            return
+
+        dev = self._dev(self.spec.compression, self.spec.compression_pct, a[1])
+        self.lo = max(self.lo, (row[1] - dev - a[1]) / dt)
+        self.hi = min(self.hi, (row[1] + dev - a[1]) / dt)
+        self.held = row
+
+    def _archive(self, row: Row, out: List[Row]):
+        out.append(row)
+        self.arch = row
+        self.held = None
+        self.lo, self.hi = float("-inf"), float("inf")
+
+    def flush(self, out: List[Row]):
+        """Archive the held and the last dropped point (shutdown)."""
+        if self.held is not None:
+            self._archive(self.held, out)
+        skipped, self.exc_skipped = self.exc_skipped, None
+        if skipped is not None and (self.arch is None or skipped[3] > self.arch[3]):
+            self._archive(skipped, out)
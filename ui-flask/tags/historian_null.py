@@ -9,14 +9,29 @@ class NullHistorian:
     Safe default when no real historian is available.
     """
 
-    def record(self, tag: str, value, quality="good"):
+    def record(self, tag: str, value, quality="good", ts=None):
         # Intentionally do nothing
         return
 
+    def record_batch(self, rows):
+        return
+
+    def record_rollups(self, tier, rows):
+        return
+
     def query(self, *args, **kwargs):
         # No history available
         return []
 
+    def query_rollup(self, *args, **kwargs):
+        return []
+
+    def iter_query(self, *args, **kwargs):
+        return iter(())
+
+    def iter_query_rollup(self, *args, **kwargs):
+        return iter(())
+
     def close(self):
         # Optional cleanup hook
         return
@@ -1,14 +1,58 @@
 # tags/historian_questdb.py
 
+import csv
+import itertools
 import time
 import logging
 import requests
-from urllib.parse import quote
+from requests.adapters import HTTPAdapter
 import logging
 
+import numpy as np
+
 
 log = logging.getLogger(__name__)
-from questdb.ingress import Sender, Protocol, TimestampNanos
+from tags.downsample import epoch_seconds
+from questdb.ingress import Sender, Protocol, TimestampMicros, TimestampNanos
+
+
+QUERY_TIMEOUT_SEC = 2.0
+HTTP_POOL_SIZE = 4
+# Result rows parsed (and yielded by iter_query) per step
+QUERY_CHUNK_ROWS = 5_000
+
+# Aggregates per source table; the column names are what _sample_by() parses.
+# Raw averages skip bad-quality samples, as the rollups do.
+_RAW_AGGREGATES = "avg(value) AS value, min(value) AS min, max(value) AS max"
+_RAW_FILTER = "AND quality = 'good'"
+_ROLLUP_AGGREGATES = "sum(sum) / sum(count) AS value, min(min) AS min, max(max) AS max"
+
+
+def _sql_str(s: str) -> str:
+    """SQL string literal; QuestDB's HTTP API has no bind variables."""
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def _columns(col_idx: dict, rows: list) -> dict:
+    """CSV rows -> columns; numbers are parsed with one NumPy call per column."""
+    columns = list(zip(*rows))
+
+    def floats(name):
+        col = np.array(columns[col_idx[name]])
+        return np.where((col == "") | (col == "null"), "nan", col).astype(np.float64)
+
+    return {
+        "tag": columns[col_idx["tag"]],
+        "timestamp": columns[col_idx["timestamp"]],
+        "value": floats("value"),
+        "min": floats("min"),
+        "max": floats("max"),
+    }
+
+
+def _nullable(a: np.ndarray) -> list:
+    """float64 column as a list, NaN (SQL null) as None."""
+    return np.where(np.isnan(a), None, a).tolist()
 
 
 class QuestDBHistorian:
@@ -21,10 +65,21 @@ class QuestDBHistorian:
     - raises on failure so HistorianManager can react
     """
 
-    def __init__(self, host="127.0.0.1", port=9009):
+    def __init__(self, host="127.0.0.1", port=9009, ingest=True):
 
         self.host = host
         self.port = port
+
+        # Keep-alive HTTP connections for queries (/exp on port 9000)
+        self._http = requests.Session()
+        self._http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+        self._exp_url = f"http://{host}:9000/exp"
+
+        if not ingest:
+            # Query-only (export CLI): no ILP connection, no probe row
+            self.sender = None
+            self.closed = True
+            return
         self.sender = Sender(
             Protocol.Tcp,
             host,
@@ -58,15 +113,16 @@ class QuestDBHistorian:
     # Public API (matches HistorianManager expectations)
     # ------------------------------------------------------------------
 
-    def record(self, tag: str, value, quality="good"):
+    def record(self, tag: str, value, quality="good", ts=None):
         """
-        Record a single tag sample.
+        Record a single tag sample at its acquisition time ts (epoch
+        seconds), or now if ts is None.
 
         Raises on failure so the manager can detach.
         """
         if self.closed:
             raise RuntimeError("Sender is closed")  
-        ts_ns = time.time_ns()
+        ts_ns = time.time_ns() if ts is None else int(ts * 1_000_000_000)
 
         try:
             self.sender.row(
@@ -86,71 +142,153 @@ class QuestDBHistorian:
             # Let the manager handle fallback
             raise
 
+    def record_batch(self, rows):
+        """
+        Write (tag, value, quality, ts) rows and flush once: one ILP
+        write per batch instead of one per sample.
+
+        Raises on failure so the manager can react.
+        """
+        if self.closed:
+            raise RuntimeError("Sender is closed")
+
+        sender = self.sender
+        for tag, value, quality, ts in rows:
+            sender.row(
+                "tag_history",
+                symbols={
+                    "tag": tag,
+                    "quality": str(quality),
+                },
+                columns={
+                    "value": float(value),
+                },
+                at=TimestampNanos(int(ts * 1_000_000_000)),
+            )
+        sender.flush()
+
+    def close(self):
+        self._http.close()
+        if self.sender is not None and not self.closed:
+            self.closed = True
+            self.sender.close()
+
+    def record_rollups(self, tier: int, rows):
+        """
+        Write closed rollup buckets (see tags/historian_rollup.py) to
+        tag_rollup_<tier>s. Partial rows for the same bucket are combined
+        by query_rollup().
+        """
+        if self.closed:
+            raise RuntimeError("Sender is closed")
+
+        sender = self.sender
+        table = f"tag_rollup_{tier}s"
+        for tag, start, vmin, vmax, vsum, count, last, last_ts in rows:
+            sender.row(
+                table,
+                symbols={"tag": tag},
+                columns={
+                    "min": float(vmin),
+                    "max": float(vmax),
+                    "sum": float(vsum),
+                    "count": int(count),
+                    "last": float(last),
+                    "last_ts": TimestampMicros(int(last_ts * 1_000_000)),
+                },
+                at=TimestampNanos(int(start * 1_000_000_000)),
+            )
+        sender.flush()
+
     def query(self, tags, start_ts, end_ts, interval):
         """
-        Query historical tag data from QuestDB via HTTP SQL.
+        Query historical tag data from QuestDB via HTTP SQL: averages of
+        good-quality samples per interval.
 
         Returns rows in the format:
         {
-            "timestamp": <int ns>,
+            "timestamp": <ISO str>,
             "tag": <str>,
             "value": <float>,
+            "min": <float>,
+            "max": <float>,
             "quality": <str>
         }
         """
+        return self._rows(self._sample_by("tag_history", _RAW_AGGREGATES, tags, start_ts, end_ts, interval, _RAW_FILTER))
 
-        if not tags:
-            return []
+    def query_rollup(self, tier: int, tags, start_ts, end_ts, interval):
+        """
+        Same as query(), read from the tag_rollup_<tier>s table.
+        interval must be a multiple of tier.
+        """
+        return self._rows(self._sample_by(
+            f"tag_rollup_{int(tier)}s", _ROLLUP_AGGREGATES, tags, start_ts, end_ts, interval,
+        ))
+
+    def iter_query(self, tags, start_ts, end_ts, interval):
+        """
+        query() as (ts_ms, tag, value) tuples, streamed: rows are yielded
+        chunk by chunk while the /exp response is still being received.
+        """
+        return self._tuples(self._sample_by("tag_history", _RAW_AGGREGATES, tags, start_ts, end_ts, interval, _RAW_FILTER))
+
+    def iter_query_rollup(self, tier: int, tags, start_ts, end_ts, interval):
+        return self._tuples(self._sample_by(
+            f"tag_rollup_{int(tier)}s", _ROLLUP_AGGREGATES, tags, start_ts, end_ts, interval,
+        ))
+
+    @staticmethod
+    def _rows(chunks):
+        return [
+            {"timestamp": ts, "tag": tag, "value": v, "min": lo, "max": hi, "quality": None}
+            for cols in chunks
+            for ts, tag, v, lo, hi in zip(
+                cols["timestamp"], cols["tag"],
+                _nullable(cols["value"]), _nullable(cols["min"]), _nullable(cols["max"]),
+            )
+        ]
 
-        # Build IN ('tag1','tag2',...)
-        tag_list = ",".join(f"'{t}'" for t in tags)
+    @staticmethod
+    def _tuples(chunks):
+        for cols in chunks:
+            ts_ms = np.rint(epoch_seconds(cols["timestamp"]) * 1000).astype(np.int64)
+            yield from zip(ts_ms.tolist(), cols["tag"], _nullable(cols["value"]))
+
+    def _sample_by(self, table, aggregates, tags, start_ts, end_ts, interval, where=""):
+        """
+        Run a SAMPLE BY query through /exp (CSV) on the pooled session.
+        The response is streamed and parsed QUERY_CHUNK_ROWS rows at a
+        time; yields per chunk {"tag", "timestamp": [str], "value", "min",
+        "max": float64 arrays (NaN for null)}.
+        """
+        if not tags:
+            return
 
         sql = f"""SELECT
                     tag,
-                    avg(value) AS value,
+                    {aggregates},
                     timestamp
-                FROM tag_history
-                WHERE tag IN ({tag_list})
-                AND timestamp BETWEEN {start_ts*1000} AND {end_ts*1000}
-                SAMPLE BY {interval}s
+                FROM {table}
+                WHERE tag IN ({",".join(_sql_str(t) for t in tags)})
+                AND timestamp BETWEEN {int(start_ts) * 1000} AND {int(end_ts) * 1000}
+                {where}
+                SAMPLE BY {int(interval)}s
                 ORDER BY timestamp;
         """
-        encoded_sql = quote(sql)
-        base_url = f"http://{self.host}:9000"
-        url = f"{base_url}/exec?query={encoded_sql}&fmt=json"
 
         try:
-            resp = requests.get(url,timeout=2)
-            resp.raise_for_status()
-            payload = resp.json()
-
+            with self._http.get(self._exp_url, params={"query": sql}, timeout=QUERY_TIMEOUT_SEC, stream=True) as resp:
+                resp.raise_for_status()
+                resp.encoding = resp.encoding or "utf-8"
+                reader = csv.reader(line for line in resp.iter_lines(decode_unicode=True) if line)
+                header = next(reader, None)
+                if not header:
+                    return
+                col_idx = {name: i for i, name in enumerate(header)}
+                while chunk := list(itertools.islice(reader, QUERY_CHUNK_ROWS)):
+                    yield _columns(col_idx, chunk)
         except Exception as e:
+            # Raise so the manager's cache does not keep an empty result
             log.warning("[QuestDB] query failed: %s", e)
-            return []
-
-        # QuestDB returns column-oriented JSON
-        columns = payload.get("columns", [])
-        dataset = payload.get("dataset", [])
-
-        if not columns or not dataset:
-            return []
-
-        col_idx = {col["name"]: i for i, col in enumerate(columns)}
-
-        rows = []
-        for row in dataset:
-            try:
-                rows.append(
-                    {
-                        "timestamp": row[col_idx["timestamp"]],
-                        "tag": row[col_idx["tag"]],
-                        "value": row[col_idx["value"]],
-                        "quality": row[col_idx.get("quality", -1)]
-                        if "quality" in col_idx
-                        else None,
-                    }
-                )
-            except Exception as e:
-                log.debug("[QuestDB] bad row skipped: %s (%s)", row, e)
-
-        return rows
+            raise
@@ -0,0 +1,249 @@
+# tags/historian_rollup.py
+"""
+Incremental rollups for long-range history queries.
+
+For every tier (bucket width in seconds) and tag the writer keeps one
+open bucket with min / max / sum / count / last. When a sample lands in
+a later bucket, or the bucket is ROLLUP_GRACE_SEC past its end, the
+bucket is closed and handed to the backend's record_rollups(). Samples
+older than the open bucket (spool replay, reordering) are grouped into
+their own partial buckets.
+
+All five aggregates compose, so a backend can store several partial
+rows for the same (tag, bucket) and combine them at query time (or
+merge on insert): min of mins, max of maxes, sum(sum) / sum(count), last
+by last_ts. A query at interval I reads the coarsest tier that divides
+I, so its cost depends on the window / tier, not on how many raw
+samples were written.
+
+Rollups are only complete for the time ranges in Coverage (below):
+history recorded before rollups existed, buckets left open by a crash
+and rollup writes that failed are not covered, and queries read raw
+samples there instead.
+
+Rollups aggregate every sample, the raw table only what compression
+archived (tags/historian_compress.py). For uncompressed tags both give
+the same averages; for compressed tags a raw average is over the
+archived points, which can differ from the rollup average by up to
+the tag's deadband / compression deviation. min / max can miss
+extremes that compression judged redundant.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+ROLLUP_TIERS = (10, 60, 900, 3600)
+ROLLUP_GRACE_SEC = 2.0
+
+# The live range's end is saved at most this often; a crash loses at
+# most this much coverage, which then falls back to raw samples
+COVERAGE_SAVE_SEC = 10.0
+
+# (tag, bucket_start, min, max, sum, count, last, last_ts)
+RollupRow = Tuple[str, float, float, float, float, int, float, float]
+
+
+class _Bucket:
+    __slots__ = ("start", "min", "max", "sum", "count", "last", "last_ts")
+
+    def __init__(self, start: float, value: float, ts: float):
+        self.start = start
+        self.min = self.max = self.sum = self.last = value
+        self.count = 1
+        self.last_ts = ts
+
+    def add(self, value: float, ts: float):
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.sum += value
+        self.count += 1
+        if ts >= self.last_ts:
+            self.last = value
+            self.last_ts = ts
+
+    def row(self, tag: str) -> RollupRow:
+        return (tag, self.start, self.min, self.max, self.sum, self.count, self.last, self.last_ts)
+
+
+def pick_tier(interval: float, tiers=ROLLUP_TIERS) -> Optional[int]:
+    """Coarsest tier whose buckets tile the requested interval, or None."""
+    best = None
+    for tier in tiers:
+        if tier <= interval and interval % tier == 0:
+            best = tier
+    return best
+
+
+class Rollups:
+    """
+    Open buckets per tier. Not thread-safe: owned by the historian writer
+    thread; watermark() may be read from other threads.
+    """
+
+    def __init__(self, tiers=ROLLUP_TIERS):
+        self.tiers = tuple(tiers)
+        self._open: Dict[int, Dict[str, _Bucket]] = {t: {} for t in self.tiers}
+        self._watermark: Dict[int, float] = {}
+
+    def add(self, rows) -> Dict[int, List[RollupRow]]:
+        """
+        Fold (tag, value, quality, ts) rows in. Returns the buckets this
+        closed, per tier. Bad-quality samples are not aggregated.
+        """
+        closed: Dict[int, List[RollupRow]] = {}
+        for tier in self.tiers:
+            open_ = self._open[tier]
+            out = []
+            late: Dict[Tuple[str, float], _Bucket] = {}
+            for tag, value, quality, ts in rows:
+                if quality != "good" or not isinstance(value, (int, float)):
+                    continue
+                start = ts - ts % tier
+                b = open_.get(tag)
+                if b is None or start > b.start:
+                    if b is not None:
+                        out.append(b.row(tag))
+                    open_[tag] = _Bucket(start, value, ts)
+                elif start == b.start:
+                    b.add(value, ts)
+                else:
+                    lb = late.get((tag, start))
+                    if lb is None:
+                        late[(tag, start)] = _Bucket(start, value, ts)
+                    else:
+                        lb.add(value, ts)
+            out.extend(b.row(tag) for (tag, _), b in late.items())
+            if out:
+                closed[tier] = out
+        return closed
+
+    def close_due(self, now: float, grace: float = ROLLUP_GRACE_SEC) -> Dict[int, List[RollupRow]]:
+        """Close buckets that ended more than grace seconds before now."""
+        closed: Dict[int, List[RollupRow]] = {}
+        for tier in self.tiers:
+            open_ = self._open[tier]
+            due = [tag for tag, b in open_.items() if b.start + tier + grace <= now]
+            if due:
+                closed[tier] = [open_.pop(tag).row(tag) for tag in due]
+            self._watermark[tier] = min((b.start for b in open_.values()), default=now - now % tier)
+        return closed
+
+    def flush_all(self) -> Dict[int, List[RollupRow]]:
+        closed = {}
+        for tier in self.tiers:
+            open_ = self._open[tier]
+            if open_:
+                closed[tier] = [b.row(tag) for tag, b in open_.items()]
+                open_.clear()
+        return closed
+
+    def watermark(self, tier: int) -> Optional[float]:
+        """
+        Start of the oldest still-open bucket of a tier (epoch seconds):
+        rollups before it are complete, after it they are not written yet.
+        """
+        return self._watermark.get(tier)
+
+
+class Coverage:
+    """
+    Per tier, the time ranges whose rollups are complete: sorted,
+    disjoint [lo, hi) lists in epoch seconds, saved to a JSON file so
+    they survive restarts.
+
+    This run covers its tiers from the first bucket boundary after it
+    started (the bucket open at startup may lack samples from before)
+    up to the watermark, via extend(). remove() takes out buckets whose
+    rollup write failed. Thread-safe: the writer thread updates it,
+    query threads read ranges().
+    """
+
+    def __init__(self, path: Optional[Path], tiers=ROLLUP_TIERS, now: Optional[float] = None):
+        self.path = None if path is None else Path(path)
+        self.tiers = tuple(tiers)
+        self._lock = threading.Lock()
+        self._ranges: Dict[int, List[List[float]]] = {t: [] for t in self.tiers}
+        now = time.time() if now is None else now
+        # Start of the range this run extends, and that range once added
+        self._live_lo = {t: math.ceil(now / t) * t for t in self.tiers}
+        self._live: Dict[int, Optional[List[float]]] = {t: None for t in self.tiers}
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            for tier in self.tiers:
+                self._ranges[tier] = [[float(lo), float(hi)] for lo, hi in data.get(str(tier), []) if hi > lo]
+        except (OSError, ValueError, TypeError) as e:
+            # Unreadable: treat everything as uncovered (raw queries)
+            log.info(f"[Historian] rollup coverage {self.path} ignored: {e}")
+            self._ranges = {t: [] for t in self.tiers}
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            data = json.dumps({str(t): r for t, r in self._ranges.items()})
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(data)
+            os.replace(tmp, self.path)
+            self._saved_at = time.monotonic()
+        except OSError as e:
+            log.info(f"[Historian] rollup coverage not saved: {e}")
+
+    def ranges(self, tier: int) -> List[Tuple[float, float]]:
+        with self._lock:
+            return sorted((lo, hi) for lo, hi in self._ranges.get(tier, ()))
+
+    def extend(self, tier: int, watermark: float):
+        """Rollups of tier are complete up to watermark (exclusive)."""
+        with self._lock:
+            live = self._live[tier]
+            if live is None:
+                if watermark <= self._live_lo[tier]:
+                    return
+                self._live[tier] = [self._live_lo[tier], watermark]
+                self._ranges[tier].append(self._live[tier])
+                due = True
+            else:
+                if watermark <= live[1]:
+                    return
+                live[1] = watermark
+                due = time.monotonic() - self._saved_at >= COVERAGE_SAVE_SEC
+        if due:
+            self.save()
+
+    def remove(self, tier: int, lo: float, hi: float):
+        """Rollups of tier in [lo, hi) are incomplete."""
+        with self._lock:
+            live = self._live[tier]
+            out = []
+            for r in self._ranges[tier]:
+                a, b = r
+                if b <= lo or a >= hi:
+                    out.append(r)
+                    continue
+                if a < lo:
+                    out.append([a, lo])
+                if b > hi and r is not live:
+                    out.append([hi, b])
+            if hi > self._live_lo[tier]:
+                # This run's coverage restarts after the gap on the next extend()
+                self._live[tier] = None
+                self._live_lo[tier] = hi
+            self._ranges[tier] = out
+        self.save()
@@ -0,0 +1,218 @@
+# tags/historian_spool.py
+"""
+Disk spool for historian rows that could not be delivered.
+
+HistorianManager writes here while no database backend is attached (or
+a batch write fails) and replays from here once one is back, so an
+outage leaves no gap in the trends.
+
+Storage is a directory of fixed-size, memory-mapped segment files
+(SEGMENT_BYTES each), append-only:
+
+    header   "<4sIIII"  magic, write_off, read_off, rows, rows_read
+    records  "<ddBH"    ts, value, quality code, len(tag)  + tag (utf-8)
+
+write_off / read_off live in the mapped header, so the spool survives
+a restart: leftover segments are picked up and replayed. A segment is
+deleted once it has been fully read. When the spool exceeds MAX_BYTES
+the oldest segment is discarded and its unread rows are counted as
+dropped.
+
+Single-threaded by design: only the historian writer thread touches it.
+"""
+
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import List, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+from tags.encoding import QUALITY_CODES
+
+SPOOL_DIR = Path(os.environ.get("RASPIPLC_SPOOL_DIR", "data/spool"))
+SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_BYTES = 256 * 1024 * 1024
+
+MAGIC = b"RPSG"
+_HEADER = struct.Struct("<4sIIII")
+HEADER_SIZE = 32
+_RECORD = struct.Struct("<ddBH")
+
+_QUALITY_NAMES = {code: name for name, code in QUALITY_CODES.items()}
+
+
+class _Segment:
+    __slots__ = ("path", "seq", "_file", "mm", "write_off", "read_off", "rows", "rows_read")
+
+    def __init__(self, path: Path, seq: int, create: bool = False):
+        self.path = path
+        self.seq = seq
+        self._file = open(path, "w+b" if create else "r+b")
+        if create:
+            self._file.truncate(SEGMENT_BYTES)
+        self.mm = mmap.mmap(self._file.fileno(), SEGMENT_BYTES)
+
+        if create:
+            self.write_off = self.read_off = HEADER_SIZE
+            self.rows = self.rows_read = 0
+            self._sync_header()
+        else:
+            magic, self.write_off, self.read_off, self.rows, self.rows_read = _HEADER.unpack_from(self.mm)
+            if magic != MAGIC:
+                self.close()
+                raise ValueError(f"{path}: not a spool segment")
+
+    def _sync_header(self):
+        _HEADER.pack_into(self.mm, 0, MAGIC, self.write_off, self.read_off, self.rows, self.rows_read)
+
+    def append(self, rows, start: int) -> int:
+        """Append rows[start:] until full; returns the index reached."""
+        mm = self.mm
+        off = self.write_off
+        i = start
+        for i in range(start, len(rows)):
+            tag, value, quality, ts = rows[i]
+            name = tag.encode()
+            end = off + _RECORD.size + len(name)
+            if end > SEGMENT_BYTES:
+                break
+            _RECORD.pack_into(mm, off, ts, float(value), QUALITY_CODES.get(quality, 0), len(name))
+            mm[off + _RECORD.size:end] = name
+            off = end
+        else:
+            i = len(rows)
+        self.rows += i - start
+        self.write_off = off
+        self._sync_header()
+        return i
+
+    def read(self, max_rows: int) -> Tuple[List[tuple], int]:
+        """Rows from read_off on; returns (rows, offset after them)."""
+        mm = self.mm
+        off = self.read_off
+        out = []
+        while off < self.write_off and len(out) < max_rows:
+            ts, value, code, n = _RECORD.unpack_from(mm, off)
+            off += _RECORD.size
+            tag = bytes(mm[off:off + n]).decode()
+            off += n
+            out.append((tag, value, _QUALITY_NAMES.get(code, "bad"), ts))
+        return out, off
+
+    def consume(self, off: int, n: int):
+        self.read_off = off
+        self.rows_read += n
+        self._sync_header()
+
+    @property
+    def unread(self) -> int:
+        return self.rows - self.rows_read
+
+    def close(self):
+        try:
+            self.mm.flush()
+            self.mm.close()
+        finally:
+            self._file.close()
+
+
+class Spool:
+    def __init__(self, directory: Path = SPOOL_DIR, max_bytes: int = MAX_BYTES):
+        self.dir = Path(directory)
+        self.max_segments = max(2, max_bytes // SEGMENT_BYTES)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_dropped = 0       # discarded by the size cap
+
+        self._segments: List[_Segment] = []
+        for path in sorted(self.dir.glob("*.seg")):
+            try:
+                self._segments.append(_Segment(path, int(path.stem)))
+            except (ValueError, OSError) as e:
+                log.info(f"[Spool] skipping {path.name}: {e}")
+        self._pending = None
+
+        if self._segments:
+            log.info(f"[Spool] {self.pending_rows()} row(s) left from a previous run in {self.dir}")
+
+    # ------------------------
+    # Write side
+    # ------------------------
+
+    def append(self, rows):
+        i = 0
+        while i < len(rows):
+            if not self._segments or self._segments[-1].write_off + _RECORD.size >= SEGMENT_BYTES:
+                self._new_segment()
+            seg = self._segments[-1]
+            j = seg.append(rows, i)
+            if j == i:
+                # Record does not fit even in a fresh segment
+                if seg.rows == 0:
+                    log.info(f"[Spool] dropping oversized row for {rows[i][0]!r}")
+                    self.rows_dropped += 1
+                    i += 1
+                    continue
+                self._new_segment()
+                continue
+            i = j
+        self.rows_spooled += len(rows)
+
+    def _new_segment(self):
+        seq = self._segments[-1].seq + 1 if self._segments else 0
+        self._segments.append(_Segment(self.dir / f"{seq:08d}.seg", seq, create=True))
+        while len(self._segments) > self.max_segments:
+            oldest = self._segments.pop(0)
+            self.rows_dropped += oldest.unread
+            log.info(f"[Spool] size cap reached, discarding {oldest.unread} row(s)")
+            self._remove(oldest)
+            self._pending = None
+
+    # ------------------------
+    # Replay side
+    # ------------------------
+
+    def pending_rows(self) -> int:
+        return sum(s.unread for s in self._segments)
+
+    def read(self, max_rows: int) -> List[tuple]:
+        """
+        Oldest unread rows (at most max_rows). They stay in the spool
+        until commit(), so a failed replay is retried.
+        """
+        self._pending = None
+        for seg in self._segments:
+            if seg.unread:
+                rows, off = seg.read(max_rows)
+                self._pending = (seg, off, len(rows))
+                return rows
+        return []
+
+    def commit(self):
+        if self._pending is None:
+            return
+        seg, off, n = self._pending
+        self._pending = None
+        seg.consume(off, n)
+        self.rows_replayed += n
+        if not seg.unread and seg is not self._segments[-1]:
+            self._segments.remove(seg)
+            self._remove(seg)
+
+    # ------------------------
+
+    def _remove(self, seg: _Segment):
+        seg.close()
+        try:
+            seg.path.unlink()
+        except OSError as e:
+            log.info(f"[Spool] could not remove {seg.path.name}: {e}")
+
+    def close(self):
+        for seg in self._segments:
+            seg.close()
+        self._segments = []
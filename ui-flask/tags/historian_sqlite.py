@@ -1,104 +1,169 @@
-# tags/historian.py
+# tags/historian_sqlite.py
 
+import os
 import sqlite3
 import threading
 import time
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import logging
 log = logging.getLogger(__name__)
 
+from tags.encoding import QUALITY_CODES
+from tags.historian_rollup import ROLLUP_TIERS
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 
-DB_PATH = Path("data/tag_history.sqlite")
-
-HISTORIAN_TAGS = {
-    "tic1.sp",
-    "tic1.pid.pv",
-    "tic1.pid.cv",
-    "tic1.tc.mode",
-}
-
-DEFAULT_QUALITY = "good"
-
+DB_PATH = Path(os.environ.get("RASPIPLC_SQLITE_DB", "data/tag_history.sqlite"))
+
+_QUALITY_NAMES = {code: name for name, code in QUALITY_CODES.items()}
+
+# Samples are clustered by (tag_id, ts): one B-tree, no rowid, no
+# secondary indexes, so an insert touches a single page run per tag and a
+# range query for one tag is a contiguous scan. ts is epoch microseconds.
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tag_names (
+        id      INTEGER PRIMARY KEY,
+        name    TEXT    NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS tag_samples (
+        tag_id  INTEGER NOT NULL,
+        ts      INTEGER NOT NULL,
+        value   REAL,
+        quality INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, ts)
+    ) WITHOUT ROWID;
+"""
+
+# One table per rollup tier, same clustering; ts is the bucket start (us).
+_ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tag_rollup_{tier} (
+        tag_id  INTEGER NOT NULL,
+        ts      INTEGER NOT NULL,
+        min_v   REAL    NOT NULL,
+        max_v   REAL    NOT NULL,
+        sum_v   REAL    NOT NULL,
+        count   INTEGER NOT NULL,
+        last_v  REAL    NOT NULL,
+        last_ts INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, ts)
+    ) WITHOUT ROWID;
+"""
 
 
 # ---------------------------------------------------------------------------
 # Historian class
 # ---------------------------------------------------------------------------
 
-class TagHistorian:
-    def __init__(self, db_path: Path = DB_PATH):
-        self.db_path = db_path
-        self._lock = threading.Lock()
-        self._conn = None
+class SQLiteHistorian:
+    """
+    Embedded historian backend for nodes without QuestDB.
 
-        self._open_db()
-        self._init_schema()
+    Writes arrive in batches from HistorianManager's writer thread; each
+    record_batch() is one transaction. Reads use their own connection
+    (WAL lets them run alongside the writer) and stream from the cursor.
 
-    # ---------------------------------------------------------------------
+    Raises on failure so HistorianManager can react.
+    """
 
-    def _open_db(self):
+    def __init__(self, db_path: Path = DB_PATH):
+        self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        self._conn = sqlite3.connect(
-            self.db_path,
-            check_same_thread=False
-        )
-        self._conn.execute("PRAGMA journal_mode=WAL;")
-        self._conn.execute("PRAGMA synchronous=NORMAL;")
-
-    # ---------------------------------------------------------------------
-
-    def _init_schema(self):
-        with self._conn:
-            self._conn.execute("""
-                CREATE TABLE IF NOT EXISTS tag_history (
-                    ts      INTEGER NOT NULL,
-                    tag     TEXT    NOT NULL,
-                    value   REAL,
-                    quality TEXT    NOT NULL
-                )
-            """)
-
-            self._conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_tag_history_ts
-                    ON tag_history(ts)
-            """)
-
-            self._conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_tag_history_tag_ts
-                    ON tag_history(tag, ts)
-            """)
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(_SCHEMA)
+        for tier in ROLLUP_TIERS:
+            self._conn.executescript(_ROLLUP_SCHEMA.format(tier=int(tier)))
+        self._load_ids()
+        log.info(f"[Historian] SQLite historian opened ({self.db_path})")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def _load_ids(self):
+        self._ids = {
+            name: tag_id
+            for tag_id, name in self._conn.execute("SELECT id, name FROM tag_names")
+        }
 
     # ---------------------------------------------------------------------
-    # WRITE PATH (called by runtime)
+    # WRITE PATH (called by HistorianManager's writer thread)
     # ---------------------------------------------------------------------
 
-    def handle_tag_updates(self, updates: dict):
-        if not updates:
+    def _tag_id(self, name: str) -> int:
+        tag_id = self._ids.get(name)
+        if tag_id is None:
+            cur = self._conn.execute("INSERT INTO tag_names (name) VALUES (?)", (name,))
+            tag_id = self._ids[name] = cur.lastrowid
+        return tag_id
+
+    def record(self, tag: str, value, quality="good", ts=None):
+        self.record_batch([(tag, value, quality, time.time() if ts is None else ts)])
+
+    def record_batch(self, rows):
+        """
+        Insert (tag, value, quality, ts) rows in a single transaction.
+        A repeated (tag, ts) replaces the earlier sample.
+        """
+        if not rows:
             return
-
-        ts = int(time.time() * 1000)
-
-        rows = [
-            (ts, tag, float(value), DEFAULT_QUALITY)
-            for tag, value in updates.items()
-            if tag in HISTORIAN_TAGS
-        ]
-
+        with self._lock:
+            try:
+                with self._conn:
+                    tag_id = self._tag_id
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO tag_samples (tag_id, ts, value, quality) "
+                        "VALUES (?, ?, ?, ?)",
+                        [
+                            (tag_id(tag), int(ts * 1_000_000), float(value), QUALITY_CODES.get(quality, 0))
+                            for tag, value, quality, ts in rows
+                        ],
+                    )
+            except Exception:
+                # Names inserted by the rolled-back transaction are gone
+                self._load_ids()
+                raise
+
+    def record_rollups(self, tier: int, rows):
+        """
+        Upsert closed rollup buckets; a partial bucket for an existing
+        (tag, ts) is merged into it.
+        """
         if not rows:
             return
-
         with self._lock:
-            self._conn.executemany(
-                "INSERT INTO tag_history (ts, tag, value, quality) "
-                "VALUES (?, ?, ?, ?)",
-                rows
-            )
-            self._conn.commit()
+            try:
+                with self._conn:
+                    tag_id = self._tag_id
+                    self._conn.executemany(
+                        f"""
+                        INSERT INTO tag_rollup_{int(tier)}
+                            (tag_id, ts, min_v, max_v, sum_v, count, last_v, last_ts)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (tag_id, ts) DO UPDATE SET
+                            min_v   = min(min_v, excluded.min_v),
+                            max_v   = max(max_v, excluded.max_v),
+                            sum_v   = sum_v + excluded.sum_v,
+                            count   = count + excluded.count,
+                            last_v  = CASE WHEN excluded.last_ts >= last_ts
+                                           THEN excluded.last_v ELSE last_v END,
+                            last_ts = max(last_ts, excluded.last_ts)
+                        """,
+                        [
+                            (tag_id(tag), int(start * 1_000_000), vmin, vmax, vsum, count,
+                             last, int(last_ts * 1_000_000))
+                            for tag, start, vmin, vmax, vsum, count, last, last_ts in rows
+                        ],
+                    )
+            except Exception:
+                self._load_ids()
+                raise
 
     # ---------------------------------------------------------------------
     # READ PATH (used by REST API)
@@ -112,82 +177,137 @@ class TagHistorian:
         start_ts: Optional[int] = None,
         end_ts: Optional[int] = None,
         limit: Optional[int] = None
-    ) -> List[dict]:
+    ) -> Iterator[tuple]:
+        """
+        Raw samples as (ts_ms, tag, value, quality), ordered by time.
+
+        after_ts (cursor) or start_ts/end_ts (window) are epoch ms. Rows
+        are yielded straight from the cursor, so large ranges are never
+        held in memory.
+        """
+        if not tags:
+            return
+        if after_ts is not None:
+            lo, hi = after_ts * 1000 + 1, None
+        elif start_ts is not None and end_ts is not None:
+            lo, hi = start_ts * 1000 + 1, end_ts * 1000
+        else:
+            return
 
+        placeholders = ",".join("?" for _ in tags)
+        sql = f"""
+            SELECT s.ts / 1000, n.name, s.value, s.quality
+            FROM tag_samples s JOIN tag_names n ON n.id = s.tag_id
+            WHERE n.name IN ({placeholders})
+              AND s.ts >= ?
+        """
+        params = [*tags, lo]
+        if hi is not None:
+            sql += " AND s.ts <= ?"
+            params.append(hi)
+        sql += " ORDER BY s.ts"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        conn = self._connect()
+        try:
+            for ts_ms, tag, value, quality in conn.execute(sql, params):
+                yield ts_ms, tag, value, _QUALITY_NAMES.get(quality, "bad")
+        finally:
+            conn.close()
+
+    # (table, aggregates, filter); raw averages skip bad-quality samples,
+    # as the rollups do (compressed tags still differ, see historian_rollup)
+    _RAW = (
+        "tag_samples",
+        "avg(s.value), min(s.value), max(s.value)",
+        f"AND s.quality = {QUALITY_CODES['good']}",
+    )
+
+    @staticmethod
+    def _rollup(tier: int):
+        return f"tag_rollup_{int(tier)}", "sum(s.sum_v) / sum(s.count), min(s.min_v), max(s.max_v)", ""
+
+    def query(self, tags, start_ts, end_ts, interval):
+        """
+        Averages of good-quality samples per interval-second bucket
+        between start_ts and end_ts (epoch ms), in the same row format as
+        QuestDBHistorian.query().
+        """
+        return self._bucketed(*self._RAW, tags, start_ts, end_ts, interval)
+
+    def query_rollup(self, tier: int, tags, start_ts, end_ts, interval):
+        """
+        Same as query(), read from the tier's rollup table.
+        interval must be a multiple of tier.
+        """
+        return self._bucketed(*self._rollup(tier), tags, start_ts, end_ts, interval)
+
+    def iter_query(self, tags, start_ts, end_ts, interval):
+        """
+        Same buckets as query(), streamed from the cursor as
+        (ts_ms, tag, value) tuples.
+        """
+        return self._iter_bucketed(*self._RAW, tags, start_ts, end_ts, interval)
+
+    def iter_query_rollup(self, tier: int, tags, start_ts, end_ts, interval):
+        return self._iter_bucketed(*self._rollup(tier), tags, start_ts, end_ts, interval)
+
+    def _bucketed_sql(self, table, aggregates, where, tags, interval, ts_expr):
+        bucket = max(1, int(interval)) * 1_000_000
+        placeholders = ",".join("?" for _ in tags)
+        return f"""
+            SELECT
+                {ts_expr.format(bucket=bucket)} AS timestamp,
+                n.name,
+                {aggregates}
+            FROM {table} s JOIN tag_names n ON n.id = s.tag_id
+            WHERE n.name IN ({placeholders})
+              AND s.ts BETWEEN ? AND ?
+              {where}
+            GROUP BY s.tag_id, s.ts / {bucket}
+            ORDER BY s.ts / {bucket}
+        """
+
+    def _bucketed(self, table, aggregates, where, tags, start_ts, end_ts, interval):
         if not tags:
             return []
 
-        placeholders = ",".join("?" for _ in tags)
-        params = list(tags)
+        sql = self._bucketed_sql(
+            table, aggregates, where, tags, interval,
+            "strftime('%Y-%m-%dT%H:%M:%fZ', (s.ts / {bucket}) * {bucket} / 1e6, 'unixepoch')",
+        )
+        conn = self._connect()
+        try:
+            cur = conn.execute(sql, [*tags, start_ts * 1000, end_ts * 1000])
+            return [
+                {"timestamp": ts, "tag": tag, "value": value, "min": vmin, "max": vmax, "quality": None}
+                for ts, tag, value, vmin, vmax in cur
+            ]
+        except sqlite3.Error as e:
+            # Raise so the manager's cache does not keep an empty result
+            log.warning("[SQLite] query failed: %s", e)
+            raise
+        finally:
+            conn.close()
+
+    def _iter_bucketed(self, table, aggregates, where, tags, start_ts, end_ts, interval):
+        if not tags:
+            return
 
-        # -------------------------------------------------------------
-        # Cursor-based path (preferred)
-        # -------------------------------------------------------------
-        if after_ts is not None:
-            sql = f"""
-                SELECT ts, tag, value, quality
-                FROM tag_history
-                WHERE tag IN ({placeholders})
-                  AND ts > ?
-                ORDER BY ts ASC
-            """
-            params.append(after_ts)
-
-            if limit:
-                sql += " LIMIT ?"
-                params.append(limit)
-
-        # -------------------------------------------------------------
-        # Time-window path (legacy / non-live charts)
-        # -------------------------------------------------------------
-        else:
-            if start_ts is None or end_ts is None:
-                return []
-
-            sql = f"""
-                SELECT ts, tag, value, quality
-                FROM tag_history
-                WHERE tag IN ({placeholders})
-                  AND ts > ?
-                  AND ts <= ?
-                ORDER BY ts ASC
-            """
-            params.extend([start_ts, end_ts])
-
-            if limit:
-                sql += " LIMIT ?"
-                params.append(limit)
-
-        cur = self._conn.execute(sql, params)
-        rows = cur.fetchall()
-
-        return [
-            {
-                "ts": row[0],
-                "tag": row[1],
-                "value": row[2],
-                "quality": row[3],
-            }
-            for row in rows
-        ]
+        sql = self._bucketed_sql(table, aggregates, where, tags, interval, "(s.ts / {bucket}) * {bucket} / 1000")
+        conn = self._connect()
+        try:
+            for ts, tag, value, _, _ in conn.execute(sql, [*tags, start_ts * 1000, end_ts * 1000]):
+                yield ts, tag, value
+        finally:
+            conn.close()
 
     # ---------------------------------------------------------------------
 
     def close(self):
-        if self._conn:
-            self._conn.close()
-            self._conn = None
-
-
-# ---------------------------------------------------------------------------
-# Singleton accessor
-# ---------------------------------------------------------------------------
-
-_historian = None
-
-
-def get_historian() -> TagHistorian:
-    global _historian
-    if _historian is None:
-        _historian = TagHistorian()
-    return _historian
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,194 @@
+# tags/history_cache.py
+"""
+Result cache for HistorianManager.query().
+
+Time is cut into blocks of BLOCK_POINTS intervals, aligned to the epoch,
+and results are cached per (tag, interval, block). A block that ended
+more than SEAL_SEC ago is immutable and cached until evicted (LRU, at
+most MAX_ROWS cached rows in total); blocks at the live edge are always
+queried fresh. A request is served from the cached blocks plus one
+backend query per run of consecutive blocks with missing tags (then
+split into blocks), so a cold request costs about as many round trips
+as an uncached one, and charts that reload the same windows, or
+overlapping ones, mostly skip the database.
+A cached first bucket is always the whole bucket, even when start_ts
+falls inside it.
+
+The manager clears the cache when the backend changes and invalidates
+the blocks that a spool replay or a late archived row (a point held by
+historian compression, up to its max_interval or longer) wrote into.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from tags.downsample import epoch_seconds
+
+BLOCK_POINTS = 256
+SEAL_SEC = 10.0
+MAX_ROWS = 500_000
+
+# (tag, interval, block_start_ms) -> (ts_ms array, rows)
+_Key = Tuple[str, int, int]
+
+
+class HistoryCache:
+    def __init__(self, max_rows: int = MAX_ROWS):
+        self.max_rows = max_rows
+        self._blocks: "OrderedDict[_Key, Tuple[np.ndarray, List[dict]]]" = OrderedDict()
+        self._rows = 0      # cached rows, +1 per entry
+        self._gen = 0       # bumped by clear() / invalidate()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def query(self, fetch: Callable[[List[str], int, int, int], List[dict]],
+              tags: List[str], start_ts: int, end_ts: int, interval: int) -> List[dict]:
+        """
+        fetch(tags, start_ms, end_ms, interval) is the uncached query;
+        it must raise (not return []) when the backend fails, so errors
+        are never cached.
+        """
+        interval = int(interval)
+        if interval < 1:
+            raise ValueError(f"interval must be at least 1 s, got {interval}")
+        block_ms = BLOCK_POINTS * interval * 1000
+        sealed_ms = (time.time() - SEAL_SEC) * 1000
+        gen = self._gen
+        out = []
+
+        # Sealed blocks in the range, then the live edge (never cached)
+        blocks = []
+        live = start_ts - start_ts % block_ms
+        while live <= end_ts and live + block_ms - 1 < sealed_ms:
+            blocks.append(live)
+            live += block_ms
+
+        # Runs of consecutive blocks with missing tags: one fetch each
+        cached = {}
+        run = []
+        for block in blocks + [None]:
+            if block is not None:
+                cached[block], missing = self._lookup(tags, interval, block)
+                if missing:
+                    run.append((block, missing))
+                    continue
+            if run:
+                self._fill(fetch, run, interval, block_ms, gen, cached)
+                run = []
+
+        for block in blocks:
+            block_end = block + block_ms - 1
+            whole = start_ts <= block and block_end <= end_ts
+            part = []
+            for tag in tags:
+                ts, rows = cached[block][tag]
+                if whole:
+                    part += rows
+                else:
+                    # Keep the bucket start_ts falls into, as the backend does
+                    lo = np.searchsorted(ts, start_ts - start_ts % (interval * 1000), side="left")
+                    hi = np.searchsorted(ts, end_ts, side="right")
+                    part += rows[lo:hi]
+            part.sort(key=lambda r: r["timestamp"])
+            out += part
+
+        if live <= end_ts:
+            out += fetch(tags, max(live, start_ts), end_ts, interval)
+        return out
+
+    def _fill(self, fetch, run, interval, block_ms, gen, cached):
+        """Fetch the missing tags of consecutive blocks in one query."""
+        first, last = run[0][0], run[-1][0]
+        tags = sorted({tag for _, missing in run for tag in missing})
+        rows = fetch(tags, first, last + block_ms - 1, interval)
+
+        by_block = {block: [] for block, _ in run}
+        ts = epoch_seconds([r["timestamp"] for r in rows]) * 1000 if rows else np.empty(0)
+        for t, r in zip(ts.tolist(), rows):
+            block = first + int(t - first) // block_ms * block_ms
+            if block in by_block:
+                by_block[block].append((t, r))
+        for block, missing in run:
+            cached[block].update(self._store(missing, interval, block, by_block[block], gen))
+
+    def _lookup(self, tags, interval, block):
+        cached, missing = {}, []
+        with self._lock:
+            for tag in tags:
+                key = (tag, interval, block)
+                entry = self._blocks.get(key)
+                if entry is None:
+                    missing.append(tag)
+                else:
+                    self._blocks.move_to_end(key)
+                    cached[tag] = entry
+            self.hits += len(cached)
+            self.misses += len(missing)
+        return cached, missing
+
+    def _store(self, tags, interval, block, rows, gen) -> Dict[str, tuple]:
+        """rows: (ts_ms, row) pairs of this block."""
+        by_tag = {tag: ([], []) for tag in tags}
+        for t, r in rows:
+            entry = by_tag.get(r["tag"])
+            if entry is not None:
+                entry[0].append(t)
+                entry[1].append(r)
+        entries = {tag: (np.array(ts, dtype=np.float64), tag_rows) for tag, (ts, tag_rows) in by_tag.items()}
+
+        with self._lock:
+            if gen != self._gen:
+                # Cleared / invalidated while we were querying
+                return entries
+            for tag, entry in entries.items():
+                key = (tag, interval, block)
+                old = self._blocks.pop(key, None)
+                if old is not None:
+                    self._rows -= len(old[1]) + 1
+                self._blocks[key] = entry
+                self._rows += len(entry[1]) + 1
+            while self._rows > self.max_rows and self._blocks:
+                _, (_, old_rows) = self._blocks.popitem(last=False)
+                self._rows -= len(old_rows) + 1
+                self.evictions += 1
+        return entries
+
+    def archived(self, timestamps):
+        """
+        Rows were just written with these timestamps (epoch seconds).
+        Compression archives held points late, with their own time, so
+        drop the sealed blocks any of them fall into.
+        """
+        sealed = time.time() - SEAL_SEC
+        late = [t for t in timestamps if t < sealed]
+        if late:
+            self.invalidate(min(late), max(late))
+
+    def invalidate(self, start_s: float, end_s: float):
+        """Drop cached blocks overlapping [start_s, end_s] (epoch seconds)."""
+        lo, hi = start_s * 1000, end_s * 1000
+        with self._lock:
+            self._gen += 1
+            stale = [
+                key for key in self._blocks
+                if key[2] <= hi and lo < key[2] + BLOCK_POINTS * key[1] * 1000
+            ]
+            for key in stale:
+                self._rows -= len(self._blocks.pop(key)[1]) + 1
+
+    def clear(self):
+        with self._lock:
+            self._gen += 1
+            self._blocks.clear()
+            self._rows = 0
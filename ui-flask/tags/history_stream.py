@@ -0,0 +1,126 @@
+# tags/history_stream.py
+"""
+Column-oriented, streamed encodings of /api/history results.
+
+The historian yields (ts_ms, tag, value) tuples in time order; they are
+cut into chunks of CHUNK_ROWS and each chunk is sent as soon as it is
+encoded, one block per tag present in it. Timestamps are delta-encoded
+(first timestamp, then the ms step from the previous sample of the same
+tag), so a regular series compresses to a run of equal small ints.
+
+format=columns   application/x-ndjson, one line per tag block:
+
+    {"tag": "tic1.pid.pv", "t0": 1714550400000, "dt": [0, 10000, ...], "v": [225.1, ...]}
+
+format=binary    application/octet-stream, a sequence of blocks (all
+                 little-endian, tag_index = position in the tags param):
+
+    uint16   tag_index
+    uint16   0
+    uint32   n
+    float64  t0           epoch ms of the first sample
+    uint32   dt[n]        dt[0] = 0
+    float32  v[n]
+
+    const dv = new DataView(buf, off);
+    const n  = dv.getUint32(4, true), t0 = dv.getFloat64(8, true);
+    const dt = new Uint32Array(buf, off + 16, n);      // off is 8-aligned
+    const v  = new Float32Array(buf, off + 16 + 4 * n, n);
+    off += 16 + 8 * n;
+
+Blocks of one tag from consecutive chunks simply concatenate.
+"""
+
+import json
+import struct
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+CHUNK_ROWS = 5_000
+
+FORMAT_COLUMNS = "columns"
+FORMAT_BINARY = "binary"
+MIMETYPES = {
+    FORMAT_COLUMNS: "application/x-ndjson",
+    FORMAT_BINARY: "application/octet-stream",
+}
+
+_BLOCK = struct.Struct("<HHId")
+
+
+def _chunks(samples: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for s in samples:
+        if s[2] is None:
+            continue
+        chunk.append(s)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _columns(chunk: List[tuple], tags: List[str]):
+    """Per tag present in the chunk: (index, t0, dt uint32, values)."""
+    index = {tag: i for i, tag in enumerate(tags)}
+    n = len(chunk)
+    ts = np.fromiter((s[0] for s in chunk), dtype=np.int64, count=n)
+    which = np.fromiter((index.get(s[1], -1) for s in chunk), dtype=np.int64, count=n)
+    values = np.fromiter((s[2] for s in chunk), dtype=np.float64, count=n)
+
+    order = np.argsort(which, kind="stable")
+    which, ts, values = which[order], ts[order], values[order]
+    starts = np.flatnonzero(np.r_[True, which[1:] != which[:-1]])
+    for lo, hi in zip(starts, np.r_[starts[1:], n]):
+        i = int(which[lo])
+        if i < 0:
+            continue
+        t = ts[lo:hi]
+        yield i, int(t[0]), np.diff(t, prepend=t[0]).astype(np.uint32), values[lo:hi]
+
+
+def stream_columns(samples: Iterable[tuple], tags: List[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    for chunk in _chunks(samples, chunk_rows):
+        lines = [
+            json.dumps({"tag": tags[i], "t0": t0, "dt": dt.tolist(), "v": v.tolist()})
+            for i, t0, dt, v in _columns(chunk, tags)
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def stream_binary(samples: Iterable[tuple], tags: List[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    for chunk in _chunks(samples, chunk_rows):
+        parts = []
+        for i, t0, dt, v in _columns(chunk, tags):
+            parts.append(_BLOCK.pack(i, 0, len(dt), float(t0)))
+            parts.append(dt.astype("<u4").tobytes())
+            parts.append(v.astype("<f4").tobytes())
+        yield b"".join(parts)
+
+
+STREAMS = {
+    FORMAT_COLUMNS: stream_columns,
+    FORMAT_BINARY: stream_binary,
+}
+
+
+def decode_binary(data: bytes, tags: List[str]) -> dict:
+    """
+    Inverse of stream_binary (for tools and debugging):
+    {tag: (ts_ms int64 array, values float32 array)}.
+    """
+    out = {}
+    off = 0
+    while off < len(data):
+        i, _, n, t0 = _BLOCK.unpack_from(data, off)
+        off += _BLOCK.size
+        dt = np.frombuffer(data, "<u4", n, off)
+        off += 4 * n
+        v = np.frombuffer(data, "<f4", n, off)
+        off += 4 * n
+        ts = int(t0) + np.cumsum(dt, dtype=np.int64)
+        prev = out.get(tags[i])
+        out[tags[i]] = (ts, v) if prev is None else (np.r_[prev[0], ts], np.r_[prev[1], v])
+    return out
@@ -0,0 +1,126 @@
+# tags/metrics.py
+"""
+Instrumentation surface: Prometheus text exposition for /metrics.
+
+Components register a collector, a callable returning an iterable of
+Metric objects, and render() turns the union into the text format
+(https://prometheus.io/docs/instrumenting/exposition_formats/).
+No client library is needed; counters live where they are counted
+(PollStats, the emitter, the historian queue) and are read on scrape.
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+# Round-trip / cycle duration buckets (seconds)
+LATENCY_BUCKETS = (0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus semantics). observe() is a
+    bisect and two adds, cheap enough for the per-frame path.
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+
+class Metric(NamedTuple):
+    name: str
+    kind: str            # "counter" | "gauge" | "histogram"
+    help: str
+    samples: list        # [(labels_dict, value | Histogram)]
+
+
+def counter(name: str, help: str, samples) -> Metric:
+    return Metric(name, "counter", help, list(samples))
+
+
+def gauge(name: str, help: str, samples) -> Metric:
+    return Metric(name, "gauge", help, list(samples))
+
+
+def histogram(name: str, help: str, samples) -> Metric:
+    return Metric(name, "histogram", help, list(samples))
+
+
+# ---------------- Collectors ----------------
+
+_COLLECTORS: List[Callable[[], Iterable[Metric]]] = []
+_lock = threading.Lock()
+
+
+def register_collector(fn: Callable[[], Iterable[Metric]]):
+    with _lock:
+        _COLLECTORS.append(fn)
+
+
+def collect() -> Dict[str, Metric]:
+    """Merge every collector's metrics by name."""
+    with _lock:
+        collectors = list(_COLLECTORS)
+
+    merged: Dict[str, Metric] = {}
+    for fn in collectors:
+        try:
+            metrics = list(fn())
+        except Exception as e:
+            log.info(f"[metrics] collector {fn!r} failed: {e}")
+            continue
+        for m in metrics:
+            if m.name in merged:
+                merged[m.name].samples.extend(m.samples)
+            else:
+                merged[m.name] = Metric(m.name, m.kind, m.help, list(m.samples))
+    return merged
+
+
+# ---------------- Exposition ----------------
+
+def _labels(labels: dict, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(int(v))
+
+
+def render() -> str:
+    out = []
+    for m in collect().values():
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        for labels, value in m.samples:
+            if m.kind == "histogram":
+                acc = 0
+                for bound, n in zip(value.bounds + (float("inf"),), value.counts):
+                    acc += n
+                    le = 'le="%s"' % _num(bound)
+                    out.append(f"{m.name}_bucket{_labels(labels, le)} {acc}")
+                out.append(f"{m.name}_sum{_labels(labels)} {_num(value.sum)}")
+                out.append(f"{m.name}_count{_labels(labels)} {value.count}")
+            else:
+                out.append(f"{m.name}{_labels(labels)} {_num(value)}")
+    return "\n".join(out) + "\n"
@@ -1,133 +1,289 @@
 # tags/poller.py
 
-import time
 import struct
+import time
 from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 import logging
 log = logging.getLogger(__name__)
 
 from tags.usb_comm import UsbComm
-from tags.registry import group_tags_by_command
+from tags.framing import (
+    CRC_MODES,
+    FLAG_CRC_ACK,
+    FW_STATS_FIELDS,
+    OBJ_SYS,
+    SYS_CMD_HELLO,
+    SYS_CMD_READ_STATS,
+    FrameParser,
+    build_frame,
+)
+from tags.registry import DeviceDef, get_group_decoder, group_tags, group_tags_by_command
+from tags.metrics import Histogram
 from tags.state import (
+    QUALITY_BAD,
     get_subscriptions,
-    update_tag,
+    get_subscriptions_version,
+    set_tags_quality,
+    update_tags,
 )
 
-# ---------------- Protocol framing ----------------
+# ---------------- Protocol timing ----------------
 
-MAGIC = 0xDEADBEEF
-HEADER_FMT = "<I H B B B B"
-HEADER_SIZE = struct.calcsize(HEADER_FMT)
-
-RESPONSE_TIMEOUT = 0.15
+RESPONSE_TIMEOUT = 0.15   # upper bound for the per-request timeout
+RESPONSE_TIMEOUT_MIN = 0.02
 MAX_RETRIES = 3
 
+# Successful round-trip latencies kept for percentiles
+LATENCY_SAMPLES = 4096
+
+# How often firmware stats are read and diag.<device>.* tags published
+DIAG_INTERVAL = 5.0
+
+
+@dataclass
+class PollStats:
+    round_trips: int = 0      # requests answered
+    timeouts: int = 0         # requests abandoned after MAX_RETRIES
+    retries: int = 0          # re-sends after a RESPONSE_TIMEOUT
+    resync_drops: int = 0     # rx bytes discarded while hunting for MAGIC
+    bad_len: int = 0          # headers with an impossible length
+    bad_crc: int = 0          # frames failing the CRC trailer check
+    tag_updates: int = 0
+    cycles: int = 0           # completed read cycles
+    writes: int = 0           # writes acknowledged by the device
+    lost_s: float = 0.0       # wall time spent in attempts that got no reply
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    rtt_hist: Histogram = field(default_factory=Histogram)
+    cycle_hist: Histogram = field(default_factory=Histogram)
+
+
+@dataclass
+class WriteResult:
+    """
+    Completion of a write future: the device acknowledged request seq
+    after rtt_s, and values holds the tags refreshed from its reply
+    (or from the read-back, for firmware whose SET replies are empty).
+    """
+    seq: int
+    rtt_s: float
+    values: dict
+
 
 class Poller:
     def __init__(
         self,
         usb: UsbComm,
         poll_interval: float = 0.2,  # seconds
+        device: DeviceDef | None = None,
+        crc: str | None = "crc16",
     ):
         self.usb = usb
         self.poll_interval = poll_interval
+        # When set, only tags whose object_id belongs to this device are polled
+        self.device = device
         self.running = False
 
+        # CRC trailer we ask for ("crc16", "crc32" or None) and the flags
+        # actually in use once the device has acknowledged it
+        self.crc = crc
+        self.tx_flags = 0
+
         self.seq = 0
-        self.rx = bytearray()
+        self._last_flags = 0
+        # Wall-clock acquisition time of the last reply: midpoint of the
+        # successful request/reply exchange, when the device sampled it
+        self.rx_ts = 0.0
+
+        # Adaptive response timeout (Jacobson/Karels, as TCP's RTO):
+        # a lost or corrupted frame costs a few RTTs, not RESPONSE_TIMEOUT
+        self._srtt = None
+        self._rttvar = 0.0
+        self.response_timeout = RESPONSE_TIMEOUT
+        self._link_up = False
 
         # Write command queue (runtime → poller)
         self.write_queue = deque()
 
+        self.stats = PollStats()
+        self.parser = FrameParser(self.stats)
+
+        # Last SYS_CMD_READ_STATS reply ({field: value}); _fw_stats_ok is
+        # None until probed, False for firmware without the command
+        self.fw_stats = {}
+        self._fw_stats_ok = None
+        self._next_diag = 0.0
+
+        # Poll plan [(obj_id, cmd_id, GroupDecoder)], rebuilt only when
+        # the subscription version changes
+        self._plan_version = None
+        self._plan = []
+
     # ------------------------------------------------
     # Public API (used by runtime)
     # ------------------------------------------------
 
-    def enqueue_write(self, obj_id: int, cmd_id: int, payload: bytes = b""):
+    def enqueue_write(self, obj_id: int, cmd_id: int, payload: bytes = b"", read_cmd: int | None = None) -> Future:
         """
         Enqueue a write command.
         Writes always take priority over reads.
+
+        Returns a Future completed with a WriteResult once the device
+        answers the matching seq, with TimeoutError, or with
+        ConnectionError if the link is down. read_cmd names the status
+        read of obj_id whose tags the reply refreshes. A write whose
+        future was cancelled before the poller got to it is not sent.
+        """
+        fut = Future()
+        self.write_queue.append((obj_id, cmd_id, payload, read_cmd, fut))
+        return fut
+
+    def reset_stats(self, latency_samples: int | None = LATENCY_SAMPLES) -> PollStats:
+        """
+        Start a fresh set of counters (latency_samples=None keeps every sample).
         """
-        self.write_queue.append((obj_id, cmd_id, payload))
+        self.stats = PollStats(latencies=deque(maxlen=latency_samples))
+        self.parser.stats = self.stats
+        return self.stats
 
     # ------------------------------------------------
     # Frame helpers
     # ------------------------------------------------
 
-    def _build_frame(self, obj_id: int, cmd_id: int, payload: bytes = b"") -> bytes:
+    def _build_frame(self, obj_id: int, cmd_id: int, payload: bytes = b"", flags: int | None = None) -> bytes:
         self.seq = (self.seq + 1) & 0xFF
-        length = HEADER_SIZE + len(payload)
-
-        header = struct.pack(
-            HEADER_FMT,
-            MAGIC,
-            length,
+        return build_frame(
             self.seq,
             obj_id,
             cmd_id,
-            0
+            payload,
+            self.tx_flags if flags is None else flags,
         )
 
-        return header + payload
+    def _negotiate(self):
+        """
+        Ask the device for CRC-protected frames via a link HELLO.
+
+        Firmware with CRC support answers with FLAG_CRC_ACK and a trailer;
+        legacy firmware echoes the flags without ACK, and we stay plain.
+        """
+        want = CRC_MODES[self.crc]
+        self.tx_flags = 0
+        self.parser.crc_flags = 0
+        if not want:
+            return
+
+        resp = self._send_and_recv(self._build_frame(OBJ_SYS, SYS_CMD_HELLO, flags=want))
+        if resp is not None and self._last_flags & FLAG_CRC_ACK:
+            self.tx_flags = want
+            # From now on replies without the trailer are rejected
+            self.parser.crc_flags = want
+            log.info(f"[poller] {self.crc} frames enabled ({self._name()})")
+        else:
+            log.info(f"[poller] device has no CRC support, using plain frames ({self._name()})")
 
     def _send_and_recv(self, frame: bytes) -> bytes | None:
         """
         Send frame and wait for matching response.
         Returns payload or None on timeout.
         """
-        for _ in range(MAX_RETRIES):
-            self.usb.send(frame)
-            t0 = time.time()
-
-            while time.time() - t0 < RESPONSE_TIMEOUT:
-                self.rx += self.usb.read(512)
-
-                while len(self.rx) >= HEADER_SIZE:
-                    # Resync on MAGIC
-                    if struct.unpack("<I", self.rx[:4])[0] != MAGIC:
-                        del self.rx[0]
-                        continue
-
-                    length = struct.unpack("<H", self.rx[4:6])[0]
-                    if len(self.rx) < length:
-                        break
-
-                    frame = self.rx[:length]
-                    del self.rx[:length]
-
-                    _, _, seq, obj, cmd, _ = struct.unpack(
-                        HEADER_FMT, frame[:HEADER_SIZE]
-                    )
-
-                    if seq == self.seq:
-                        return frame[HEADER_SIZE:length]
-
+        stats = self.stats
+        parser = self.parser
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                stats.retries += 1
+                # Whatever is stuck at the head of the buffer is not our reply
+                parser.resync()
+            if not self.usb.send(frame):
+                # Link is down: fail fast instead of waiting out timeouts
+                return None
+            t0 = time.perf_counter()
+            deadline = t0 + self.response_timeout
+            rejected = stats.bad_crc + stats.bad_len
+
+            while (left := deadline - time.perf_counter()) > 0:
+                # Never block past the response deadline
+                parser.feed(self.usb.read(512, left))
+                if not self.usb.connected:
+                    return None
+
+                while (rx_frame := parser.next_frame()) is not None:
+                    if rx_frame.seq == self.seq:
+                        rtt = time.perf_counter() - t0
+                        stats.round_trips += 1
+                        stats.latencies.append(rtt)
+                        stats.rtt_hist.observe(rtt)
+                        if attempt == 0:
+                            # Karn: only unambiguous samples feed the estimate
+                            self._update_timeout(rtt)
+                        self._last_flags = rx_frame.flags
+                        self.rx_ts = time.time() - rtt / 2
+                        return rx_frame.payload
+
+                if stats.bad_crc + stats.bad_len != rejected and not parser.rx:
+                    # Our reply arrived corrupted and nothing else is
+                    # pending: re-send now rather than wait out the timeout
+                    break
+
+            stats.lost_s += time.perf_counter() - t0
             # retry
+        stats.timeouts += 1
+        # Back off until fresh samples say the device is responsive again
+        self.response_timeout = RESPONSE_TIMEOUT
         return None
 
+    def _update_timeout(self, rtt: float):
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        rto = self._srtt + 4 * self._rttvar
+        self.response_timeout = min(RESPONSE_TIMEOUT, max(RESPONSE_TIMEOUT_MIN, rto))
+
     # ------------------------------------------------
     # Main loop
     # ------------------------------------------------
 
     def run(self):
         self.running = True
-        log.info("[poller] started")
+        log.info(f"[poller] started ({self._name()})")
 
         while self.running:
             start = time.time()
 
+            # ------------------------------------------------
+            # 0) LINK SUPERVISION
+            # ------------------------------------------------
+            if not self.usb.ensure_connected():
+                if self._link_up:
+                    self._link_up = False
+                    self._mark_device_tags_bad()
+                    self._next_diag = start
+                # Never apply a setpoint minutes later, after a reconnect
+                self._fail_writes(ConnectionError(f"link down ({self._name()})"))
+                # link_up=0 (and the counters) stay visible during the outage
+                if start >= self._next_diag:
+                    self._next_diag = start + DIAG_INTERVAL
+                    self._publish_diagnostics()
+                # Sleep until the next reconnect attempt (or udev wakeup)
+                self.usb.wait_for_retry(self.poll_interval * 5)
+                continue
+
+            if not self._link_up:
+                self._link_up = True
+                self.parser.clear()
+                log.info(f"[poller] link up ({self._name()})")
+                self._negotiate()
+                self._fw_stats_ok = None
+
             # ------------------------------------------------
             # 1) WRITE PHASE (highest priority)
             # ------------------------------------------------
             if self.write_queue:
-                obj_id, cmd_id, payload = self.write_queue.popleft()
-                frame = self._build_frame(obj_id, cmd_id, payload)
-
-                payload_rx = self._send_and_recv(frame)
-                if payload_rx is None:
-                    # Write failed / timed out — log if desired
-                    # log.info(f"[poller] WRITE timeout obj={obj_id} cmd={cmd_id}")
-                    pass
+                self._do_write(*self.write_queue.popleft())
 
                 # Do NOT return early — allow multiple writes per cycle
                 continue
@@ -135,15 +291,17 @@ class Poller:
             # ------------------------------------------------
             # 2) READ / POLL PHASE
             # ------------------------------------------------
-            subs = get_subscriptions()
-            if not subs:
+            if start >= self._next_diag:
+                self._next_diag = start + DIAG_INTERVAL
+                self._publish_diagnostics()
+
+            plan = self._poll_plan()
+            if not plan:
                 time.sleep(self.poll_interval)
                 continue
 
-            # Collate tags → (obj_id, cmd_id)
-            groups = group_tags_by_command(list(subs))
-
-            for (obj_id, cmd_id), tags in groups.items():
+            t_cycle = time.perf_counter()
+            for obj_id, cmd_id, decoder in plan:
                 frame = self._build_frame(obj_id, cmd_id)
                 payload = self._send_and_recv(frame)
 
@@ -151,13 +309,17 @@ class Poller:
                     # log.info(f"[poller] no response obj={obj_id} cmd={cmd_id}")
                     continue
 
-                for tag in tags:
-                    try:
-                        value = tag.parser(payload)
-                        update_tag(tag.name, value)
-                        # log.info(f"[poller] {tag.name} = {value}")
-                    except Exception as e:
-                        log.info(f"[poller] parse error {tag.name}: {e}")
+                try:
+                    values = decoder.decode(payload)
+                except Exception as e:
+                    log.info(f"[poller] parse error obj={obj_id} cmd={cmd_id}: {e}")
+                    continue
+
+                update_tags(values, ts=self.rx_ts)
+                self.stats.tag_updates += len(values)
+
+            self.stats.cycles += 1
+            self.stats.cycle_hist.observe(time.perf_counter() - t_cycle)
 
             # ------------------------------------------------
             # Maintain poll rate
@@ -166,7 +328,112 @@ class Poller:
             if dt < self.poll_interval:
                 time.sleep(self.poll_interval - dt)
 
-        log.info("[poller] stopped")
+        log.info(f"[poller] stopped ({self._name()})")
 
     def stop(self):
         self.running = False
+
+    def _fail_writes(self, exc: Exception):
+        while self.write_queue:
+            fut = self.write_queue.popleft()[-1]
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(exc)
+
+    def _do_write(self, obj_id, cmd_id, payload, read_cmd, fut):
+        if not fut.set_running_or_notify_cancel():
+            # The caller gave up waiting (see runtime.on_tag_write)
+            log.info(f"[poller] WRITE cancelled obj={obj_id} cmd={cmd_id}")
+            return
+        t0 = time.perf_counter()
+        payload_rx = self._send_and_recv(self._build_frame(obj_id, cmd_id, payload))
+        if payload_rx is None:
+            log.info(f"[poller] WRITE timeout obj={obj_id} cmd={cmd_id}")
+            fut.set_exception(TimeoutError(f"no reply to write obj={obj_id} cmd={cmd_id}"))
+            return
+        result = WriteResult(self.seq, time.perf_counter() - t0, {})
+        self.stats.writes += 1
+
+        if read_cmd is not None:
+            if not payload_rx:
+                # Firmware without status-bearing SET replies: read back now
+                # rather than wait for the next poll cycle
+                payload_rx = self._send_and_recv(self._build_frame(obj_id, read_cmd))
+            if payload_rx:
+                try:
+                    result.values = get_group_decoder(group_tags(obj_id, read_cmd)).decode(payload_rx)
+                except Exception as e:
+                    log.info(f"[poller] parse error obj={obj_id} cmd={read_cmd}: {e}")
+                update_tags(result.values, ts=self.rx_ts)
+
+        fut.set_result(result)
+
+    def _poll_plan(self) -> list:
+        version = get_subscriptions_version()
+        if version != self._plan_version:
+            # Collate tags → (obj_id, cmd_id) and compile one decoder per group
+            groups = group_tags_by_command(
+                get_subscriptions(),
+                self.device.object_ids if self.device else None,
+            )
+            self._plan = [
+                (obj_id, cmd_id, get_group_decoder(tags))
+                for (obj_id, cmd_id), tags in groups.items()
+            ]
+            self._plan_version = version
+        return self._plan
+
+    def _read_fw_stats(self):
+        """
+        Read UsbComm::Stats from the device. Firmware without
+        SYS_CMD_READ_STATS answers with an empty payload; it is asked once
+        per link-up, not every DIAG_INTERVAL.
+        """
+        if self._fw_stats_ok is False:
+            return
+        payload = self._send_and_recv(self._build_frame(OBJ_SYS, SYS_CMD_READ_STATS))
+        if payload is None:
+            return
+        n = min(len(payload) // 4, len(FW_STATS_FIELDS))
+        if not n:
+            self._fw_stats_ok = False
+            log.info(f"[poller] device has no stats command ({self._name()})")
+            return
+        self._fw_stats_ok = True
+        self.fw_stats = dict(zip(FW_STATS_FIELDS, struct.unpack_from(f"<{n}I", payload)))
+
+    def _publish_diagnostics(self):
+        """
+        Publish link counters (and firmware stats) as diag.<device>.* tags,
+        subscribable like any other tag. Firmware stats are only read
+        while the link is up.
+        """
+        if self._link_up:
+            self._read_fw_stats()
+        s = self.stats
+        prefix = f"diag.{self.device.name if self.device else 'usb'}"
+        values = {
+            f"{prefix}.link_up": int(self._link_up),
+            f"{prefix}.round_trips": s.round_trips,
+            f"{prefix}.timeouts": s.timeouts,
+            f"{prefix}.retries": s.retries,
+            f"{prefix}.resync_drops": s.resync_drops,
+            f"{prefix}.bad_crc": s.bad_crc,
+            f"{prefix}.write_queue": len(self.write_queue),
+            f"{prefix}.rtt_ms": round((self._srtt or 0.0) * 1000, 3),
+            f"{prefix}.cycle_ms": round(s.cycle_hist.sum / s.cycle_hist.count * 1000, 3) if s.cycle_hist.count else 0.0,
+        }
+        for k, v in self.fw_stats.items():
+            values[f"{prefix}.fw.{k}"] = v
+        update_tags(values)
+
+    def _mark_device_tags_bad(self):
+        groups = group_tags_by_command(
+            get_subscriptions(),
+            self.device.object_ids if self.device else None,
+        )
+        names = [tag.name for tags in groups.values() for tag in tags]
+        set_tags_quality(names, QUALITY_BAD)
+        log.info(f"[poller] link down ({self._name()}), {len(names)} tag(s) marked bad")
+
+    def _name(self) -> str:
+        return self.device.name if self.device else self.usb.port
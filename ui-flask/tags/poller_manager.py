@@ -0,0 +1,125 @@
+# tags/poller_manager.py
+
+import threading
+from concurrent.futures import Future
+import logging
+log = logging.getLogger(__name__)
+
+from tags import metrics
+from tags.usb_comm import UsbComm
+from tags.poller import Poller
+from tags.registry import DEVICES, DeviceDef, device_for_object
+
+
+class PollerManager:
+    """
+    One Poller (and one serial port) per device, each on its own thread.
+
+    All pollers feed the same tags.state, so the rest of the app sees a
+    single tag space. Serial round-trips on different ports overlap, so
+    throughput scales with the number of devices.
+
+    Exposes the same enqueue_write() as Poller, so runtime code does not
+    care whether it talks to one poller or many.
+    """
+
+    def __init__(
+        self,
+        devices: list[DeviceDef] = DEVICES,
+        poll_interval: float = 0.2,
+    ):
+        self.pollers: dict[str, Poller] = {}
+        self._threads: list[threading.Thread] = []
+
+        for dev in devices:
+            usb = UsbComm(dev.port, dev.baud, dev.serial_number)
+            self.pollers[dev.name] = Poller(usb, poll_interval, device=dev)
+
+        metrics.register_collector(self.collect_metrics)
+
+    # ------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------
+
+    def start(self):
+        for name, poller in self.pollers.items():
+            t = threading.Thread(
+                target=poller.run,
+                name=f"Poller-{name}",
+                daemon=True,
+            )
+            t.start()
+            self._threads.append(t)
+
+        log.info(f"[poller] {len(self._threads)} device worker(s) started")
+
+    def stop(self):
+        for poller in self.pollers.values():
+            poller.stop()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        for poller in self.pollers.values():
+            poller.usb.close()
+
+    # ------------------------------------------------
+    # Metrics
+    # ------------------------------------------------
+
+    def collect_metrics(self):
+        polls = [({"device": name}, p) for name, p in self.pollers.items()]
+
+        def per_device(fn):
+            return [(labels, fn(p)) for labels, p in polls]
+
+        yield metrics.gauge("raspiplc_link_up", "Serial link to the device is up",
+                            per_device(lambda p: int(p._link_up)))
+        yield metrics.counter("raspiplc_round_trips_total", "Requests answered by the device",
+                              per_device(lambda p: p.stats.round_trips))
+        yield metrics.counter("raspiplc_timeouts_total", "Requests abandoned after all retries",
+                              per_device(lambda p: p.stats.timeouts))
+        yield metrics.counter("raspiplc_retries_total", "Request re-sends",
+                              per_device(lambda p: p.stats.retries))
+        yield metrics.counter("raspiplc_resync_drop_bytes_total", "Rx bytes discarded while resyncing",
+                              per_device(lambda p: p.stats.resync_drops))
+        yield metrics.counter("raspiplc_bad_len_total", "Reply headers with an impossible length",
+                              per_device(lambda p: p.stats.bad_len))
+        yield metrics.counter("raspiplc_bad_crc_total", "Replies failing the CRC check",
+                              per_device(lambda p: p.stats.bad_crc))
+        yield metrics.counter("raspiplc_tag_updates_total", "Tag values decoded from replies",
+                              per_device(lambda p: p.stats.tag_updates))
+        yield metrics.counter("raspiplc_writes_total", "Writes acknowledged by the device",
+                              per_device(lambda p: p.stats.writes))
+        yield metrics.gauge("raspiplc_write_queue_depth", "Writes waiting to be sent",
+                            per_device(lambda p: len(p.write_queue)))
+        yield metrics.gauge("raspiplc_response_timeout_seconds", "Current adaptive response timeout",
+                            per_device(lambda p: p.response_timeout))
+        yield metrics.histogram("raspiplc_round_trip_seconds", "Request/reply round-trip time",
+                                per_device(lambda p: p.stats.rtt_hist))
+        yield metrics.histogram("raspiplc_poll_cycle_seconds", "Duration of one read cycle",
+                                per_device(lambda p: p.stats.cycle_hist))
+        yield metrics.counter("raspiplc_device_counter_total", "Firmware UsbComm::Stats counters",
+                              [({**labels, "counter": k}, v)
+                               for labels, p in polls
+                               for k, v in p.fw_stats.items() if k != "uptime_ms"])
+        yield metrics.gauge("raspiplc_device_uptime_seconds", "Device uptime (wraps at 49.7 days)",
+                            [(labels, p.fw_stats["uptime_ms"] / 1000.0)
+                             for labels, p in polls if "uptime_ms" in p.fw_stats])
+
+    # ------------------------------------------------
+    # Public API (used by runtime)
+    # ------------------------------------------------
+
+    def poller_for_object(self, obj_id: int) -> Poller | None:
+        dev = device_for_object(obj_id)
+        if dev is None:
+            return None
+        return self.pollers.get(dev.name)
+
+    def enqueue_write(self, obj_id: int, cmd_id: int, payload: bytes = b"", read_cmd: int | None = None) -> Future:
+        """
+        Route a write to the poller that owns obj_id (see Poller.enqueue_write).
+        """
+        poller = self.poller_for_object(obj_id)
+        if poller is None:
+            raise ValueError(f"No device configured for object {obj_id}")
+        return poller.enqueue_write(obj_id, cmd_id, payload, read_cmd)
@@ -1,7 +1,9 @@
 # tags/registry.py
 
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Tuple
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+import os
 import struct
 import logging
 log = logging.getLogger(__name__)
@@ -16,18 +18,60 @@ class TagDef:
     parser: Callable[[bytes], float]
     write_cmd: int | None = None
     writer: Callable[[any], bytes] | None = None
+    historian: "CompressionSpec | None" = None
+
+
+@dataclass(frozen=True)
+class DeviceDef:
+    """
+    One USB-attached I/O node.
+
+    object_ids is the slice of the (global) object-id space served by
+    this device; every tag whose object_id falls inside it is polled
+    through this device's port.
+
+    serial_number, if set, locates the port by USB serial number instead
+    of by path (see UsbComm).
+    """
+    name: str
+    port: str
+    baud: int
+    object_ids: range
+    serial_number: str | None = None
 
 
 # ---------------- Helpers ----------------
 
+class FieldAt:
+    """
+    Parser for a fixed-size scalar at a fixed offset.
+
+    Callable like any other TagDef parser, but also exposes its struct
+    code and offset so GroupDecoder can fold many fields into one Struct.
+    """
+    __slots__ = ("fmt", "offset", "_st")
+
+    def __init__(self, fmt: str, offset: int):
+        self.fmt = fmt
+        self.offset = offset
+        self._st = struct.Struct("<" + fmt)
+
+    @property
+    def size(self) -> int:
+        return self._st.size
+
+    def __call__(self, payload: bytes):
+        return self._st.unpack_from(payload, self.offset)[0]
+
+
 def f32_at(offset: int):
     """Return parser that extracts float32 at offset"""
-    return lambda payload: struct.unpack_from("<f", payload, offset)[0]
+    return FieldAt("f", offset)
 
 
 def u8_at(offset: int):
     """Return parser that extracts uint8 at offset"""
-    return lambda payload: payload[offset]
+    return FieldAt("B", offset)
 
 def u8_writer(v):
     return struct.pack("<B", int(v))
@@ -35,99 +79,121 @@ def u8_writer(v):
 def f32_writer(v):
     return struct.pack("<f", float(v))
 
-# ---------------- Object IDs ----------------
 
-OBJ_TIC1 = 1
+from tags.schema import build_type_tags, expand_instances, load_schema  # noqa: E402
 
-# ---------------- Command IDs ----------------
+# ---------------- Registry ----------------
+# Built from the device schema (see tags/schema.py, tags/devices.json).
+# RASPIPLC_DEVICES points at an alternative schema file.
 
-CMD_READ_STATUS = 0x01
+SCHEMA_PATH = Path(
+    os.environ.get("RASPIPLC_DEVICES", Path(__file__).with_name("devices.json"))
+)
 
-# ---------------- TempCtrl READ_STATUS layout ----------------
-# struct:
-# uint8  Mode
-# uint8  CtrlMode
-# uint16 pad
-# float  Sp
-# pide_stat_t follows
+TAGS: Dict[str, TagDef]
+DEVICES: List[DeviceDef]
+TAGS, DEVICES, TYPES = load_schema(SCHEMA_PATH)
 
-OFFSET_TC_MODE     = 0
-OFFSET_TC_CTRLMODE = 1
-OFFSET_TC_SP       = 4
+# Indexes, maintained alongside TAGS:
+#   GROUPS    {(object_id, cmd_id): [TagDef, ...]}  one read command each
+#   PREFIXES  {"tic1": [...], "tic1.pid": [...], ...} every dotted prefix
+GROUPS: Dict[Tuple[int, int], List[TagDef]] = {}
+PREFIXES: Dict[str, List[str]] = {}
 
-OFFSET_PID_SP   = 8
-OFFSET_PID_PV   = 12
-OFFSET_PID_CV   = 16
-OFFSET_PID_KP   = 20
-OFFSET_PID_KI   = 24
-OFFSET_PID_KD   = 28
-OFFSET_PID_ERR  = 40
-OFFSET_PID_MODE = 44
 
-TC_CMD_SET_MODE = 0x20
-TC_CMD_SET_SP   = 0x21
+def _index(tags: Iterable[TagDef]):
+    for tag in tags:
+        GROUPS.setdefault((tag.object_id, tag.cmd_id), []).append(tag)
+        parts = tag.name.split(".")
+        for i in range(1, len(parts)):
+            PREFIXES.setdefault(".".join(parts[:i]), []).append(tag.name)
 
 
-# ---------------- Registry ----------------
+_index(TAGS.values())
 
-TAGS: Dict[str, TagDef] = {
-
-    # --- TempCtrl ---
-    "tic1.tc.mode": TagDef(
-        name="tic1.tc.mode",
-        object_id=OBJ_TIC1,
-        cmd_id=CMD_READ_STATUS,
-        parser=u8_at(OFFSET_TC_MODE),
-        write_cmd=TC_CMD_SET_MODE,
-        writer=u8_writer,
-        ),
-
-    "tic1.tc.ctrlmode": TagDef(
-        "tic1.tc.ctrlmode", OBJ_TIC1, CMD_READ_STATUS, u8_at(OFFSET_TC_CTRLMODE)
-    ),
-
-    "tic1.sp": TagDef(
-        name="tic1.sp",
-        object_id=OBJ_TIC1,
-        cmd_id=CMD_READ_STATUS,
-        parser=f32_at(OFFSET_TC_SP),
-        write_cmd=TC_CMD_SET_SP,
-        writer=f32_writer,
-        ),
-
-    # --- PID ---
-    "tic1.pid.sp": TagDef(
-        "tic1.pid.sp", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_SP)
-    ),
-
-    "tic1.pid.pv": TagDef(
-        "tic1.pid.pv", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_PV)
-    ),
-
-    "tic1.pid.cv": TagDef(
-        "tic1.pid.cv", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_CV)
-    ),
-
-    "tic1.pid.kp": TagDef(
-        "tic1.pid.kp", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_KP)
-    ),
-
-    "tic1.pid.ki": TagDef(
-        "tic1.pid.ki", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_KI)
-    ),
-
-    "tic1.pid.kd": TagDef(
-        "tic1.pid.kd", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_KD)
-    ),
-
-    "tic1.pid.err": TagDef(
-        "tic1.pid.err", OBJ_TIC1, CMD_READ_STATUS, f32_at(OFFSET_PID_ERR)
-    ),
-
-    "tic1.pid.mode": TagDef(
-        "tic1.pid.mode", OBJ_TIC1, CMD_READ_STATUS, u8_at(OFFSET_PID_MODE)
-    ),
-}
+
+def add_instances(name: str, type_name: str, object_id: int, count: int = 1) -> List[str]:
+    """
+    Register more instances of a schema type at runtime (same rules as
+    the schema's "instances" entries). Returns the new tag names.
+    """
+    type_def = TYPES[type_name]
+    new = [
+        tag
+        for instance, obj in expand_instances(
+            {"name": name, "type": type_name, "object_id": object_id, "count": count}
+        )
+        for tag in build_type_tags(type_name, type_def, instance, obj)
+    ]
+    for tag in new:
+        if tag.name in TAGS:
+            raise ValueError(f"duplicate tag '{tag.name}'")
+    for tag in new:
+        TAGS[tag.name] = tag
+    _index(new)
+    return [tag.name for tag in new]
+
+
+# ---------------- Group decoders ----------------
+
+class GroupDecoder:
+    """
+    Decodes every requested tag of one (object_id, cmd_id) response.
+
+    FieldAt tags are folded into a single precompiled struct.Struct, so a
+    response costs one unpack_from() and one dict(zip()) regardless of
+    how many tags are subscribed. Tags with custom parsers still work;
+    they are called individually after the bulk unpack.
+    """
+
+    def __init__(self, tags: Iterable[TagDef]):
+        tags = list(tags)
+        fields = sorted(
+            (t for t in tags if isinstance(t.parser, FieldAt)),
+            key=lambda t: t.parser.offset,
+        )
+        self.custom = [t for t in tags if not isinstance(t.parser, FieldAt)]
+
+        fmt = "<"
+        names = []
+        pos = 0
+        for t in fields:
+            f = t.parser
+            if f.offset < pos:
+                # Overlaps a field already in the struct: decode on its own
+                self.custom.append(t)
+                continue
+            if f.offset > pos:
+                fmt += f"{f.offset - pos}x"
+            fmt += f.fmt
+            names.append(t.name)
+            pos = f.offset + f.size
+
+        self.names = tuple(names)
+        self.struct = struct.Struct(fmt) if names else None
+
+    def decode(self, payload: bytes) -> Dict[str, float]:
+        """
+        Returns {tag_name: value}. Raises struct.error on a short payload.
+        """
+        values = dict(zip(self.names, self.struct.unpack_from(payload))) if self.struct else {}
+        for t in self.custom:
+            values[t.name] = t.parser(payload)
+        return values
+
+
+_DECODERS: Dict[Tuple[str, ...], GroupDecoder] = {}
+
+
+def get_group_decoder(tags: List[TagDef]) -> GroupDecoder:
+    """
+    Return the (cached) decoder for exactly this set of tags of one group.
+    """
+    key = tuple(sorted(t.name for t in tags))
+    dec = _DECODERS.get(key)
+    if dec is None:
+        dec = _DECODERS[key] = GroupDecoder(tags)
+    return dec
 
 
 # ---------------- Lookup Utilities ----------------
@@ -136,10 +202,40 @@ def get_tag(name: str) -> TagDef:
     return TAGS[name]
 
 
-def group_tags_by_command(tag_names: List[str]) -> Dict[Tuple[int, int], List[TagDef]]:
+def device_for_object(object_id: int) -> DeviceDef | None:
+    """Return the device serving object_id, or None if unmapped."""
+    for dev in DEVICES:
+        if object_id in dev.object_ids:
+            return dev
+    return None
+
+
+def group_tags(object_id: int, cmd_id: int) -> List[TagDef]:
+    """Every registered tag read by (object_id, cmd_id)."""
+    return GROUPS.get((object_id, cmd_id), [])
+
+
+def tags_with_prefix(prefix: str) -> List[str]:
+    """
+    All tag names under a dotted prefix ("tic1", "tic1.pid"), or the
+    tag itself if prefix is a full tag name.
+    """
+    if prefix in TAGS:
+        return [prefix]
+    return list(PREFIXES.get(prefix, ()))
+
+
+def group_tags_by_command(
+    tag_names: Iterable[str],
+    object_ids: range | None = None,
+) -> Dict[Tuple[int, int], List[TagDef]]:
     """
     Returns:
       {(object_id, cmd_id): [TagDef, TagDef, ...]}
+
+    If object_ids is given, tags outside that range are skipped
+    (used by per-device pollers). Groups come back in (object_id,
+    cmd_id) order, so the same subscription always polls in the same order.
     """
     groups: Dict[Tuple[int, int], List[TagDef]] = {}
 
@@ -147,8 +243,10 @@ def group_tags_by_command(tag_names: List[str]) -> Dict[Tuple[int, int], List[Ta
         tag = TAGS.get(name)
         if not tag:
             continue
+        if object_ids is not None and tag.object_id not in object_ids:
+            continue
 
         key = (tag.object_id, tag.cmd_id)
         groups.setdefault(key, []).append(tag)
 
-    return groups
+    return dict(sorted(groups.items()))
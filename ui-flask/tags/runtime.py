@@ -1,11 +1,23 @@
 # tags/runtime.py
+import concurrent.futures
+import threading
+import time
+from dataclasses import dataclass, field
+
+from flask import request
 from flask_socketio import Namespace
 from tags.state import (
-    get_tag_updates,
+    QUALITY,
+    TS,
+    VALUE,
+    VERSION,
+    get_store,
     subscribe_tags,
     unsubscribe_tags,
 )
-from tags.registry import TAGS
+from tags.registry import TAGS, tags_with_prefix
+from tags import metrics
+from tags.encoding import FORMAT_PACKED, FORMATS, MAX_IDS, build_filters, pack_updates, packable
 from tags.usb_comm import UsbComm
 from tags.historian import get_historian
 import logging
@@ -13,6 +25,16 @@ log = logging.getLogger(__name__)
 
 NAMESPACE = "/tags"
 
+# Fastest per-client push rate accepted from "rate_ms" (also the default)
+MIN_RATE_MS = 20
+
+# How long a tag_write waits for the device to acknowledge
+WRITE_TIMEOUT_S = 2.0
+
+# After the store signals a change, wait this long so updates from the
+# rest of a poll cycle go out in the same push
+EMIT_BATCH_S = 0.002
+
 _poller = None
 
 def set_poller(poller):
@@ -20,24 +42,153 @@ def set_poller(poller):
     _poller = poller
 
 
+# ---------------- Clients ----------------
+
+@dataclass
+class TagClient:
+    """
+    One Socket.IO session: its tags, its cursor into the tag store and
+    its push rate.
+
+    With format="packed", ids maps each tag to the integer id announced
+    in the subscribe ack (see tags.encoding); filters holds optional
+    per-tag deadband / precision. meta adds each tag's acquisition
+    timestamp and quality to every push.
+    """
+    sid: str
+    tags: set = field(default_factory=set)
+    cursor: int = 0
+    rate_s: float = MIN_RATE_MS / 1000.0
+    last_emit: float = 0.0
+    format: str = "json"
+    meta: bool = False
+    # {tag: version} already delivered in a subscribe snapshot
+    acked: dict = field(default_factory=dict)
+    ids: dict = field(default_factory=dict)
+    filters: dict = field(default_factory=dict)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _expand(names):
+    """Tag names, or dotted prefixes of registry tags ("tic1.pid")."""
+    out = []
+    for name in names:
+        out += tags_with_prefix(name) or [name]
+    return out
+
+
 class TagNamespace(Namespace):
 
     def on_connect(self):
+        with _clients_lock:
+            _clients[request.sid] = TagClient(request.sid, cursor=get_store().version)
         log.info("[tags] client connected")
 
-    def on_disconnect(self):
+    def on_disconnect(self, *args):
+        with _clients_lock:
+            client = _clients.pop(request.sid, None)
+        if client and client.tags:
+            unsubscribe_tags(client.tags)
         log.info("[tags] client disconnected")
 
     def on_subscribe(self, msg):
-        tags = msg.get("tags", [])
-        subscribe_tags(tags)
+        """
+        msg: {"tags": [...], optional "rate_ms", "format" ("json" |
+        "packed"), "meta" (bool), "deadband" and "precision" (a number,
+        or {tag: number}).
+
+        JSON pushes are {tag: value}, or with meta {tag: {"v", "ts", "q"}}
+        (ts = acquisition time in epoch seconds, q = quality).
+
+        Returns the ack with the current value of every requested tag:
+
+          {"status": "ok", "version": V,
+           "snapshot": {tag: value | {"v", "ts", "q", "ver"}},
+           "ids": {tag: id}}                      (packed clients only)
+
+        Pushes after the ack carry only changes newer than V, so a page
+        renders from the ack without waiting for tags to change.
+        """
+        tags = _expand(msg.get("tags", []))
+        fmt = msg.get("format")
+        if fmt is not None and fmt not in FORMATS:
+            return {"status": "error", "msg": f"Unknown format '{fmt}'"}
+        rate_s = None
+        if "rate_ms" in msg:
+            try:
+                rate_s = max(MIN_RATE_MS, int(msg["rate_ms"])) / 1000.0
+            except (TypeError, ValueError, OverflowError):
+                return {"status": "error", "msg": "rate_ms must be a number"}
+        try:
+            filters = build_filters(tags, msg.get("deadband"), msg.get("precision"))
+        except (TypeError, ValueError, OverflowError):
+            return {"status": "error", "msg": "deadband / precision must be numbers"}
+
+        with _clients_lock:
+            client = _clients.get(request.sid)
+            if client is None:
+                return {"status": "error", "msg": "Not connected"}
+            if (fmt or client.format) == FORMAT_PACKED and len(client.ids.keys() | set(tags)) > MAX_IDS:
+                return {"status": "error", "msg": "Too many tags"}
+            if fmt is not None:
+                client.format = fmt
+            if "meta" in msg:
+                client.meta = bool(msg["meta"])
+            new = set(tags) - client.tags
+            client.tags |= new
+            if rate_s is not None:
+                client.rate_s = rate_s
+            client.filters.update(filters)
+            version, snapshot = get_store().snapshot(tags)
+            for name, entry in snapshot.items():
+                client.acked[name] = entry[VERSION]
+            if client.filters:
+                snapshot = _apply_filters(client.filters, snapshot, force=True)
+            ack = {
+                "status": "ok",
+                "version": version,
+                "snapshot": _json_updates(client, snapshot, versions=True),
+            }
+            if client.format == FORMAT_PACKED:
+                for name in tags:
+                    if name not in client.ids:
+                        client.ids[name] = len(client.ids)
+                ack["ids"] = {name: client.ids[name] for name in tags}
+        # One reference per client and tag, however often it subscribes
+        subscribe_tags(new)
+        return ack
 
     def on_unsubscribe(self, msg):
-        tags = msg.get("tags", [])
-        unsubscribe_tags(tags)
+        tags = _expand(msg.get("tags", []))
+        with _clients_lock:
+            client = _clients.get(request.sid)
+            if client is None:
+                return
+            gone = client.tags & set(tags)
+            client.tags -= gone
+            for name in gone:
+                # ids stay assigned so a re-subscribe reuses them
+                client.filters.pop(name, None)
+        unsubscribe_tags(gone)
 
     # ✅ WRITE HANDLER LIVES HERE
     def on_tag_write(self, msg):
+        """
+        Returns once the device has acknowledged the write:
+
+          {"status": "ok", "tag": ..., "value": <applied value>,
+           "seq": ..., "rtt_ms": ...}
+
+        or {"status": "error", "msg": ...} when the write was not (and
+        will not be) applied, or {"status": "unknown", "msg": ...} when it
+        timed out after being sent.
+
+        The affected tags are refreshed from the device's reply, so the
+        new value is pushed to subscribers without waiting for a poll.
+        """
         tag = msg.get("tag")
         value = msg.get("value")
 
@@ -48,25 +199,197 @@ class TagNamespace(Namespace):
         if not _poller:
             return {"status": "error", "msg": "Poller not ready"}
 
-        payload = td.writer(value)
+        try:
+            payload = td.writer(value)
+        except Exception as e:
+            return {"status": "error", "msg": f"Invalid value: {e}"}
 
         try:
-            _poller.enqueue_write(
+            fut = _poller.enqueue_write(
                 td.object_id,
                 td.write_cmd,
-                payload
+                payload,
+                read_cmd=td.cmd_id,
             )
-            return {"status": "ok"}
+            result = fut.result(timeout=WRITE_TIMEOUT_S)
+        except concurrent.futures.TimeoutError:
+            # Drop it if still queued, so it is not applied after the
+            # client was told it failed
+            if fut.cancel():
+                return {"status": "error", "msg": "No response from device"}
+            # Already sent: the device may still apply it
+            return {"status": "unknown", "msg": "No response from device; the write may have been applied"}
         except Exception as e:
             return {"status": "error", "msg": str(e)}
 
+        return {
+            "status": "ok",
+            "tag": tag,
+            "value": result.values.get(tag),
+            "seq": result.seq,
+            "rtt_ms": round(result.rtt_s * 1000, 3),
+        }
+
 
 def register_tag_namespace(socketio):
     socketio.on_namespace(TagNamespace(NAMESPACE))
 
 
-def emit_tag_updates(socketio):
-    updates = get_tag_updates()
-    if updates:
-        get_historian().handle_tag_updates(updates)
-        socketio.emit("tag_update", updates, namespace=NAMESPACE)
+# Historian's cursor into the tag store
+_emit_version = 0
+
+
+@dataclass
+class EmitStats:
+    flushes: int = 0          # emit_tag_updates() calls
+    pushes: int = 0           # Socket.IO messages sent
+    tags_sent: int = 0        # tag values across all pushes
+    flush_hist: metrics.Histogram = field(default_factory=metrics.Histogram)
+    fanout_hist: metrics.Histogram = field(
+        default_factory=lambda: metrics.Histogram((0, 1, 2, 5, 10, 20, 50, 100))
+    )
+
+
+_emit_stats = EmitStats()
+
+
+def _collect_metrics():
+    s = _emit_stats
+    with _clients_lock:
+        clients = len(_clients)
+    yield metrics.gauge("raspiplc_socket_clients", "Connected /tags clients", [({}, clients)])
+    yield metrics.gauge("raspiplc_tag_store_version", "Tag store version", [({}, get_store().version)])
+    yield metrics.counter("raspiplc_emit_flushes_total", "Emitter flushes", [({}, s.flushes)])
+    yield metrics.counter("raspiplc_emit_pushes_total", "Socket.IO tag pushes sent", [({}, s.pushes)])
+    yield metrics.counter("raspiplc_emit_tags_total", "Tag values pushed to clients", [({}, s.tags_sent)])
+    yield metrics.histogram("raspiplc_emit_flush_seconds", "Duration of one emitter flush", [({}, s.flush_hist)])
+    yield metrics.histogram("raspiplc_emit_fanout_clients", "Clients pushed to per flush", [({}, s.fanout_hist)])
+
+
+metrics.register_collector(_collect_metrics)
+
+
+def run_tag_emitter(socketio):
+    """
+    Event-driven push loop: sleeps on the tag store until a poller
+    publishes new values, then flushes after a
+    short batching window. Rate-limited clients are revisited when they
+    are next due. Idle when nothing changes.
+    """
+    store = get_store()
+    delay = None
+    while True:
+        # Wait on what was actually consumed: updates that landed after
+        # the last changes_since() must not be slept through
+        if not store.wait(_emit_version, delay) and delay is None:
+            continue
+        time.sleep(EMIT_BATCH_S)
+        delay = emit_tag_updates(socketio)
+
+
+def emit_tag_updates(socketio) -> float | None:
+    """
+    Push pending changes to every client that is due.
+
+    Returns seconds until the next rate-limited client with unsent
+    changes becomes due, or None if nobody is waiting.
+    """
+    global _emit_version
+    t0 = time.perf_counter()
+    store = get_store()
+    _emit_version, changes = store.changes_since(_emit_version)
+    if changes:
+        get_historian().handle_tag_entries(changes)
+
+    now = time.monotonic()
+    with _clients_lock:
+        clients = list(_clients.values())
+
+    next_due = None
+    fanout = 0
+    for client in clients:
+        wait = client.rate_s - (now - client.last_emit)
+        if wait > 0:
+            if client.cursor != _emit_version:
+                next_due = wait if next_due is None else min(next_due, wait)
+            continue
+
+        client.cursor, changed = store.changes_since(client.cursor)
+        with _clients_lock:
+            acked, client.acked = client.acked, {}
+        updates = {
+            name: entry
+            for name, entry in changed.items()
+            if name in client.tags and entry[VERSION] > acked.get(name, 0)
+        }
+
+        if client.filters:
+            updates = _apply_filters(client.filters, updates)
+
+        if updates:
+            client.last_emit = now
+            fanout += 1
+            _emit_stats.tags_sent += len(updates)
+            if client.format == FORMAT_PACKED:
+                _emit_packed(socketio, client, updates)
+            else:
+                _emit_stats.pushes += 1
+                socketio.emit("tag_update", _json_updates(client, updates), namespace=NAMESPACE, to=client.sid)
+
+    _emit_stats.flushes += 1
+    _emit_stats.fanout_hist.observe(fanout)
+    _emit_stats.flush_hist.observe(time.perf_counter() - t0)
+    return next_due
+
+
+def _apply_filters(filters, updates, force=False):
+    """updates: {name: store entry}; filtered values replace entry[VALUE]."""
+    out = {}
+    for name, entry in updates.items():
+        f = filters.get(name)
+        if f is not None:
+            value = f.apply(entry[VALUE], entry[QUALITY], force=force)
+            if value is None:
+                continue
+            if value is not entry[VALUE]:
+                entry = (value,) + entry[1:]
+        out[name] = entry
+    return out
+
+
+def _json_updates(client, updates, versions=False):
+    if client.meta:
+        out = {
+            name: {"v": entry[VALUE], "ts": entry[TS], "q": entry[QUALITY]}
+            for name, entry in updates.items()
+        }
+        if versions:
+            for name, entry in updates.items():
+                out[name]["ver"] = entry[VERSION]
+        return out
+    return {name: entry[VALUE] for name, entry in updates.items()}
+
+
+def _emit_packed(socketio, client, updates):
+    ids = []
+    entries = []
+    other = {}
+    for name, entry in updates.items():
+        tag_id = client.ids.get(name)
+        if tag_id is not None and packable(entry[VALUE]):
+            ids.append(tag_id)
+            entries.append(entry)
+        else:
+            other[name] = entry
+
+    if ids:
+        values = [e[VALUE] for e in entries]
+        if client.meta:
+            data = pack_updates(ids, values, [e[TS] for e in entries], [e[QUALITY] for e in entries])
+        else:
+            data = pack_updates(ids, values)
+        _emit_stats.pushes += 1
+        socketio.emit("tag_packed", data, namespace=NAMESPACE, to=client.sid)
+    if other:
+        _emit_stats.pushes += 1
+        socketio.emit("tag_update", _json_updates(client, other), namespace=NAMESPACE, to=client.sid)
@@ -0,0 +1,136 @@
+# tags/schema.py
+"""
+Device schema loader.
+
+Builds TagDefs and DeviceDefs from a JSON schema (tags/devices.json by
+default) instead of hand-written registry entries:
+
+  devices    port / baud / object-id range per USB I/O node
+  types      object types: per read command, the status field layout
+             (type + offset) and optional write command per field
+  instances  named objects of a type at an object id; "count" with a
+             "{n}" name pattern registers many instances in one line:
+
+               { "name": "tic{n}", "type": "tempctrl", "object_id": 1, "count": 50 }
+
+             -> tic1..tic50 on object ids 1..50
+
+A field may carry a "historian" entry with its compression settings
+(see tags/historian_compress.py).
+
+Tag names are "<instance>.<field>", e.g. "tic1.pid.pv".
+Command ids may be written as ints or "0x.." strings.
+"""
+
+import json
+import platform
+import struct
+from pathlib import Path
+from typing import Dict, List, Tuple
+import logging
+log = logging.getLogger(__name__)
+
+# Same type names as shm_service/tags.json
+TYPES = {
+    "bool":    "?",
+    "uint8":   "B",
+    "int8":    "b",
+    "uint16":  "H",
+    "int16":   "h",
+    "uint32":  "I",
+    "int32":   "i",
+    "float32": "f",
+    "float64": "d",
+}
+
+
+def _int(v) -> int:
+    return int(v, 0) if isinstance(v, str) else int(v)
+
+
+def _writer(fmt: str):
+    st = struct.Struct("<" + fmt)
+    cast = float if fmt in "fd" else (bool if fmt == "?" else int)
+    return lambda v: st.pack(cast(v))
+
+
+def build_type_tags(type_name: str, type_def: dict, instance: str, object_id: int):
+    """
+    Yield the TagDefs of one object instance.
+    """
+    from tags.historian_compress import CompressionSpec
+    from tags.registry import FieldAt, TagDef
+
+    for group in type_def["groups"].values():
+        cmd_id = _int(group["cmd"])
+        for field, spec in group["fields"].items():
+            fmt = TYPES.get(spec["type"])
+            if fmt is None:
+                raise ValueError(f"{type_name}.{field}: unknown type '{spec['type']}'")
+
+            write_cmd = spec.get("write_cmd")
+            historian = spec.get("historian")
+            try:
+                historian = CompressionSpec.parse(historian) if historian is not None else None
+            except ValueError as e:
+                raise ValueError(f"{type_name}.{field}: {e}")
+            yield TagDef(
+                name=f"{instance}.{field}",
+                object_id=object_id,
+                cmd_id=cmd_id,
+                parser=FieldAt(fmt, _int(spec["offset"])),
+                write_cmd=_int(write_cmd) if write_cmd is not None else None,
+                writer=_writer(fmt) if write_cmd is not None else None,
+                historian=historian,
+            )
+
+
+def expand_instances(spec: dict) -> List[Tuple[str, int]]:
+    """
+    [(instance_name, object_id), ...] for one "instances" entry.
+    """
+    first = _int(spec["object_id"])
+    count = int(spec.get("count", 1))
+    name = spec["name"]
+    if count > 1 and "{n}" not in name:
+        raise ValueError(f"instance '{name}': count > 1 needs a '{{n}}' in the name")
+    return [(name.format(n=i + 1), first + i) for i in range(count)]
+
+
+def load_schema(path: Path) -> Tuple[Dict[str, "TagDef"], List["DeviceDef"], dict]:
+    """
+    Returns (tags_by_name, devices, types).
+    """
+    from tags.registry import DeviceDef
+
+    with open(path, "r") as f:
+        cfg = json.load(f)
+
+    windows = platform.system() == "Windows"
+    devices = []
+    for name, d in cfg.get("devices", {}).items():
+        lo, hi = d["object_ids"]
+        devices.append(
+            DeviceDef(
+                name=name,
+                port=d.get("port_windows", d["port"]) if windows else d["port"],
+                baud=int(d.get("baud", 500000)),
+                object_ids=range(_int(lo), _int(hi) + 1),
+                serial_number=d.get("serial_number"),
+            )
+        )
+
+    types = cfg.get("types", {})
+    tags = {}
+    for spec in cfg.get("instances", []):
+        type_def = types.get(spec["type"])
+        if type_def is None:
+            raise ValueError(f"instance '{spec['name']}': unknown type '{spec['type']}'")
+        for instance, object_id in expand_instances(spec):
+            for tag in build_type_tags(spec["type"], type_def, instance, object_id):
+                if tag.name in tags:
+                    raise ValueError(f"duplicate tag '{tag.name}'")
+                tags[tag.name] = tag
+
+    log.info(f"[registry] {len(tags)} tags, {len(devices)} device(s) from {path}")
+    return tags, devices, types
@@ -1,35 +1,219 @@
 # tags/state.py
+"""
+Live tag values shared by the poller threads (writers) and the
+Socket.IO emitter / historian (readers).
+
+Every update gets a store-wide, monotonically increasing version.
+Readers keep their own cursor and ask for everything changed since it:
+
+    version, changes = get_store().changes_since(cursor)
+    cursor = version
+
+so there is no shared dirty set to drain, and any number of readers
+can follow the same store independently.
+"""
+
+import threading
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
 import logging
 log = logging.getLogger(__name__)
 
-_TAGS = {}
-_DIRTY = set()
-_SUBSCRIPTIONS = set()
+QUALITY_GOOD = "good"
+QUALITY_BAD = "bad"
+
+
+# Store entries are plain (value, ts, quality, version) tuples: the
+# poller writes thousands per second and a NamedTuple costs twice as much
+VALUE, TS, QUALITY, VERSION = range(4)
+
+
+class TagStore:
+    """
+    Versioned tag store.
+
+    One lock guards the values and the change log; it is held only for
+    dict updates, never across I/O. The change log is ordered by version
+    (a tag moves to the end when it changes), so changes_since() walks
+    back from the newest entry and stops at the cursor: the cost is the
+    number of changed tags, not the number of tags.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Signalled on every new version, so readers can block in wait()
+        # instead of polling the store on a timer
+        self._cond = threading.Condition(self._lock)
+        self._values: Dict[str, tuple] = {}
+        self._changes: "OrderedDict[str, int]" = OrderedDict()
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def update(self, values: Dict[str, object], quality: str = QUALITY_GOOD, ts: float | None = None) -> int:
+        """
+        Bulk update: values is {name: value}, all stamped with one
+        timestamp and one version. Returns the new version.
+        """
+        if not values:
+            return self._version
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self._version += 1
+            version = self._version
+            store = self._values
+            changes = self._changes
+            for name, value in values.items():
+                store[name] = (value, ts, quality, version)
+                changes[name] = version
+                changes.move_to_end(name)
+            self._cond.notify_all()
+        return version
+
+    def set_quality(self, names: Iterable[str], quality: str, ts: float | None = None) -> int:
+        """
+        Change the quality of already-known tags, keeping their last value
+        (e.g. mark everything behind a lost device as bad). The entry is
+        stamped with ts (default: now), the time the quality changed.
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            changed = [
+                name for name in names
+                if (entry := self._values.get(name)) is not None and entry[QUALITY] != quality
+            ]
+            if changed:
+                self._version += 1
+                version = self._version
+                for name in changed:
+                    entry = self._values[name]
+                    self._values[name] = (entry[VALUE], ts, quality, version)
+                    self._changes[name] = version
+                    self._changes.move_to_end(name)
+                self._cond.notify_all()
+            return self._version
+
+    def wait(self, version: int, timeout: float | None = None) -> bool:
+        """
+        Block until the store moves past version or timeout elapses.
+        Returns False on a timeout.
+        """
+        with self._lock:
+            if self._version == version:
+                self._cond.wait(timeout)
+            return self._version != version
+
+    def get(self, name: str) -> tuple | None:
+        return self._values.get(name)
+
+    def changes_since(self, version: int) -> Tuple[int, Dict[str, tuple]]:
+        """
+        Returns (current_version, {name: entry}) for every tag whose
+        last change is newer than version.
+        """
+        with self._lock:
+            current = self._version
+            if version >= current:
+                return current, {}
+            changes = {}
+            values = self._values
+            for name in reversed(self._changes):
+                if self._changes[name] <= version:
+                    break
+                changes[name] = values[name]
+            return current, changes
 
+    def snapshot(self, names: Iterable[str] | None = None) -> Tuple[int, Dict[str, tuple]]:
+        """
+        Returns (current_version, {name: entry}) for names (all if None).
+        """
+        with self._lock:
+            if names is None:
+                return self._version, dict(self._values)
+            values = self._values
+            return self._version, {n: values[n] for n in names if n in values}
 
-def update_tag(name, value):
-    _TAGS[name] = (value, time.time())
-    _DIRTY.add(name)
 
+_STORE = TagStore()
 
-def get_tag_updates():
-    updates = {}
-    for t in list(_DIRTY):
-        updates[t] = _TAGS[t][0]
-        _DIRTY.remove(t)
-    return updates
+
+def get_store() -> TagStore:
+    return _STORE
+
+
+# ---------------- Writers (pollers) ----------------
+
+def update_tag(name, value, quality=QUALITY_GOOD, ts=None):
+    _STORE.update({name: value}, quality, ts)
+
+
+def update_tags(values, quality=QUALITY_GOOD, ts=None):
+    """
+    Bulk update: values is {name: value}, all stamped with one timestamp.
+    ts is the acquisition time (epoch seconds); defaults to now.
+    """
+    _STORE.update(values, quality, ts)
+
+
+def set_tags_quality(names, quality, ts=None):
+    _STORE.set_quality(names, quality, ts)
+
+
+def get_tag_quality(name):
+    entry = _STORE.get(name)
+    return entry[QUALITY] if entry is not None else QUALITY_BAD
+
+
+# ---------------- Subscriptions ----------------
+# Reference counted: each client (see runtime.TagNamespace) holds one
+# reference per tag, and a tag is polled while anyone holds one.
+
+_SUBS_LOCK = threading.Lock()
+_SUBSCRIPTIONS: Dict[str, int] = {}
+_SUBS_VERSION = 0   # bumped whenever the polled set changes
 
 
 def subscribe_tags(tags):
-    _SUBSCRIPTIONS.update(tags)
+    global _SUBS_VERSION
+    with _SUBS_LOCK:
+        added = False
+        for t in tags:
+            n = _SUBSCRIPTIONS.get(t, 0)
+            _SUBSCRIPTIONS[t] = n + 1
+            added = added or n == 0
+        if added:
+            _SUBS_VERSION += 1
 
 
 def unsubscribe_tags(tags):
-    for t in tags:
-        _SUBSCRIPTIONS.discard(t)
+    global _SUBS_VERSION
+    with _SUBS_LOCK:
+        removed = False
+        for t in tags:
+            n = _SUBSCRIPTIONS.get(t)
+            if n is None:
+                continue
+            if n > 1:
+                _SUBSCRIPTIONS[t] = n - 1
+            else:
+                del _SUBSCRIPTIONS[t]
+                removed = True
+        if removed:
+            _SUBS_VERSION += 1
+
+
+def get_subscriptions_version():
+    """
+    Changes whenever the subscription set may have changed; lets the
+    poller keep its poll plan without copying the set every cycle.
+    """
+    return _SUBS_VERSION
 
 
 def get_subscriptions():
-    return set(_SUBSCRIPTIONS)
+    """Union of all clients' subscriptions."""
+    with _SUBS_LOCK:
+        return set(_SUBSCRIPTIONS)
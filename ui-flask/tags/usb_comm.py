@@ -1,64 +1,223 @@
 # usb_comm.py
+import os
+import threading
 import serial
 import serial.serialutil
+import serial.tools.list_ports
 import time
 import logging
 log = logging.getLogger(__name__)
 
+try:
+    import termios
+except ImportError:     # Windows
+    termios = None
+
+# What an unplug raises mid-transfer: pyserial wraps most errors, but
+# in_waiting (ioctl) raises OSError and flush() (tcdrain) termios.error
+LINK_ERRORS = (serial.serialutil.SerialException, OSError) + ((termios.error,) if termios else ())
+
+# Reconnect backoff (seconds)
+BACKOFF_MIN = 0.1
+BACKOFF_MAX = 5.0
+
+# Longest a read() blocks when nothing has arrived (seconds)
+READ_TIMEOUT = 0.05
+# Serial port timeout, set once at open: read() waits in steps of this
+# instead of reconfiguring the port (a tcsetattr) for every call
+READ_POLL = 0.005
+
+
 class UsbComm:
-    def __init__(self, port, baud):
+    """
+    Supervised serial link.
+
+    States:
+      connected    -> send/read talk to the port
+      disconnected -> send/read return immediately; ensure_connected()
+                      retries with exponential backoff
+
+    The device can be located by:
+      - a fixed port ("/dev/ttyUSB0", "COM8")
+      - a udev by-id path ("/dev/serial/by-id/usb-Espressif_...")
+      - a USB serial number (serial_number="A1B2C3"), which survives
+        the device coming back under a different ttyUSBn / ttyACMn
+
+    If pyudev is installed, a udev monitor wakes the supervisor as soon
+    as a tty appears, so replugging recovers without waiting out the
+    current backoff.
+    """
+
+    def __init__(self, port, baud, serial_number=None):
         self.port = port
         self.baud = baud
+        self.serial_number = serial_number
         self.ser = None
         self.connected = False
 
+        self._backoff = BACKOFF_MIN
+        self._next_retry = 0.0
+        self._wake = threading.Event()
+        self._udev_observer = None
+
+        self._start_udev_monitor()
         self._open()
 
     # ------------------------------------------------------------
 
+    def _resolve_port(self) -> str | None:
+        """
+        Return the device node to open, or None if it is not present.
+        """
+        if self.serial_number:
+            for info in serial.tools.list_ports.comports():
+                if info.serial_number == self.serial_number:
+                    return info.device
+            return None
+
+        if self.port.startswith("/dev/"):
+            # by-id / by-path entries are udev symlinks that vanish on unplug
+            if not os.path.exists(self.port):
+                return None
+            return os.path.realpath(self.port)
+
+        return self.port
+
     def _open(self):
+        device = self._resolve_port()
+        if device is None:
+            self._schedule_retry(f"{self.serial_number or self.port} not present")
+            return
+
         try:
             self.ser = serial.Serial(
-                self.port,
+                device,
                 self.baud,
-                timeout=0.05,
+                timeout=READ_POLL,
                 dsrdtr=False,
                 rtscts=False,
             )
-            self.ser.setDTR(False)
-            self.ser.setRTS(False)
+            try:
+                self.ser.setDTR(False)
+                self.ser.setRTS(False)
+            except OSError:
+                # pty / loopback ports (usb_emulator) have no modem lines
+                pass
+            self.ser.reset_input_buffer()
             self.connected = True
-            log.info(f"[UsbComm] Connected to {self.port}")
+            self._backoff = BACKOFF_MIN
+            self._next_retry = 0.0
+            log.info(f"[UsbComm] Connected to {device}")
 
         except serial.serialutil.SerialException as e:
             self.ser = None
             self.connected = False
-            log.info(f"[UsbComm] Serial unavailable ({self.port}): {e}")
+            self._schedule_retry(e)
 
+    def _schedule_retry(self, reason):
+        if self._backoff == BACKOFF_MIN:
+            # Only log the first failure of a run, not every retry
+            log.info(f"[UsbComm] Serial unavailable ({self.port}): {reason}")
+        self._next_retry = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, BACKOFF_MAX)
+
+    # ------------------------------------------------------------
+    # Supervision
     # ------------------------------------------------------------
 
-    def send(self, frame: bytes):
-        if not self.connected:
+    def ensure_connected(self) -> bool:
+        """
+        Return True if the link is up. If it is down and the backoff has
+        elapsed, try to reopen once. Never blocks.
+        """
+        if self.connected:
+            return True
+        if time.monotonic() < self._next_retry:
+            return False
+        self._wake.clear()
+        self._open()
+        return self.connected
+
+    def wait_for_retry(self, max_wait: float):
+        """
+        Sleep until the next reconnect attempt is due, a udev add event
+        arrives, or max_wait elapses.
+        """
+        delay = max(0.0, self._next_retry - time.monotonic())
+        self._wake.wait(min(delay, max_wait))
+
+    def _start_udev_monitor(self):
+        try:
+            import pyudev
+        except ImportError:
             return
 
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem="tty")
+
+            def on_event(action, device):
+                if action == "add" and not self.connected:
+                    # Device (re)appeared: retry now instead of after backoff
+                    self._backoff = BACKOFF_MIN
+                    self._next_retry = 0.0
+                    self._wake.set()
+
+            self._udev_observer = pyudev.MonitorObserver(monitor, on_event)
+            self._udev_observer.daemon = True
+            self._udev_observer.start()
+        except Exception as e:
+            log.info(f"[UsbComm] udev monitor unavailable: {e}")
+
+    # ------------------------------------------------------------
+
+    def send(self, frame: bytes) -> bool:
+        if not self.connected:
+            return False
+
         try:
             self.ser.write(frame)
             self.ser.flush()
+            return True
 
-        except serial.serialutil.SerialException as e:
+        except LINK_ERRORS as e:
             log.info(f"[UsbComm] Write failed: {e}")
             self._handle_disconnect()
+            return False
 
     # ------------------------------------------------------------
 
-    def read(self, n=512) -> bytes:
+    def read(self, n=512, timeout: float | None = None) -> bytes:
+        """
+        Return whatever has arrived, up to n bytes. Only blocks when
+        nothing is buffered yet, for at most timeout seconds (capped at
+        READ_TIMEOUT), so a caller waiting for a reply never overruns its
+        own deadline. A plain read(n) would wait the full timeout for n
+        bytes on every short reply.
+        """
         if not self.connected:
             return b""
 
+        deadline = time.perf_counter() + (READ_TIMEOUT if timeout is None else min(max(timeout, 0.0), READ_TIMEOUT))
         try:
-            return self.ser.read(n)
-
-        except serial.serialutil.SerialException as e:
+            ser = self.ser
+            while True:
+                waiting = ser.in_waiting
+                if waiting:
+                    return ser.read(min(n, waiting))
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return b""
+                if left < READ_POLL:
+                    # A blocking read could overrun the deadline
+                    time.sleep(left)
+                    continue
+                data = ser.read(1)
+                if data:
+                    return data
+
+        except LINK_ERRORS as e:
             log.info(f"[UsbComm] Read failed: {e}")
             self._handle_disconnect()
             return b""
@@ -74,6 +233,8 @@ class UsbComm:
         except Exception:
             pass
         self.ser = None
+        self._backoff = BACKOFF_MIN
+        self._schedule_retry("disconnected")
 
     # ------------------------------------------------------------
 
@@ -85,6 +246,9 @@ class UsbComm:
     # ------------------------------------------------------------
 
     def close(self):
+        if self._udev_observer:
+            self._udev_observer.stop()
+            self._udev_observer = None
         if self.ser:
             self.ser.close()
             self.ser = None
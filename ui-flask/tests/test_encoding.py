@@ -0,0 +1,34 @@
+# tests/test_encoding.py
+from tags.encoding import FLOAT32_EXACT_INT, pack_updates, packable, unpack_updates
+
+
+def test_roundtrip_with_meta():
+    data = pack_updates([3, 1], [1.5, 7], [1714550400.25, 1714550401.5], ["good", "bad"])
+    assert unpack_updates(data) == [(3, 1.5, 1714550400.25, 0xC0), (1, 7.0, 1714550401.5, 0x00)]
+
+
+def test_packable():
+    assert packable(0.1) and packable(True) and packable(255)
+    assert packable(FLOAT32_EXACT_INT) and packable(-FLOAT32_EXACT_INT)
+    assert not packable(FLOAT32_EXACT_INT + 1)
+    assert not packable("auto") and not packable(None)
+
+
+def test_large_counter_goes_out_as_json():
+    from tags import runtime
+
+    class SocketIO:
+        def __init__(self):
+            self.sent = []
+
+        def emit(self, event, data, **kw):
+            self.sent.append((event, data))
+
+    client = runtime.TagClient("sid", format="packed", ids={"small": 0, "big": 1})
+    sio = SocketIO()
+    big = FLOAT32_EXACT_INT + 1
+    runtime._emit_packed(sio, client, {"small": (5, 0.0, "good", 1), "big": (big, 0.0, "good", 1)})
+
+    events = dict(sio.sent)
+    assert unpack_updates(events["tag_packed"]) == [(0, 5.0)]
+    assert events["tag_update"] == {"big": big}
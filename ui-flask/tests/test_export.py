@@ -0,0 +1,88 @@
+# tests/test_export.py
+import io
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from tags import export
+from web import routes
+
+START_MS = 1_714_550_400_000
+TAGS = ["tic1.pid.pv", "tic1.sp"]
+
+
+def _iter_query(tags, start_ms, end_ms, interval):
+    """10 s samples of tic1.pid.pv only; tic1.sp has no history."""
+    step = interval * 1000
+    t = start_ms - start_ms % step
+    while t <= end_ms:
+        yield t, "tic1.pid.pv", (t - START_MS) / 1000.0
+        t += step
+
+
+def _download(fmt, query=_iter_query):
+    return b"".join(export.export(query, TAGS, START_MS, START_MS + 99_000, 10, fmt))
+
+
+def test_npz_export():
+    with np.load(io.BytesIO(_download("npz"))) as z:
+        assert z["ts"][0] == START_MS / 1000 and len(z["ts"]) == 10
+        assert z["tic1.pid.pv"].tolist() == [10.0 * i for i in range(10)]
+        assert np.isnan(z["tic1.sp"]).all()
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_arrow_export(fmt):
+    pa = pytest.importorskip("pyarrow")
+    data = _download(fmt)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(pa.BufferReader(data))
+    else:
+        table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+    assert table.column_names == ["ts"] + TAGS
+    assert table["tic1.pid.pv"].to_pylist() == [10.0 * i for i in range(10)]
+    assert table["tic1.sp"].null_count + np.isnan(table["tic1.sp"].to_numpy()).sum() == 10
+
+
+class _Historian:
+    def __init__(self, query, backend_name="sqlite"):
+        self.iter_query = query
+        self.backend_name = backend_name
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def use(historian):
+        monkeypatch.setattr(routes, "get_historian", lambda: historian)
+    app = Flask(__name__)
+    routes.register_routes(app)
+    client = app.test_client()
+    client.use = use
+    return client
+
+
+URL = f"/api/export?tags={','.join(TAGS)}&start={START_MS}&end={START_MS + 99_000}&interval=10&format=npz"
+
+
+def test_export_route_streams_file(client):
+    client.use(_Historian(_iter_query))
+    resp = client.get(URL)
+    assert resp.status_code == 200
+    with np.load(io.BytesIO(resp.data)) as z:
+        assert len(z["tic1.pid.pv"]) == 10
+
+
+def test_export_route_reports_query_failure(client):
+    def failing(*args):
+        raise ConnectionError("backend down")
+        yield
+
+    client.use(_Historian(failing))
+    assert client.get(URL).status_code == 502
+
+
+def test_export_route_without_backend(client):
+    client.use(_Historian(_iter_query, backend_name="null"))
+    assert client.get(URL).status_code == 503
@@ -0,0 +1,56 @@
+# tests/test_framing.py
+from types import SimpleNamespace
+
+from tags.framing import (
+    FLAG_CRC16,
+    FLAG_CRC_ACK,
+    HEADER,
+    HEADER_SIZE,
+    MAGIC,
+    FrameParser,
+    build_frame,
+)
+
+
+def _stats():
+    return SimpleNamespace(resync_drops=0, bad_len=0, bad_crc=0)
+
+
+def _plain_reply(seq, payload=b"\x01\x02"):
+    """A reply without ACK or trailer, as legacy firmware sends it."""
+    return HEADER.pack(MAGIC, HEADER_SIZE + len(payload), seq, 1, 2, 0) + payload
+
+
+def test_crc_reply_roundtrip():
+    parser = FrameParser(_stats())
+    parser.crc_flags = FLAG_CRC16
+    parser.feed(build_frame(7, 1, 2, b"abc", FLAG_CRC16 | FLAG_CRC_ACK))
+    frame = parser.next_frame()
+    assert frame.seq == 7 and frame.payload == b"abc"
+
+
+def test_plain_reply_accepted_before_negotiation():
+    parser = FrameParser(_stats())
+    parser.feed(_plain_reply(3))
+    assert parser.next_frame().payload == b"\x01\x02"
+
+
+def test_reply_without_trailer_rejected_after_negotiation():
+    stats = _stats()
+    parser = FrameParser(stats)
+    parser.crc_flags = FLAG_CRC16
+    parser.feed(_plain_reply(3) + build_frame(4, 1, 2, b"ok", FLAG_CRC16 | FLAG_CRC_ACK))
+    frame = parser.next_frame()
+    assert frame.seq == 4 and frame.payload == b"ok"
+    assert stats.bad_crc == 1
+
+
+def test_cleared_ack_bit_rejected_after_negotiation():
+    stats = _stats()
+    parser = FrameParser(stats)
+    parser.crc_flags = FLAG_CRC16
+    frame = bytearray(build_frame(5, 1, 2, b"xy", FLAG_CRC16 | FLAG_CRC_ACK))
+    frame[9] &= ~FLAG_CRC_ACK & 0xFF
+    parser.feed(bytes(frame))
+    assert parser.next_frame() is None
+    assert stats.bad_crc == 1
@@ -0,0 +1,100 @@
+# tests/test_historian.py
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from tags import metrics
+from tags.historian import HistorianManager
+from tags.historian_compress import CompressionSpec, TagCompressor
+from tags.historian_null import NullHistorian
+from tags.historian_rollup import Coverage, Rollups
+from tags.historian_spool import Spool
+from tags.history_cache import HistoryCache
+
+TAG = "tic1.pid.pv"
+T0 = 1_714_550_400.0
+
+
+class _Recorder(NullHistorian):
+    def __init__(self):
+        self.rows = []
+        self.rollups = []
+
+    def record_batch(self, rows):
+        self.rows += rows
+
+    def record_rollups(self, tier, rows):
+        self.rollups += [(tier, r) for r in rows]
+
+
+def _manager(tmp_path, spec):
+    """The writer side of HistorianManager, without its threads."""
+    m = HistorianManager.__new__(HistorianManager)
+    m._lock = threading.Lock()
+    m._backend, m._backend_name = NullHistorian(), "null"
+    m._spool = Spool(tmp_path / "spool")
+    m._replay_at = 0.0
+    m._rollups = Rollups(tiers=(60,))
+    m._coverage = Coverage(None, tiers=(60,), now=T0)
+    m._cache = HistoryCache()
+    m._compressors = {TAG: TagCompressor(TAG, spec)}
+    m._batch_hist = metrics.Histogram()
+    m.rows_written = m.rows_failed = m.rows_compressed = m.batches = 0
+    m.rollup_rows = m.rollup_failed = 0
+    return m
+
+
+def _open_bucket(m):
+    (_, start, vmin, vmax, vsum, count, _, _), = m._rollups.flush_all()[60]
+    return start, vmin, vmax, vsum, count
+
+
+def test_diag_tags_are_not_archived():
+    rows = []
+    mgr = SimpleNamespace(record_batch=rows.extend)
+    HistorianManager.handle_tag_entries(mgr, {
+        "tic1.pid.pv": (21.5, 1000.0, "good", 7),
+        "diag.io1.rtt_ms": (0.4, 1000.0, "good", 7),
+    })
+    assert rows == [("tic1.pid.pv", 21.5, "good", 1000.0)]
+
+
+def test_spooled_rows_keep_raw_rollups(tmp_path):
+    m = _manager(tmp_path, CompressionSpec(deadband=1.0))
+    batch = [(TAG, 20.0 + 0.1 * i, "good", T0 + i) for i in range(10)]
+
+    # Outage: compressed rows go to the spool, rollups get every sample
+    m._write(batch)
+    assert 0 < m._spool.pending_rows() < len(batch)
+
+    backend = m._backend = _Recorder()
+    m._backend_name = "sqlite"
+    m._replay()
+    assert backend.rows and not m._spool.pending_rows()
+
+    start, vmin, vmax, vsum, count = _open_bucket(m)
+    assert (start, count) == (T0, 10)
+    assert (vmin, vmax) == (20.0, pytest.approx(20.9))
+    assert vsum == pytest.approx(sum(r[1] for r in batch))
+
+
+def test_rollups_closed_during_outage_are_not_covered(tmp_path):
+    m = _manager(tmp_path, CompressionSpec())
+    m._write([(TAG, 1.0, "good", T0 + 1), (TAG, 2.0, "good", T0 + 61)])
+    assert m.rollup_failed == 1
+    assert m._coverage.ranges(60) == []
+
+
+def test_held_points_flushed_on_stop_are_not_counted_twice(tmp_path):
+    m = _manager(tmp_path, CompressionSpec(compression=0.5))
+    m._backend, m._backend_name = _Recorder(), "sqlite"
+    m._write([(TAG, 20.0 + 0.01 * i, "good", T0 + i) for i in range(5)])
+
+    held = []
+    m._compressors[TAG].flush(held)
+    assert held
+    m._write(held, live=False)
+
+    assert _open_bucket(m)[4] == 5
+    assert m._backend.rows[-1] == held[-1]
@@ -0,0 +1,76 @@
+# tests/test_historian_compress.py
+import numpy as np
+import pytest
+
+from tags.historian_compress import CompressionSpec, TagCompressor
+
+TAG = "tic1.pid.pv"
+
+
+def _run(spec, samples, flush=True):
+    comp = TagCompressor(TAG, spec)
+    out = []
+    for row in samples:
+        comp.feed(row, out)
+    if flush:
+        comp.flush(out)
+    return out
+
+
+def _rows(values, quality="good"):
+    return [(TAG, float(v), quality, float(t)) for t, v in enumerate(values)]
+
+
+def test_spec_parse():
+    spec = CompressionSpec.parse({"deadband": "0.5%", "compression": 0.2, "max_interval": 600})
+    assert spec == CompressionSpec(0.005, True, 0.2, False, 600.0)
+    with pytest.raises(ValueError):
+        CompressionSpec.parse({"dead_band": 1})
+
+
+def test_deadband_keeps_the_sample_before_a_step():
+    samples = _rows([20.0, 20.01, 20.02, 20.03, 25.0, 25.01])
+    out = _run(CompressionSpec(deadband=0.1), samples, flush=False)
+    assert out == [samples[0], samples[3], samples[4]]
+
+
+def test_percent_deadband_scales_with_the_value():
+    spec = CompressionSpec(deadband=0.005, deadband_pct=True)
+    assert len(_run(spec, _rows([1000.0, 1004.0]), flush=False)) == 1
+    assert len(_run(spec, _rows([10.0, 10.1]), flush=False)) == 2
+
+
+def test_swinging_door_stores_the_corners_only():
+    values = [0.1 * t for t in range(50)] + [4.9 - 0.2 * t for t in range(1, 50)]
+    samples = _rows(values)
+    out = _run(CompressionSpec(compression=0.05), samples)
+    assert [r[3] for r in out] == [0.0, 49.0, 98.0]
+
+
+def test_swinging_door_stays_within_the_deviation():
+    rng = np.random.default_rng(1)
+    values = np.cumsum(rng.normal(0, 0.3, 500))
+    samples = _rows(values)
+    out = _run(CompressionSpec(compression=0.5), samples)
+    assert len(out) < len(samples) / 3
+
+    t = np.array([r[3] for r in out])
+    v = np.array([r[1] for r in out])
+    assert np.abs(np.interp(np.arange(len(values)), t, v) - values).max() <= 0.5 + 1e-9
+
+
+def test_quality_change_is_always_archived():
+    samples = _rows([20.0, 20.0]) + [(TAG, 20.0, "bad", 2.0), (TAG, 20.0, "good", 3.0)]
+    out = _run(CompressionSpec(deadband=1.0, compression=1.0), samples, flush=False)
+    assert out[-2:] == samples[-2:]
+
+
+def test_max_interval_forces_a_point():
+    samples = [(TAG, 20.0, "good", float(t)) for t in range(0, 1300, 10)]
+    out = _run(CompressionSpec(deadband=1.0, max_interval=600), samples, flush=False)
+    assert [r[3] for r in out] == [0.0, 600.0, 1200.0]
+
+
+def test_non_numeric_values_are_archived():
+    samples = [(TAG, "on", "good", 0.0), (TAG, "on", "good", 1.0)]
+    assert _run(CompressionSpec(deadband=1.0), samples) == samples
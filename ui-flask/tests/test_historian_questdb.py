@@ -0,0 +1,77 @@
+# tests/test_historian_questdb.py
+import pytest
+
+pytest.importorskip("questdb.ingress")
+
+from tags import historian_questdb  # noqa: E402
+from tags.historian_questdb import QuestDBHistorian  # noqa: E402
+
+HEADER = '"tag","value","min","max","timestamp"'
+
+
+def _row(i):
+    return f'"tic1.pid.pv",{i}.5,{i},{i + 1},2024-05-01T08:00:{i:02d}.000000Z'
+
+
+class _Response:
+    """Streamed /exp reply; `sent` counts the lines handed out so far."""
+    encoding = None
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.sent = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            self.sent += 1
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+@pytest.fixture
+def historian(monkeypatch):
+    h = QuestDBHistorian(ingest=False)
+    h.requests = []
+
+    def get(url, params, timeout, stream=False):
+        assert stream
+        h.requests.append(params["query"])
+        return h.response
+
+    monkeypatch.setattr(h._http, "get", get)
+    yield h
+    h.close()
+
+
+def test_query_rows_and_nulls(historian):
+    historian.response = _Response([HEADER, _row(1), '"b\'x",,null,3,2024-05-01T08:00:10.000000Z'])
+    rows = historian.query(["tic1.pid.pv", "b'x"], 0, 10_000, 10)
+    assert rows[0] == {
+        "timestamp": "2024-05-01T08:00:01.000000Z", "tag": "tic1.pid.pv",
+        "value": 1.5, "min": 1.0, "max": 2.0, "quality": None,
+    }
+    assert rows[1]["value"] is None and rows[1]["min"] is None and rows[1]["max"] == 3.0
+    # Tag names are bound as escaped string literals
+    assert "IN ('tic1.pid.pv','b''x')" in historian.requests[0]
+    assert historian.response.closed
+
+
+def test_iter_query_streams(historian, monkeypatch):
+    monkeypatch.setattr(historian_questdb, "QUERY_CHUNK_ROWS", 2)
+    historian.response = _Response([HEADER] + [_row(i) for i in range(10)])
+
+    samples = historian.iter_query(["tic1.pid.pv"], 0, 10_000, 1)
+    assert next(samples) == (1714550400000, "tic1.pid.pv", 0.5)
+    # Header plus the first chunk, not the whole reply
+    assert historian.response.sent == 3
+    assert len(list(samples)) == 9
+    assert historian.response.closed
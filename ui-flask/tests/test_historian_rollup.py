@@ -0,0 +1,132 @@
+# tests/test_historian_rollup.py
+import threading
+
+import pytest
+
+from tags.historian import HistorianManager
+from tags.historian_rollup import Coverage, Rollups
+from tags.historian_sqlite import SQLiteHistorian
+
+T0 = 1_714_550_400.0        # hour boundary
+TAG = "tic1.pid.pv"
+
+
+def _samples(start, end, step=5.0, bad_every=0):
+    rows = []
+    i = 0
+    t = start
+    while t < end:
+        bad = bad_every and i % bad_every == 0
+        rows.append((TAG, 1000.0 if bad else 20.0 + (i % 7), "bad" if bad else "good", t))
+        t += step
+        i += 1
+    return rows
+
+
+class _FailingRollups:
+    """Backend whose rollup writes fail for buckets in [lo, hi)."""
+
+    def __init__(self, backend, lo, hi):
+        self._backend, self.lo, self.hi = backend, lo, hi
+
+    def record_rollups(self, tier, rows):
+        if any(self.lo <= r[1] < self.hi for r in rows):
+            raise OSError("disk full")
+        self._backend.record_rollups(tier, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+@pytest.fixture
+def db(tmp_path):
+    backend = SQLiteHistorian(tmp_path / "h.sqlite")
+    yield backend
+    backend.close()
+
+
+def _manager(backend, coverage):
+    """The query / rollup side of HistorianManager, without its threads."""
+    m = HistorianManager.__new__(HistorianManager)
+    m._lock = threading.Lock()
+    m._backend = backend
+    m._backend_name = "sqlite"
+    m._rollups = Rollups()
+    m._coverage = coverage
+    m.rollup_rows = m.rollup_failed = 0
+    return m
+
+
+def _write(m, rows):
+    """What the writer thread does with a batch."""
+    m._backend.record_batch(rows)
+    m._write_rollups(m._rollups.add(rows))
+
+
+def _assert_same(rows, expected):
+    assert [(r["timestamp"], r["tag"]) for r in rows] == [(r["timestamp"], r["tag"]) for r in expected]
+    for a, b in zip(rows, expected):
+        assert a["value"] == pytest.approx(b["value"])
+        assert (a["min"], a["max"]) == (b["min"], b["max"])
+
+
+def _ms(t):
+    return int(t * 1000)
+
+
+def test_history_before_rollups_is_read_raw(db, tmp_path):
+    # Recorded by an older version: raw samples, no rollups
+    db.record_batch(_samples(T0 - 7200, T0))
+
+    m = _manager(db, Coverage(tmp_path / "cov.json", now=T0))
+    _write(m, _samples(T0, T0 + 600))
+    m._close_rollups(T0 + 600)
+
+    rows = m._query([TAG], _ms(T0 - 7200), _ms(T0 + 599), 60)
+    assert len(rows) == 130
+    _assert_same(rows, db.query([TAG], _ms(T0 - 7200), _ms(T0 + 599), 60))
+
+
+def test_covered_range_is_read_from_rollups(db, tmp_path):
+    m = _manager(db, Coverage(tmp_path / "cov.json", now=T0 - 1))
+    _write(m, _samples(T0, T0 + 3600, bad_every=5))
+    m._close_rollups(T0 + 3600 + 10)
+
+    _, plan = m._plan(_ms(T0), _ms(T0 + 3599), 60)
+    assert plan == [(60, _ms(T0), _ms(T0 + 3599))]
+    # Bad-quality samples are left out on both paths
+    rows = m._query([TAG], _ms(T0), _ms(T0 + 3599), 60)
+    assert max(r["max"] for r in rows) < 1000.0
+    _assert_same(rows, db.query([TAG], _ms(T0), _ms(T0 + 3599), 60))
+
+
+def test_failed_rollup_write_falls_back_to_raw(db, tmp_path):
+    m = _manager(_FailingRollups(db, T0 + 600, T0 + 1200), Coverage(tmp_path / "cov.json", now=T0 - 1))
+    _write(m, _samples(T0, T0 + 3600))
+    m._close_rollups(T0 + 3600 + 10)
+    assert m.rollup_failed
+
+    rows = m._query([TAG], _ms(T0), _ms(T0 + 3599), 60)
+    assert len(rows) == 60
+    _assert_same(rows, db.query([TAG], _ms(T0), _ms(T0 + 3599), 60))
+
+
+def test_crash_gap_is_not_covered(tmp_path):
+    path = tmp_path / "cov.json"
+    first = Coverage(path, tiers=(60,), now=T0 - 1)
+    first.extend(60, T0 + 600)
+    # Crash: the buckets open at T0 + 600 .. restart are lost
+
+    second = Coverage(path, tiers=(60,), now=T0 + 1830)
+    assert second.ranges(60) == [(T0, T0 + 600)]
+    second.extend(60, T0 + 3600)
+    assert second.ranges(60) == [(T0, T0 + 600), (T0 + 1860, T0 + 3600)]
+
+
+def test_remove_splits_the_live_range(tmp_path):
+    cov = Coverage(None, tiers=(10,), now=T0)
+    cov.extend(10, T0 + 100)
+    cov.remove(10, T0 + 40, T0 + 50)
+    assert cov.ranges(10) == [(T0, T0 + 40)]
+    cov.extend(10, T0 + 120)
+    assert cov.ranges(10) == [(T0, T0 + 40), (T0 + 50, T0 + 120)]
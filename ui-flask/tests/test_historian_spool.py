@@ -0,0 +1,85 @@
+# tests/test_historian_spool.py
+import pytest
+
+from tags import historian_spool
+from tags.historian_spool import Spool
+from tags.historian_compress import CompressionSpec
+from tests.test_historian import T0, TAG, _manager, _Recorder
+
+ROWS = [(TAG, 20.0 + i, "good" if i % 3 else "bad", T0 + i) for i in range(10)]
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(tmp_path)
+    yield spool
+    spool.close()
+
+
+def test_rows_come_back_in_order(spool):
+    spool.append(ROWS)
+    assert spool.pending_rows() == 10
+    assert spool.read(4) == ROWS[:4]
+    spool.commit()
+    assert spool.read(100) == ROWS[4:]
+    spool.commit()
+    assert spool.pending_rows() == 0 and spool.rows_replayed == 10
+
+
+def test_uncommitted_read_is_read_again(spool):
+    spool.append(ROWS)
+    spool.read(5)
+    assert spool.read(5) == ROWS[:5]
+    assert spool.pending_rows() == 10
+
+
+def test_rows_survive_a_restart(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(ROWS)
+    spool.read(3)
+    spool.commit()
+    spool.close()
+
+    spool = Spool(tmp_path)
+    assert spool.pending_rows() == 7
+    assert spool.read(100) == ROWS[3:]
+    spool.close()
+
+
+def test_size_cap_drops_the_oldest_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(historian_spool, "SEGMENT_BYTES", 1024)
+    spool = Spool(tmp_path, max_bytes=2048)
+    spool.append(ROWS * 10)
+
+    assert spool.rows_dropped > 0
+    assert len(list(tmp_path.glob("*.seg"))) == 2
+    assert spool.pending_rows() == 100 - spool.rows_dropped
+    # What is left is the newest rows
+    rows = []
+    while chunk := spool.read(1000):
+        rows += chunk
+        spool.commit()
+    assert rows == (ROWS * 10)[-len(rows):]
+    spool.close()
+
+
+class _Down(_Recorder):
+    def record_batch(self, rows):
+        raise ConnectionError("refused")
+
+
+def test_failed_batch_is_replayed(tmp_path):
+    m = _manager(tmp_path, CompressionSpec())
+    m._backend, m._backend_name = _Down(), "questdb"
+    m._write(ROWS)
+    assert m._spool.pending_rows() == 10 and m.rows_failed == 0
+
+    # Backend still down: the rows stay spooled
+    m._replay()
+    assert m._spool.pending_rows() == 10
+
+    backend = m._backend = _Recorder()
+    m._replay()
+    assert backend.rows == ROWS
+    assert m._spool.pending_rows() == 0
+    m._spool.close()
@@ -0,0 +1,61 @@
+# tests/test_historian_sqlite.py
+import pytest
+
+from tags.historian_sqlite import SQLiteHistorian
+
+T0 = 1_714_550_400.0
+T0_MS = int(T0 * 1000)
+
+
+@pytest.fixture
+def db(tmp_path):
+    backend = SQLiteHistorian(tmp_path / "h.sqlite")
+    yield backend
+    backend.close()
+
+
+def test_raw_samples_round_trip(db):
+    db.record_batch([("a", 1.0, "good", T0), ("b", 2.0, "bad", T0 + 1), ("a", 3.0, "good", T0 + 2)])
+    # Same (tag, ts): the later sample replaces the earlier one
+    db.record_batch([("a", 4.0, "good", T0 + 2)])
+
+    assert list(db.query_history(["a", "b"], start_ts=T0_MS - 1, end_ts=T0_MS + 5000)) == [
+        (T0_MS, "a", 1.0, "good"),
+        (T0_MS + 1000, "b", 2.0, "bad"),
+        (T0_MS + 2000, "a", 4.0, "good"),
+    ]
+    assert list(db.query_history(["a"], after_ts=T0_MS, limit=1)) == [(T0_MS + 2000, "a", 4.0, "good")]
+
+
+def test_buckets_average_good_samples(db):
+    db.record_batch([("a", float(i), "good", T0 + i) for i in range(20)])
+    db.record_batch([("a", 1000.0, "bad", T0 + 5.5)])
+
+    rows = db.query(["a"], T0_MS, T0_MS + 19_999, 10)
+    assert [(r["timestamp"], r["value"], r["min"], r["max"]) for r in rows] == [
+        ("2024-05-01T08:00:00.000Z", 4.5, 0.0, 9.0),
+        ("2024-05-01T08:00:10.000Z", 14.5, 10.0, 19.0),
+    ]
+    assert list(db.iter_query(["a"], T0_MS, T0_MS + 19_999, 10)) == [
+        (T0_MS, "a", 4.5), (T0_MS + 10_000, "a", 14.5),
+    ]
+
+
+def test_partial_rollups_are_merged(db):
+    db.record_rollups(10, [("a", T0, 1.0, 5.0, 6.0, 2, 5.0, T0 + 4)])
+    db.record_rollups(10, [("a", T0, 0.0, 3.0, 3.0, 2, 3.0, T0 + 2)])
+
+    row, = db.query_rollup(10, ["a"], T0_MS, T0_MS + 9_999, 10)
+    assert (row["value"], row["min"], row["max"]) == (2.25, 0.0, 5.0)
+
+
+def test_failed_batch_rolls_back_new_tag_names(db, tmp_path):
+    with pytest.raises(ValueError):
+        db.record_batch([("new", "not a number", "good", T0)])
+    assert "new" not in db._ids
+
+    db.record_batch([("new", 1.0, "good", T0)])
+    db.close()
+    reopened = SQLiteHistorian(tmp_path / "h.sqlite")
+    assert list(reopened.query_history(["new"], after_ts=0)) == [(T0_MS, "new", 1.0, "good")]
+    reopened.close()
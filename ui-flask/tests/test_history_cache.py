@@ -0,0 +1,127 @@
+# tests/test_history_cache.py
+import time
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from tags import history_cache
+from tags.history_cache import BLOCK_POINTS, HistoryCache
+from web import routes
+
+TAGS = ["tic1.pid.pv", "tic1.sp"]
+INTERVAL = 10
+BLOCK_MS = BLOCK_POINTS * INTERVAL * 1000
+START_MS = 1_714_550_400_000 - 1_714_550_400_000 % BLOCK_MS
+
+
+class _Backend:
+    """fetch() with one row per tag and interval; records its calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, tags, start_ms, end_ms, interval):
+        self.calls.append((tuple(tags), start_ms, end_ms))
+        step = interval * 1000
+        ts = np.arange(start_ms - start_ms % step, end_ms + 1, step)
+        iso = np.datetime_as_string(ts.astype("datetime64[ms]"), unit="ms")
+        return [
+            {"timestamp": f"{s}Z", "tag": tag, "value": float(t % 1000), "min": None, "max": None, "quality": None}
+            for t, s in zip(ts.tolist(), iso) for tag in tags
+        ]
+
+
+def test_cold_query_is_one_fetch_then_cached():
+    fetch = _Backend()
+    cache = HistoryCache()
+    end = START_MS + 40 * BLOCK_MS - 1
+    rows = cache.query(fetch, TAGS, START_MS, end, INTERVAL)
+
+    assert fetch.calls == [(tuple(sorted(TAGS)), START_MS, end)]
+    assert len(rows) == 2 * 40 * BLOCK_POINTS
+    assert [r["timestamp"] for r in rows] == sorted(r["timestamp"] for r in rows)
+
+    assert cache.query(fetch, TAGS, START_MS + 5, end - 5, INTERVAL) == [
+        r for r in rows if START_MS <= _ms(r) <= end - 5
+    ]
+    assert len(fetch.calls) == 1 and cache.misses == 80
+
+
+def test_only_missing_blocks_and_tags_are_fetched():
+    fetch = _Backend()
+    cache = HistoryCache()
+    cache.query(fetch, TAGS[:1], START_MS + BLOCK_MS, START_MS + 2 * BLOCK_MS - 1, INTERVAL)
+    fetch.calls.clear()
+
+    cache.query(fetch, TAGS, START_MS, START_MS + 3 * BLOCK_MS - 1, INTERVAL)
+    # Block 1 only lacks tic1.sp: still one run over all three blocks
+    assert fetch.calls == [(tuple(sorted(TAGS)), START_MS, START_MS + 3 * BLOCK_MS - 1)]
+    fetch.calls.clear()
+    cache.query(fetch, TAGS, START_MS, START_MS + 3 * BLOCK_MS - 1, INTERVAL)
+    assert fetch.calls == []
+
+
+def test_live_edge_is_never_cached():
+    fetch = _Backend()
+    cache = HistoryCache()
+    now_ms = int(time.time() * 1000)
+    for _ in range(2):
+        cache.query(fetch, TAGS, now_ms - 1000, now_ms, 1)
+    assert len(fetch.calls) == 2 and cache.rows == 0
+
+
+def test_lru_eviction():
+    fetch = _Backend()
+    cache = HistoryCache(max_rows=3 * (BLOCK_POINTS + 1))
+    cache.query(fetch, TAGS[:1], START_MS, START_MS + 4 * BLOCK_MS - 1, INTERVAL)
+    assert cache.evictions == 1 and cache.rows <= cache.max_rows
+
+    fetch.calls.clear()
+    cache.query(fetch, TAGS[:1], START_MS + BLOCK_MS, START_MS + 4 * BLOCK_MS - 1, INTERVAL)
+    assert fetch.calls == []
+
+
+def test_invalidate_refetches_the_block():
+    fetch = _Backend()
+    cache = HistoryCache()
+    cache.query(fetch, TAGS, START_MS, START_MS + 2 * BLOCK_MS - 1, INTERVAL)
+    cache.invalidate(START_MS / 1000 + 5, START_MS / 1000 + 5)
+    fetch.calls.clear()
+    cache.query(fetch, TAGS, START_MS, START_MS + 2 * BLOCK_MS - 1, INTERVAL)
+    assert fetch.calls == [(tuple(sorted(TAGS)), START_MS, START_MS + BLOCK_MS - 1)]
+
+
+def test_late_archived_row_invalidates_sealed_block():
+    fetch = _Backend()
+    cache = HistoryCache()
+    cache.query(fetch, TAGS, START_MS, START_MS + 2 * BLOCK_MS - 1, INTERVAL)
+
+    cache.archived([time.time()])
+    assert cache.rows == 2 * 2 * (BLOCK_POINTS + 1)
+    # A held point archived minutes later, with its own timestamp
+    cache.archived([time.time(), START_MS / 1000 + BLOCK_MS / 1000 + 5])
+    fetch.calls.clear()
+    cache.query(fetch, TAGS, START_MS, START_MS + 2 * BLOCK_MS - 1, INTERVAL)
+    assert fetch.calls == [(tuple(sorted(TAGS)), START_MS + BLOCK_MS, START_MS + 2 * BLOCK_MS - 1)]
+
+
+@pytest.mark.parametrize("interval", [0, -1])
+def test_bad_interval_is_rejected(interval):
+    fetch = _Backend()
+    with pytest.raises(ValueError):
+        HistoryCache().query(fetch, TAGS, START_MS, START_MS + BLOCK_MS, interval)
+    assert fetch.calls == []
+
+
+@pytest.mark.parametrize("interval", ["0", "-1", "x"])
+def test_history_route_rejects_bad_interval(monkeypatch, interval):
+    monkeypatch.setattr(routes, "get_historian", lambda: pytest.fail("queried"))
+    app = Flask(__name__)
+    routes.register_routes(app)
+    resp = app.test_client().get(f"/api/history?tags=tic1.sp&start={START_MS}&end={START_MS + 1000}&interval={interval}")
+    assert resp.status_code == 400
+
+
+def _ms(row):
+    return int(history_cache.epoch_seconds([row["timestamp"]])[0] * 1000)
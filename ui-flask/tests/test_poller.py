@@ -0,0 +1,79 @@
+# tests/test_poller.py
+import time
+
+from tags.poller import MAX_RETRIES, Poller
+
+
+class FakeUsb:
+    """Link that accepts every frame and never answers."""
+    port = "fake"
+
+    def __init__(self):
+        self.connected = True
+        self.sent = []
+
+    def send(self, frame):
+        if not self.connected:
+            return False
+        self.sent.append(frame)
+        return True
+
+    def read(self, n=512, timeout=None):
+        time.sleep(min(timeout or 0.0, 0.001))
+        return b""
+
+
+def test_lost_time_is_measured_wall_time():
+    poller = Poller(FakeUsb(), crc=None)
+    poller.response_timeout = 0.01
+    t0 = time.perf_counter()
+    assert poller._send_and_recv(poller._build_frame(1, 2)) is None
+    elapsed = time.perf_counter() - t0
+
+    stats = poller.stats
+    assert stats.retries == MAX_RETRIES - 1 and stats.timeouts == 1
+    assert MAX_RETRIES * 0.01 <= stats.lost_s <= elapsed
+
+
+def test_cancelled_write_is_not_sent():
+    usb = FakeUsb()
+    poller = Poller(usb, crc=None)
+    fut = poller.enqueue_write(1, 0x10, b"\x01")
+    assert fut.cancel()
+    poller._do_write(*poller.write_queue.popleft())
+    assert usb.sent == []
+    assert fut.cancelled()
+
+
+def test_pending_writes_fail_when_link_drops():
+    usb = FakeUsb()
+    usb.connected = False
+    usb.ensure_connected = lambda: False
+    poller = Poller(usb, crc=None)
+    usb.wait_for_retry = lambda max_wait: poller.stop()
+
+    pending = poller.enqueue_write(1, 0x10, b"\x01")
+    cancelled = poller.enqueue_write(1, 0x10, b"\x02")
+    cancelled.cancel()
+    poller.run()
+
+    assert not poller.write_queue
+    assert isinstance(pending.exception(timeout=0), ConnectionError)
+    assert cancelled.cancelled()
+    assert usb.sent == []
+
+
+def test_link_down_is_published(monkeypatch):
+    published = []
+    monkeypatch.setattr("tags.poller.update_tags", lambda values, ts=None: published.append(values))
+    usb = FakeUsb()
+    usb.ensure_connected = lambda: False
+    poller = Poller(usb, crc=None)
+    poller._link_up = True
+    monkeypatch.setattr(poller, "_mark_device_tags_bad", lambda: None)
+    usb.wait_for_retry = lambda max_wait: poller.stop()
+
+    poller.run()
+
+    assert published and published[-1]["diag.usb.link_up"] == 0
+    assert usb.sent == []
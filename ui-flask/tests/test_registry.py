@@ -0,0 +1,10 @@
+# tests/test_registry.py
+from tags.registry import GroupDecoder, group_tags
+
+
+def test_group_decoder_accepts_a_generator():
+    tags = group_tags(1, 1)
+    payload = bytes(range(256))
+    expected = GroupDecoder(list(tags)).decode(payload)
+    assert expected
+    assert GroupDecoder(t for t in tags).decode(payload) == expected
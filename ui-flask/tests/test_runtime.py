@@ -0,0 +1,132 @@
+# tests/test_runtime.py
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask, request
+
+from tags import runtime
+from tags.poller import Poller
+from tests.test_poller import FakeUsb
+
+
+def test_timed_out_write_is_cancelled(monkeypatch):
+    usb = FakeUsb()
+    poller = Poller(usb, crc=None)
+    monkeypatch.setattr(runtime, "_poller", poller)
+    monkeypatch.setattr(runtime, "WRITE_TIMEOUT_S", 0.01)
+
+    ack = runtime.TagNamespace(runtime.NAMESPACE).on_tag_write({"tag": "tic1.sp", "value": 50.0})
+    assert ack["status"] == "error"
+
+    # The poller reaches the queue only now, e.g. after a reconnect
+    poller._do_write(*poller.write_queue.popleft())
+    assert usb.sent == []
+
+
+def test_write_timeout_after_send_is_reported_unknown(monkeypatch):
+    poller = Poller(FakeUsb(), crc=None)
+    monkeypatch.setattr(runtime, "_poller", poller)
+    monkeypatch.setattr(runtime, "WRITE_TIMEOUT_S", 0.01)
+
+    def sent(*args, **kwargs):
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        return fut
+
+    monkeypatch.setattr(poller, "enqueue_write", sent)
+    ack = runtime.TagNamespace(runtime.NAMESPACE).on_tag_write({"tag": "tic1.sp", "value": 50.0})
+    assert ack["status"] == "unknown"
+
+
+def test_invalid_write_value_is_an_error_ack(monkeypatch):
+    monkeypatch.setattr(runtime, "_poller", Poller(FakeUsb(), crc=None))
+    ack = runtime.TagNamespace(runtime.NAMESPACE).on_tag_write({"tag": "tic1.sp", "value": "fifty"})
+    assert ack["status"] == "error"
+
+
+class _Stop(Exception):
+    pass
+
+
+class _Historian:
+    def __init__(self):
+        self.tags = set()
+
+    def handle_tag_entries(self, changes):
+        self.tags |= set(changes)
+
+
+def test_emitter_does_not_sleep_through_late_updates(monkeypatch):
+    historian = _Historian()
+    monkeypatch.setattr(runtime, "get_historian", lambda: historian)
+    store = runtime.get_store()
+    store.update({"test.emitter.first": 1})
+
+    real = runtime.emit_tag_updates
+    calls = []
+    stop = threading.Event()
+
+    def emit(socketio):
+        if stop.is_set():
+            raise _Stop
+        delay = real(socketio)
+        if not calls:
+            # Lands after changes_since(), before the emitter waits again
+            store.update({"test.emitter.late": 1})
+        calls.append(delay)
+        return delay
+
+    def run():
+        try:
+            runtime.run_tag_emitter(None)
+        except _Stop:
+            pass
+
+    monkeypatch.setattr(runtime, "emit_tag_updates", emit)
+    emitter = threading.Thread(target=run, daemon=True)
+    emitter.start()
+
+    deadline = time.monotonic() + 1.0
+    while "test.emitter.late" not in historian.tags and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    stop.set()
+    store.update({"test.emitter.stop": 1})
+    emitter.join(1.0)
+    assert "test.emitter.late" in historian.tags
+
+
+@pytest.fixture
+def tag_client(monkeypatch):
+    monkeypatch.setattr(runtime, "_clients", {"sid-1": runtime.TagClient("sid-1")})
+    monkeypatch.setattr(runtime, "subscribe_tags", lambda tags: None)
+    with Flask(__name__).test_request_context():
+        request.sid = "sid-1"
+        yield runtime._clients["sid-1"]
+
+
+def _subscribe(msg):
+    return runtime.TagNamespace(runtime.NAMESPACE).on_subscribe(msg)
+
+
+@pytest.mark.parametrize("rate_ms", ["fast", None, [50], float("nan")])
+def test_subscribe_rejects_bad_rate(tag_client, rate_ms):
+    ack = _subscribe({"tags": ["tic1.sp"], "rate_ms": rate_ms})
+    assert ack["status"] == "error"
+    assert not tag_client.tags
+
+
+def test_subscribe_rate_clamped(tag_client):
+    assert _subscribe({"tags": ["tic1.sp"], "rate_ms": "5"})["status"] == "ok"
+    assert tag_client.rate_s == runtime.MIN_RATE_MS / 1000.0
+
+
+def test_packed_id_limit(tag_client, monkeypatch):
+    monkeypatch.setattr(runtime, "MAX_IDS", 3)
+    ack = _subscribe({"tags": ["a", "b", "c"], "format": "packed"})
+    assert ack["status"] == "ok" and sorted(ack["ids"].values()) == [0, 1, 2]
+    # Re-subscribing known tags needs no new ids
+    assert _subscribe({"tags": ["a", "b", "c"]})["status"] == "ok"
+    assert _subscribe({"tags": ["d"]})["status"] == "error"
@@ -0,0 +1,89 @@
+# tests/test_usb_comm.py
+import os
+import time
+
+import pytest
+
+from tags.usb_comm import READ_POLL, READ_TIMEOUT, UsbComm
+
+
+@pytest.fixture
+def pty_link():
+    master, slave = os.openpty()
+    usb = UsbComm(os.ttyname(slave), 115200)
+    assert usb.connected
+    yield usb, master
+    usb.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_read_returns_buffered_bytes(pty_link):
+    usb, master = pty_link
+    os.write(master, b"hello")
+    time.sleep(0.01)
+    assert usb.read(512, 0.01) == b"hello"
+
+
+def test_read_bounded_by_caller_timeout(pty_link):
+    usb, _ = pty_link
+    t0 = time.perf_counter()
+    assert usb.read(512, 0.002) == b""
+    assert time.perf_counter() - t0 < READ_TIMEOUT / 2
+
+
+class _FixedTimeout:
+    """The real port; reconfiguring its timeout fails the test."""
+
+    def __init__(self, ser):
+        object.__setattr__(self, "_ser", ser)
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+    def __setattr__(self, name, value):
+        raise AssertionError(f"read() set {name}")
+
+
+def test_read_never_reconfigures_the_port(pty_link):
+    usb, master = pty_link
+    assert usb.ser.timeout == READ_POLL
+    usb.ser = _FixedTimeout(usb.ser)
+    for timeout in (0.0, 0.001, 0.012, None):
+        t0 = time.perf_counter()
+        assert usb.read(512, timeout) == b""
+        assert time.perf_counter() - t0 < (READ_TIMEOUT if timeout is None else timeout) + READ_POLL
+    os.write(master, b"x")
+    assert usb.read(512, 0.05) == b"x"
+    usb.ser = usb.ser._ser
+
+
+class _Unplugged:
+    """Port whose device node is gone: ioctl / tcdrain fail with OSError."""
+    timeout = READ_TIMEOUT
+
+    @property
+    def in_waiting(self):
+        raise OSError(5, "Input/output error")
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        raise OSError(5, "Input/output error")
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("op", ["read", "send"])
+def test_unplug_takes_reconnect_path(pty_link, op):
+    usb, _ = pty_link
+    usb.ser.close()
+    usb.ser = _Unplugged()
+    if op == "read":
+        assert usb.read() == b""
+    else:
+        assert usb.send(b"x") is False
+    assert not usb.connected
+    assert usb.ser is None
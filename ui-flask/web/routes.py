@@ -1,4 +1,5 @@
-from flask import render_template, request, jsonify
+from flask import Response, render_template, request, jsonify
+import itertools
 import time
 import logging
 from flask import request, render_template
@@ -6,6 +7,7 @@ from user_agents import parse
 
 log = logging.getLogger(__name__)
 
+from tags import downsample, export, history_stream, metrics
 from tags.historian import get_historian
 
 
@@ -41,6 +43,11 @@ def register_routes(app):
         output = "Updated project...\n"
         return render_template("pages/maintenance.html", output=output)
 
+    @app.route("/metrics")
+    def metrics_endpoint():
+        # Prometheus text exposition (see tags/metrics.py)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/api/history", methods=["GET"])
     def api_history():
         tags_param = request.args.get("tags")
@@ -52,17 +59,48 @@ def register_routes(app):
         try:
             start_param = int(request.args.get("start")) #js Date
             end_param = int(request.args.get("end")) #js Date
-            interval = int(request.args.get("interval")) # seconds
+            # points=N: at most N rows per tag, downsampled with mode
+            points = request.args.get("points", type=int)
+            mode = request.args.get("mode", "minmax")
+            if points is not None and (points < 3 or mode not in downsample.MODES):
+                raise ValueError
+            # format: "rows" (default JSON) or a streamed columnar format
+            fmt = request.args.get("format", "rows")
+            if fmt != "rows" and fmt not in history_stream.STREAMS:
+                raise ValueError
+            if request.args.get("interval") is None and points:
+                interval = downsample.source_interval((end_param - start_param) / 1000, points)
+            else:
+                interval = int(request.args.get("interval")) # seconds
+            if interval < 1:
+                raise ValueError
             tags = [t.strip() for t in tags_param.split(",") if t.strip()]
 
-        except ValueError:
+        except (TypeError, ValueError):
             return jsonify({"error": "invalid query parameters"}), 400
 
         # ------------------------------------------------------------
         # Decide query mode
         # ------------------------------------------------------------
 
+        if fmt in history_stream.STREAMS:
+            if points:
+                rows = downsample.downsample_rows(
+                    get_historian().query_history(tags, start_param, end_param, interval), points, mode
+                )
+                ts = downsample.epoch_seconds([r["timestamp"] for r in rows]) * 1000
+                samples = [(int(t), r["tag"], r["value"]) for t, r in zip(ts.tolist(), rows)]
+            else:
+                # Straight from the backend cursor, never materialized
+                samples = get_historian().iter_query(tags, start_param, end_param, interval)
+            return Response(
+                history_stream.STREAMS[fmt](samples, tags),
+                mimetype=history_stream.MIMETYPES[fmt],
+            )
+
         rows = get_historian().query_history(tags, start_param, end_param, interval)
+        if points:
+            rows = downsample.downsample_rows(rows, points, mode)
 
         # ------------------------------------------------------------
         # ALWAYS return a response
@@ -71,3 +109,41 @@ def register_routes(app):
         return jsonify({
             "rows": rows
         })
+
+    @app.route("/api/export", methods=["GET"])
+    def api_export():
+        """
+        Columnar file download of tag history (see tags/export.py):
+        ?tags=a,b&start=<ms>&end=<ms>&interval=<s>&format=parquet|arrow|npz
+
+        Reads the backend directly (iter_query), so bulk exports neither
+        go through nor evict the chart cache.
+        """
+        historian = get_historian()
+        try:
+            tags = [t.strip() for t in request.args.get("tags", "").split(",") if t.strip()]
+            start_param = int(request.args.get("start"))
+            end_param = int(request.args.get("end"))
+            interval = int(request.args.get("interval", 10))
+            fmt = request.args.get("format") or export.default_format()
+            if not tags:
+                raise ValueError("tags are required")
+            body = export.export(historian.iter_query, tags, start_param, end_param, interval, fmt)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e) or "invalid query parameters"}), 400
+
+        if historian.backend_name == "null":
+            return jsonify({"error": "historian backend unavailable"}), 503
+        try:
+            # Run the first query before committing to a 200; a failure
+            # after that aborts the download instead of completing it
+            first = next(body, b"")
+        except Exception as e:
+            log.warning(f"[export] history query failed: {e}")
+            return jsonify({"error": "history query failed"}), 502
+
+        return Response(
+            itertools.chain([first], body),
+            mimetype=export.MIMETYPES[fmt],
+            headers={"Content-Disposition": f"attachment; filename=history.{fmt}"},
+        )